@@ -1,94 +1,120 @@
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import hmac
+import json
+import math
+import threading
+from datetime import datetime
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from app.core.schemas import ChatRequest, EndRequest, EndResponse
-from app.core.utils import new_id, now_ts
+from app.core import metrics
+from app.core.schemas import ChatRequest, EndRequest, EndResponse, HistoryItem, HistoryResponse
+from app.core.utils import new_id
+from app.services.batch import parse_jsonl, run_batch
+from app.services.chat_service import ChatError
 
 
-def make_router(*, memory, graph, settings, pg_store=None):
+def make_router(*, memory, chat_service, settings, pg_store=None):
     r = APIRouter()
 
     from fastapi.responses import JSONResponse
     @r.post("/chat", response_class=JSONResponse)
-    def chat(req: ChatRequest) -> JSONResponse:
+    def chat(req: ChatRequest, request: Request) -> JSONResponse:
         conversation_id = req.conversation_id or new_id()
-        request_id = req.request_id
-
-        cached = memory.get_cached_response(conversation_id, request_id)
-        if cached:
-            resp = {
-                "conversation_id": conversation_id,
-                "request_id": request_id,
-                "answer": cached.get("answer", ""),
-            }
-            # 每个字段单独一行输出
-            text = f"conversation_id: {resp['conversation_id']}\nrequest_id: {resp['request_id']}\nanswer: {resp['answer']}\n"
-            from fastapi.responses import PlainTextResponse
-            return PlainTextResponse(content=text)
-
-        # 幂等保护：同 request_id 并发只允许一个 inflight
-        if not memory.mark_inflight(conversation_id, request_id):
-            raise HTTPException(status_code=409, detail="Duplicate inflight request_id")
-
+        # 来源 IP 总有一个桶（反向代理后需 uvicorn --proxy-headers 才是真实 IP）；
+        # user_id 未经认证，用户桶按 user_id + IP 区分，伪造别人的 user_id 耗不到对方的桶
+        client_ip = request.client.host if request.client else "unknown"
+        client_key = f"{req.user_id}@{client_ip}" if req.user_id else f"ip:{client_ip}"
+        with metrics.inflight("chat"), metrics.request_context(
+            conversation_id=conversation_id, request_id=req.request_id
+        ), metrics.stage("chat"):
+            return _chat(req, conversation_id, client_key, client_ip)
+
+    def _chat(req: ChatRequest, conversation_id: str, client_key: str, client_ip: str):
         try:
-            # 这里确保 request_id 唯一；重复直接拒绝（或你也可以返回 cached）
-            if not memory.ensure_request_id_unique(conversation_id, request_id):
-                raise HTTPException(status_code=409, detail="Duplicate request_id")
-
-            history = memory.get_recent_messages(conversation_id, limit=20)
-
-            state_in: dict[str, Any] = {
-                "conversation_id": conversation_id,
-                "request_id": request_id,
-                "user_id": req.user_id,
-                "query": req.message,
-                "history": history,
-            }
-
-            out = graph.invoke(state_in)
-
-            answer = (out.get("answer") or "").strip()
-            route = out.get("route") or "NO_RAG"
-            citations = out.get("citations") or []
-
-            # 写入 Redis 历史（user+assistant）
-            memory.append_messages(
-                conversation_id,
-                [
-                    {
-                        "message_id": new_id(),
-                        "request_id": request_id,
-                        "role": "user",
-                        "content": req.message,
-                        "ts": now_ts(),
-                    },
-                    {
-                        "message_id": new_id(),
-                        "request_id": request_id,
-                        "answer_id": new_id(),
-                        "role": "assistant",
-                        "content": answer,
-                        "ts": now_ts(),
-                        "meta": {"citations": citations},
-                    },
-                ],
+            turn = chat_service.run_turn(
+                conversation_id=conversation_id,
+                request_id=req.request_id,
+                message=req.message,
+                user_id=req.user_id,
+                resume=bool(req.conversation_id),
+                client_key=client_key,
+                client_ip=client_ip,
+                rate_limit=True,
             )
-
-            resp = {
-                "conversation_id": conversation_id,
-                "request_id": request_id,
-                "answer": answer,
-            }
-            memory.cache_response(conversation_id, request_id, resp)
-            text = f"conversation_id: {resp['conversation_id']}\nrequest_id: {resp['request_id']}\nanswer: {resp['answer']}\n"
-            from fastapi.responses import PlainTextResponse
-            return PlainTextResponse(content=text)
-        finally:
-            memory.clear_inflight(conversation_id, request_id)
+        except ChatError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+
+        resp = turn.to_response()
+        # 每个字段单独一行输出
+        text = f"conversation_id: {resp['conversation_id']}\nrequest_id: {resp['request_id']}\nanswer: {resp['answer']}\n"
+        return PlainTextResponse(content=text)
+
+    @r.post("/chat/batch")
+    async def chat_batch(request: Request, concurrency: int = 8) -> StreamingResponse:
+        """请求体为 JSONL（每行一个 ChatRequest），按完成顺序流式返回 NDJSON 结果。"""
+        body = (await request.body()).decode("utf-8")
+        try:
+            items = list(parse_jsonl(body.splitlines()))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSONL: {e}")
+        if len(items) > settings.batch_max_items:
+            raise HTTPException(status_code=413, detail=f"Too many lines (max {settings.batch_max_items})")
+        concurrency = max(1, min(concurrency, settings.batch_max_concurrency))
+
+        # 批量里的每一条都计入来源 IP 的 batch 桶，超出时整批拒绝
+        client_ip = request.client.host if request.client else "unknown"
+        limiter = chat_service.rate_limiter
+        if limiter is not None and items:
+            decision = limiter.check_batch(client_ip, len(items))
+            if not decision.allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Too many batch items ({decision.scope})",
+                    headers={"Retry-After": str(max(1, math.ceil(decision.retry_after_seconds)))},
+                )
+
+        loop = asyncio.get_running_loop()
+        results: asyncio.Queue = asyncio.Queue()
+        sentinel = object()
+        cancel = threading.Event()
+
+        def put(rec: object) -> None:
+            if not cancel.is_set():
+                loop.call_soon_threadsafe(results.put_nowait, rec)
+
+        def worker() -> None:
+            try:
+                stats = run_batch(items, chat_service, concurrency=concurrency, on_result=put, cancel=cancel)
+                put({"status": "summary", **stats})
+            except Exception as e:
+                put({"status": "summary", "error": str(e)})
+            finally:
+                put(sentinel)
+
+        threading.Thread(target=worker, name="chat-batch", daemon=True).start()
+
+        async def stream():
+            # 客户端断开时（生成器被取消/关闭，或轮询发现断开）通知 worker 不再开始新的轮次
+            try:
+                while True:
+                    try:
+                        rec = await asyncio.wait_for(results.get(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        if await request.is_disconnected():
+                            return
+                        continue
+                    if rec is sentinel:
+                        return
+                    yield (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+            finally:
+                cancel.set()
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
 
     @r.post("/end", response_model=EndResponse)
     def end(req: EndRequest) -> EndResponse:
@@ -99,6 +125,12 @@ def make_router(*, memory, graph, settings, pg_store=None):
             raise HTTPException(status_code=500, detail="Missing POSTGRES_DSN/DATABASE_URL")
 
         conversation_id = str(req.conversation_id)
+        with metrics.inflight("end"), metrics.request_context(
+            conversation_id=conversation_id, request_id=""
+        ), metrics.stage("end"):
+            return _end(conversation_id)
+
+    def _end(conversation_id: str) -> EndResponse:
         msgs = memory.get_all_messages(conversation_id)
         try:
             pg_store.persist_chat_history_from_messages(
@@ -110,4 +142,46 @@ def make_router(*, memory, graph, settings, pg_store=None):
         memory.delete_conversation(conversation_id)
         return EndResponse(conversation_id=conversation_id, flushed_message_count=len(msgs))
 
+    def require_history_token(authorization: Optional[str] = Header(None)) -> None:
+        # 历史可按 user_id 任意查询，只对持有 HISTORY_API_TOKEN 的内部调用方开放；未配置时视为不存在
+        expected = settings.history_api_token
+        if not expected:
+            raise HTTPException(status_code=404, detail="Not Found")
+        token = (authorization or "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+            raise HTTPException(status_code=401, detail="Invalid history token", headers={"WWW-Authenticate": "Bearer"})
+
+    @r.get("/history", response_model=HistoryResponse, dependencies=[Depends(require_history_token)])
+    def history(
+        conversation_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        limit: int = Query(50, ge=1),
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> HistoryResponse:
+        """已结束（/end 落库）的对话历史，按时间倒序；用上一页的 next_cursor 继续翻页。"""
+        if pg_store is None:
+            raise HTTPException(status_code=500, detail="Postgres store not configured")
+        if not conversation_id and not user_id:
+            raise HTTPException(status_code=400, detail="conversation_id or user_id is required")
+
+        with metrics.inflight("history"), metrics.stage("history"):
+            try:
+                page = pg_store.page_history(
+                    conversation_id=conversation_id,
+                    user_id=user_id,
+                    limit=min(limit, settings.history_page_max),
+                    cursor=cursor,
+                    since=since,
+                    until=until,
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Read from Postgres failed: {e}")
+        return HistoryResponse(
+            items=[HistoryItem(**item) for item in page.items], next_cursor=page.next_cursor
+        )
+
     return r
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from app.api.routes import make_router
+from app.core import metrics
+from app.core.config import Settings
+from app.core.fair_queue import build_fair_queue
+from app.graphs.rag_graph import GraphDeps, build_graph
+from app.integrations.business_tools import build_tool_registry
+from app.integrations.redis_ratelimit import build_rate_limiter
+from app.integrations.redis_singleflight import SingleFlight
+from app.integrations.tiered_llm import TieredLLM
+from app.services.chat_service import ChatService
+from app.services.history_rehydrator import HistoryRehydrator
+from app.services.precomputed import PrecomputedAnswers
+
+
+def make_embed_fn(settings: Settings):
+    """embed_texts：配置了 INFERENCE_SOCKET 时走本机 sidecar，否则在本进程加载模型。"""
+    if settings.inference_socket:
+        # 同机 worker 共用 app.inference_server 里的模型，本进程不加载 torch
+        from app.integrations.inference_client import InferenceClient
+
+        return InferenceClient(settings.inference_socket, timeout=settings.inference_timeout_seconds).embed
+
+    from app.integrations.embedding import load_embedder, make_embed_texts
+
+    # 使用与建库脚本（app.jobs.ingest_kb）一致的 BAAI/bge-large-zh 作为 embedding_fn
+    return make_embed_texts(load_embedder())
+
+
+def create_backends(settings: Settings, *, embed_texts: Any = None) -> dict[str, Any]:
+    """构造真实的 Qwen/Milvus/Redis/Postgres 客户端，返回值可直接作为 assemble_app 的关键字参数。
+
+    embed_texts 为空时按 make_embed_fn 构造；离线任务需要自己用向量时传入同一个，避免重复加载模型。
+    """
+    from app.core.limiter import build_limiters
+    from app.integrations.milvus_retriever import DocCache, MilvusRetriever
+    from app.integrations.postgres_store import PostgresStore
+    from app.integrations.qwen_openai import QwenClient
+    from app.integrations.redis_memory import RedisMemory
+
+    if not settings.redis_url:
+        raise RuntimeError("Missing REDIS_URL")
+
+    if not settings.qwen_api_key:
+        raise RuntimeError("Missing QWEN_API_KEY (or DASHSCOPE_API_KEY)")
+
+    if not settings.milvus_uri or not settings.milvus_token:
+        raise RuntimeError("Missing MILVUS_URI/MILVUS_TOKEN")
+
+    limiters = build_limiters(settings)
+    qwen = QwenClient(
+        api_key=settings.qwen_api_key,
+        base_url=settings.qwen_base_url,
+        timeout=settings.qwen_timeout_seconds,
+        limiter=limiters.get("qwen"),
+    )
+    if embed_texts is None:
+        embed_texts = make_embed_fn(settings)
+    retriever = MilvusRetriever(
+        uri=settings.milvus_uri,
+        token=settings.milvus_token,
+        collection=settings.milvus_collection,
+        embed_fn=embed_texts,
+        top_k=settings.milvus_top_k,
+        timeout=settings.milvus_timeout_seconds,
+        embed_limiter=limiters.get("embed"),
+        search_limiter=limiters.get("milvus"),
+        two_phase=settings.milvus_two_phase,
+        doc_cache=DocCache(settings.milvus_doc_cache_size, settings.milvus_doc_cache_ttl_seconds),
+        filter=settings.milvus_filter,
+        partition_names=settings.milvus_partitions,
+        metric_type=settings.milvus_metric_type,
+        search_params=settings.milvus_search_params,
+    )
+
+    memory = RedisMemory.from_url(
+        settings.redis_url,
+        prefix=settings.redis_prefix,
+        ttl_seconds=settings.session_ttl_seconds,
+        cluster=settings.redis_cluster,
+        hash_tag=settings.redis_hash_tags,
+    )
+
+    pg_store = None
+    if settings.postgres_dsn:
+        pg_store = PostgresStore(settings.postgres_dsn)
+
+    return {
+        "qwen": qwen,
+        "retriever": retriever,
+        "memory": memory,
+        "pg_store": pg_store,
+        "limiters": limiters,
+    }
+
+
+def build_rag_graph(
+    *,
+    settings: Settings,
+    qwen: Any,
+    retriever: Any,
+    limiters: dict[str, Any] | None = None,
+    tools: Any = None,
+):
+    """编译对话图；ChatService 与离线任务（如 app.jobs.mine_faq）共用。"""
+    return build_graph(
+        GraphDeps(
+            router_mode=settings.router_mode,
+            retriever=retriever,
+            llm=TieredLLM(qwen, settings),
+            limiters=limiters or {},
+            degrade_router_at=settings.degrade_router_utilization,
+            tools=tools,
+        )
+    )
+
+
+def build_chat_service(
+    *,
+    settings: Settings,
+    qwen: Any,
+    retriever: Any,
+    memory: Any,
+    limiters: dict[str, Any] | None = None,
+    pg_store: Any = None,
+) -> ChatService:
+    """编译图并组装 ChatService；HTTP 服务与离线批量任务共用。"""
+    tools = build_tool_registry(settings, redis_client=memory.client)
+    graph = build_rag_graph(settings=settings, qwen=qwen, retriever=retriever, limiters=limiters, tools=tools)
+
+    singleflight = None
+    if settings.singleflight_enabled:
+        singleflight = SingleFlight(
+            memory.client,
+            prefix=settings.redis_prefix,
+            wait_timeout_seconds=settings.singleflight_wait_seconds,
+        )
+
+    rehydrator = None
+    if pg_store is not None and settings.history_rehydrate_turns > 0:
+        rehydrator = HistoryRehydrator(
+            memory=memory,
+            pg_store=pg_store,
+            # 与首轮问题的 single-flight 分开命名空间：key 是 conversation_id
+            singleflight=SingleFlight(memory.client, prefix=f"{settings.redis_prefix}:rehydrate"),
+            turns=settings.history_rehydrate_turns,
+            negative_ttl_seconds=settings.history_rehydrate_negative_ttl_seconds,
+            max_age_days=settings.history_rehydrate_max_age_days,
+        )
+
+    precomputed = None
+    if pg_store is not None and settings.faq_enabled:
+        precomputed = PrecomputedAnswers(
+            pg_store=pg_store,
+            fetch_texts=getattr(retriever, "fetch_texts", None),
+            refresh_seconds=settings.faq_refresh_seconds,
+        )
+        precomputed.refresh()
+    return ChatService(
+        memory=memory,
+        graph=graph,
+        singleflight=singleflight,
+        rehydrator=rehydrator,
+        precomputed=precomputed,
+        personal_query=tools.match if tools is not None else None,
+        rate_limiter=build_rate_limiter(settings, redis_client=memory.client),
+        fair_queue=build_fair_queue(settings),
+    )
+
+
+def assemble_app(
+    *,
+    settings: Settings,
+    qwen: Any,
+    retriever: Any,
+    memory: Any,
+    pg_store: Any = None,
+    limiters: dict[str, Any] | None = None,
+) -> FastAPI:
+    """把已构造好的客户端组装成 FastAPI 应用。
+
+    create_app 传入真实的 Qwen/Milvus/Redis/Postgres；压测（bench/）传入同接口的本地替身。
+    """
+    limiters = limiters or {}
+    chat_service = build_chat_service(
+        settings=settings,
+        qwen=qwen,
+        retriever=retriever,
+        memory=memory,
+        limiters=limiters,
+        pg_store=pg_store,
+    )
+
+    @asynccontextmanager
+    async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+        # 同步路由跑在 AnyIO 线程池（默认 40 个线程）里，公平队列的排队者也占着线程：
+        # 线程池要盖住 执行中 + 排队上限，再给 /end、/limits 等留余量，排序才发生在公平队列里
+        if chat_service.fair_queue is not None:
+            import anyio.to_thread
+
+            limiter = anyio.to_thread.current_default_thread_limiter()
+            limiter.total_tokens = max(limiter.total_tokens, chat_service.fair_queue.capacity + 16)
+        yield
+
+    app = FastAPI(title="AI Agent (LangGraph + RAG)", lifespan=lifespan)
+    app.include_router(
+        make_router(memory=memory, chat_service=chat_service, settings=settings, pg_store=pg_store)
+    )
+
+    @app.get("/health")
+    def health():
+        return {"ok": True, "env": settings.app_env}
+
+    @app.get("/limits")
+    def limits():
+        out = {name: lim.snapshot() for name, lim in limiters.items()}
+        if chat_service.fair_queue is not None:
+            out["fair_queue"] = chat_service.fair_queue.snapshot()
+        return out
+
+    @app.get("/metrics")
+    def prometheus_metrics():
+        return PlainTextResponse(
+            metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+    return app
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import json
 import os
 from dataclasses import dataclass
+from typing import Any
 
 
 @dataclass(frozen=True)
@@ -11,21 +13,94 @@ class Settings:
     redis_url: str
     redis_prefix: str
     session_ttl_seconds: int
+    redis_cluster: bool
+    redis_hash_tags: bool
 
     milvus_uri: str
     milvus_token: str
     milvus_collection: str
     milvus_top_k: int
+    milvus_two_phase: bool
+    milvus_doc_cache_size: int
+    milvus_doc_cache_ttl_seconds: int
+    milvus_filter: str
+    milvus_partitions: list[str]
+    # 检索/建索引参数；为空时沿用集合上已有索引的默认值
+    milvus_metric_type: str
+    milvus_search_params: dict[str, Any]
+    milvus_index_type: str
+    milvus_index_params: dict[str, Any]
 
     qwen_api_key: str
     qwen_base_url: str
     qwen_chat_model: str
     qwen_embed_model: str
+    # 按用途分层的模型；为空时回退到 qwen_chat_model（大模型）
+    qwen_route_model: str
+    qwen_followup_model: str
+    qwen_tool_model: str
+    qwen_answer_model: str
+    qwen_escalate_max_tool_calls: int
 
     postgres_dsn: str
+    pg_partition_months_ahead: int
+    pg_retention_months: int  # 0 表示不删除历史分区
+    history_api_token: str  # 为空时不开放 /history；否则请求须带 Authorization: Bearer <token>
+    history_page_max: int
+    history_rehydrate_turns: int  # 0 表示关闭回源
+    history_rehydrate_negative_ttl_seconds: int
+    history_rehydrate_max_age_days: int  # 0 表示不限
 
     router_mode: str  # heuristic|llm
 
+    otel_enabled: bool
+
+    singleflight_enabled: bool
+    singleflight_wait_seconds: int
+
+    faq_enabled: bool
+    faq_refresh_seconds: int
+
+    tools_backend: str  # 业务查询工具后端：mock；为空时 TOOL 路由沿用 node_answer
+    tool_timeout_seconds: float
+    tool_cache_ttl_seconds: int
+
+    inference_socket: str  # 非空时 embedding 走本机推理 sidecar
+    inference_timeout_seconds: float
+
+    qwen_timeout_seconds: float
+    milvus_timeout_seconds: float
+    limiter_enabled: bool
+    limiter_qwen_max: int
+    limiter_qwen_target_ms: int
+    limiter_retrieval_max: int
+    limiter_retrieval_target_ms: int
+    degrade_router_utilization: float
+
+    # /chat 令牌桶（Redis，跨 worker）：按来源 IP + 按用户 + 按会话
+    rate_limit_enabled: bool
+    rate_limit_ip_per_minute: float
+    rate_limit_ip_burst: int
+    rate_limit_user_per_minute: float
+    rate_limit_user_burst: int
+    rate_limit_conversation_per_minute: float
+    rate_limit_conversation_burst: int
+    # /chat/batch 按来源 IP 计条数的桶，容量为 batch_max_items
+    rate_limit_batch_items_per_minute: float
+    # 对话图执行前的加权公平队列（进程内）；slots=0 关闭
+    fair_queue_slots: int
+    fair_queue_max_wait_seconds: float
+    fair_queue_max_waiting: int  # 排队数上限，超出直接 503；槽位 + 该值决定线程池大小
+    fair_queue_weights: dict[str, Any]
+
+    batch_max_concurrency: int
+    batch_max_items: int
+
+    def __post_init__(self) -> None:
+        # Cluster 下多 key 脚本/UNLINK 要求同 slot，关掉 hash tag 会在运行时报 CROSSSLOT
+        if self.redis_cluster and not self.redis_hash_tags:
+            raise ValueError("REDIS_HASH_TAGS=false is not supported with REDIS_CLUSTER=true")
+
 
 def _get_int(name: str, default: int) -> int:
     val = os.getenv(name)
@@ -34,6 +109,30 @@ def _get_int(name: str, default: int) -> int:
     return int(val)
 
 
+def _get_float(name: str, default: float) -> float:
+    val = os.getenv(name)
+    if val is None or val == "":
+        return default
+    return float(val)
+
+
+def _get_json(name: str) -> dict[str, Any]:
+    val = os.getenv(name)
+    if val is None or val.strip() == "":
+        return {}
+    parsed = json.loads(val)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"{name} must be a JSON object")
+    return parsed
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    val = os.getenv(name)
+    if val is None or val == "":
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
 def get_settings() -> Settings:
     # 本地开发可用 python-dotenv 载入 .env；生产用环境变量/secret
     try:
@@ -48,15 +147,70 @@ def get_settings() -> Settings:
         redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
         redis_prefix=os.getenv("REDIS_PREFIX", os.getenv("APP_ENV", "dev")),
         session_ttl_seconds=_get_int("SESSION_TTL_SECONDS", 2 * 60 * 60),
+        redis_cluster=_get_bool("REDIS_CLUSTER", False),
+        redis_hash_tags=_get_bool("REDIS_HASH_TAGS", _get_bool("REDIS_CLUSTER", False)),
         milvus_uri=(os.getenv("MILVUS_URI") or os.getenv("ZILLIZ_URI") or "").strip(),
         milvus_token=(os.getenv("MILVUS_TOKEN") or os.getenv("ZILLIZ_TOKEN") or "").strip(),
         milvus_collection=os.getenv("MILVUS_COLLECTION", "qa_collection"),
         milvus_top_k=_get_int("MILVUS_TOP_K", 5),
+        milvus_two_phase=_get_bool("MILVUS_TWO_PHASE", True),
+        milvus_doc_cache_size=_get_int("MILVUS_DOC_CACHE_SIZE", 4096),
+        milvus_doc_cache_ttl_seconds=_get_int("MILVUS_DOC_CACHE_TTL_SECONDS", 600),
+        milvus_filter=os.getenv("MILVUS_FILTER", "").strip(),
+        milvus_partitions=[p.strip() for p in os.getenv("MILVUS_PARTITIONS", "").split(",") if p.strip()],
+        milvus_metric_type=os.getenv("MILVUS_METRIC_TYPE", "").strip().upper(),
+        milvus_search_params=_get_json("MILVUS_SEARCH_PARAMS"),
+        milvus_index_type=os.getenv("MILVUS_INDEX_TYPE", "HNSW").strip().upper(),
+        milvus_index_params=_get_json("MILVUS_INDEX_PARAMS") or {"M": 16, "efConstruction": 200},
         qwen_api_key=(os.getenv("QWEN_API_KEY") or os.getenv("DASHSCOPE_API_KEY") or "").strip(),
         # Qwen 通常提供 OpenAI 兼容接口；你可以按控制台给的地址覆盖
         qwen_base_url=os.getenv("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
         qwen_chat_model=os.getenv("QWEN_CHAT_MODEL", "qwen-plus"),
         qwen_embed_model=os.getenv("QWEN_EMBED_MODEL", "text-embedding-v2"),
+        qwen_route_model=os.getenv("QWEN_ROUTE_MODEL", ""),
+        qwen_followup_model=os.getenv("QWEN_FOLLOWUP_MODEL", ""),
+        qwen_tool_model=os.getenv("QWEN_TOOL_MODEL", ""),
+        qwen_answer_model=os.getenv("QWEN_ANSWER_MODEL", ""),
+        qwen_escalate_max_tool_calls=_get_int("QWEN_ESCALATE_MAX_TOOL_CALLS", 3),
         postgres_dsn=(os.getenv("POSTGRES_DSN") or os.getenv("DATABASE_URL") or "").strip(),
+        pg_partition_months_ahead=_get_int("PG_PARTITION_MONTHS_AHEAD", 2),
+        pg_retention_months=_get_int("PG_RETENTION_MONTHS", 0),
+        history_api_token=os.getenv("HISTORY_API_TOKEN", "").strip(),
+        history_page_max=_get_int("HISTORY_PAGE_MAX", 200),
+        history_rehydrate_turns=_get_int("HISTORY_REHYDRATE_TURNS", 10),
+        history_rehydrate_negative_ttl_seconds=_get_int("HISTORY_REHYDRATE_NEGATIVE_TTL_SECONDS", 60),
+        history_rehydrate_max_age_days=_get_int("HISTORY_REHYDRATE_MAX_AGE_DAYS", 30),
         router_mode=os.getenv("ROUTER_MODE", "heuristic"),
+        otel_enabled=_get_bool("OTEL_ENABLED", False),
+        singleflight_enabled=_get_bool("SINGLEFLIGHT_ENABLED", True),
+        singleflight_wait_seconds=_get_int("SINGLEFLIGHT_WAIT_SECONDS", 30),
+        faq_enabled=_get_bool("FAQ_ENABLED", True),
+        faq_refresh_seconds=_get_int("FAQ_REFRESH_SECONDS", 300),
+        tools_backend=os.getenv("TOOLS_BACKEND", "").strip(),
+        tool_timeout_seconds=_get_float("TOOL_TIMEOUT_SECONDS", 2.0),
+        tool_cache_ttl_seconds=_get_int("TOOL_CACHE_TTL_SECONDS", 30),
+        inference_socket=os.getenv("INFERENCE_SOCKET", "").strip(),
+        inference_timeout_seconds=_get_float("INFERENCE_TIMEOUT_SECONDS", 10.0),
+        qwen_timeout_seconds=_get_float("QWEN_TIMEOUT_SECONDS", 30.0),
+        milvus_timeout_seconds=_get_float("MILVUS_TIMEOUT_SECONDS", 5.0),
+        limiter_enabled=_get_bool("LIMITER_ENABLED", True),
+        limiter_qwen_max=_get_int("LIMITER_QWEN_MAX", 128),
+        limiter_qwen_target_ms=_get_int("LIMITER_QWEN_TARGET_MS", 15000),
+        limiter_retrieval_max=_get_int("LIMITER_RETRIEVAL_MAX", 256),
+        limiter_retrieval_target_ms=_get_int("LIMITER_RETRIEVAL_TARGET_MS", 1000),
+        degrade_router_utilization=_get_float("DEGRADE_ROUTER_UTILIZATION", 0.8),
+        rate_limit_enabled=_get_bool("RATE_LIMIT_ENABLED", True),
+        rate_limit_ip_per_minute=_get_float("RATE_LIMIT_IP_PER_MINUTE", 120.0),
+        rate_limit_ip_burst=_get_int("RATE_LIMIT_IP_BURST", 30),
+        rate_limit_user_per_minute=_get_float("RATE_LIMIT_USER_PER_MINUTE", 30.0),
+        rate_limit_user_burst=_get_int("RATE_LIMIT_USER_BURST", 10),
+        rate_limit_conversation_per_minute=_get_float("RATE_LIMIT_CONVERSATION_PER_MINUTE", 12.0),
+        rate_limit_conversation_burst=_get_int("RATE_LIMIT_CONVERSATION_BURST", 4),
+        rate_limit_batch_items_per_minute=_get_float("RATE_LIMIT_BATCH_ITEMS_PER_MINUTE", 600.0),
+        fair_queue_slots=_get_int("FAIR_QUEUE_SLOTS", 32),
+        fair_queue_max_wait_seconds=_get_float("FAIR_QUEUE_MAX_WAIT_SECONDS", 10.0),
+        fair_queue_max_waiting=_get_int("FAIR_QUEUE_MAX_WAITING", 64),
+        fair_queue_weights=_get_json("FAIR_QUEUE_WEIGHTS"),
+        batch_max_concurrency=_get_int("BATCH_MAX_CONCURRENCY", 16),
+        batch_max_items=_get_int("BATCH_MAX_ITEMS", 50000),
     )
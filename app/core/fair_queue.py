@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+from app.core import metrics
+from app.core.config import Settings
+from app.core.limiter import Overloaded
+
+
+FAIR_QUEUE_RUNNING = metrics.Gauge("telecom_fair_queue_running", "公平队列内正在执行对话图的请求数")
+FAIR_QUEUE_WAITING = metrics.Gauge("telecom_fair_queue_waiting", "公平队列内排队等待的请求数")
+
+
+@dataclass
+class _Waiter:
+    start: float
+    key: str = ""
+    finish: float = 0.0
+    # 打标签前该 key 的 finish：超时放弃时回滚，没执行的请求不该让用户再排后面
+    prev_finish: Optional[float] = None
+    event: threading.Event = field(default_factory=threading.Event)
+    granted: bool = False
+    cancelled: bool = False
+
+
+class FairQueue:
+    """对话图执行前的加权公平队列（start-time fair queuing，进程内、阻塞式）。
+
+    - 有空闲槽位且无人排队时直接执行；
+    - 否则按 key（调用方）打虚拟时间标签：start = max(当前虚拟时间, 该 key 上一个请求的 finish)，
+      finish = start + 1/weight，空出的槽位总是交给 start 最小的等待者。
+      同一用户连发的请求标签依次后移，只会排在自己后面；偶发请求的用户几乎不排队；
+    - 等待超过 max_wait_seconds 抛 Overloaded，由调用方返回 503；
+    - 排队者阻塞着 AnyIO 线程池里的线程：超过 max_waiting 个排队时直接抛 Overloaded，
+      槽位 + max_waiting（capacity）要小于线程池大小，否则请求在线程池里就已 FIFO 排队，
+      公平队列无从排序（assemble_app 启动时按 capacity 调大线程池）；
+    - 只有真正进入执行或排队的请求才打标签，因队列已满被拒的不计；排队超时放弃的会回滚标签。
+
+    key 形如 "{user_id}@{ip}"（匿名为 "ip:{ip}"，批量为 "batch"）。weights 先按完整 key 查，
+    查不到再按 "@" 前的 user_id 查，所以 FAIR_QUEUE_WEIGHTS 按 user_id/租户配置即可。
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        *,
+        max_wait_seconds: float = 10.0,
+        max_waiting: int = 64,
+        weights: Optional[dict[str, float]] = None,
+        default_weight: float = 1.0,
+    ) -> None:
+        self._slots = max(1, slots)
+        self._free = self._slots
+        self._max_wait = max_wait_seconds
+        self._max_waiting = max(0, max_waiting)
+        self._weights = dict(weights or {})
+        self._default_weight = default_weight
+        self._heap: list[tuple[float, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._finish: dict[str, float] = {}
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def _weight(self, key: str) -> float:
+        weight = self._weights.get(key)
+        if weight is None and "@" in key:
+            weight = self._weights.get(key.split("@", 1)[0])
+        return self._default_weight if weight is None else weight
+
+    def _tag(self, key: str) -> float:
+        weight = self._weight(key)
+        start = max(self._vtime, self._finish.get(key, 0.0))
+        self._finish[key] = start + 1.0 / max(weight, 1e-6)
+        if len(self._finish) > 10000:
+            # 标签已落后于虚拟时间的 key 与新来的 key 等价，可以丢掉
+            self._finish = {k: f for k, f in self._finish.items() if f > self._vtime}
+        return start
+
+    def acquire(self, key: str) -> None:
+        with self._lock:
+            if self._free > 0 and not self._heap:
+                self._free -= 1
+                self._vtime = max(self._vtime, self._tag(key))
+                FAIR_QUEUE_RUNNING.set(self._slots - self._free)
+                return
+            if self._waiting >= self._max_waiting:
+                raise Overloaded("fair_queue")
+            prev_finish = self._finish.get(key)
+            start = self._tag(key)
+            waiter = _Waiter(start=start, key=key, finish=self._finish[key], prev_finish=prev_finish)
+            heapq.heappush(self._heap, (start, next(self._seq), waiter))
+            self._waiting += 1
+            FAIR_QUEUE_WAITING.set(self._waiting)
+
+        with metrics.stage("fair_queue_wait"):
+            granted = waiter.event.wait(self._max_wait)
+            with self._lock:
+                if not granted and not waiter.granted:
+                    waiter.cancelled = True
+                    self._untag(waiter)
+                    self._waiting -= 1
+                    FAIR_QUEUE_WAITING.set(self._waiting)
+                    raise Overloaded("fair_queue")
+
+    def _untag(self, waiter: _Waiter) -> None:
+        # 同一 key 之后又有请求打了标签时不动：它们的标签已经排在这之后
+        if self._finish.get(waiter.key) != waiter.finish:
+            return
+        if waiter.prev_finish is None:
+            self._finish.pop(waiter.key, None)
+        else:
+            self._finish[waiter.key] = waiter.prev_finish
+
+    def release(self) -> None:
+        with self._lock:
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                # 槽位直接转交，不经过 _free
+                waiter.granted = True
+                self._waiting -= 1
+                self._vtime = max(self._vtime, waiter.start)
+                FAIR_QUEUE_WAITING.set(self._waiting)
+                waiter.event.set()
+                return
+            self._free += 1
+            FAIR_QUEUE_RUNNING.set(self._slots - self._free)
+
+    @property
+    def capacity(self) -> int:
+        """最多同时占用的线程数：执行中 + 排队中。"""
+        return self._slots + self._max_waiting
+
+    @contextmanager
+    def slot(self, key: str) -> Iterator[None]:
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "slots": self._slots,
+            "running": self._slots - self._free,
+            "waiting": self._waiting,
+            "max_waiting": self._max_waiting,
+            "tracked_keys": len(self._finish),
+        }
+
+
+@contextmanager
+def fair_slot(queue: FairQueue | None, key: str) -> Iterator[None]:
+    """queue 为 None 时不排队，与 limiter.guarded 同样的可选写法。"""
+    if queue is None:
+        yield
+        return
+    with queue.slot(key):
+        yield
+
+
+def build_fair_queue(settings: Settings) -> Optional[FairQueue]:
+    """FAIR_QUEUE_SLOTS=0 时返回 None（不排队）。"""
+    if settings.fair_queue_slots <= 0:
+        return None
+    return FairQueue(
+        settings.fair_queue_slots,
+        max_wait_seconds=settings.fair_queue_max_wait_seconds,
+        max_waiting=settings.fair_queue_max_waiting,
+        weights={str(k): float(v) for k, v in settings.fair_queue_weights.items()},
+    )
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from app.core import metrics
+from app.core.config import Settings
+
+
+LIMITER_LIMIT = metrics.Gauge("telecom_limiter_limit", "自适应并发上限（当前值）", ("name",))
+LIMITER_INFLIGHT = metrics.Gauge("telecom_limiter_inflight", "限流器内进行中的调用数", ("name",))
+LIMITER_REJECTED = metrics.Counter("telecom_limiter_rejected_total", "超过并发上限被快速拒绝的调用数", ("name",))
+
+
+class Overloaded(RuntimeError):
+    """上游并发已达自适应上限：调用方应快速失败或降级，而不是排队。"""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"{name} overloaded")
+        self.name = name
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器（非阻塞）。
+
+    - 成功且耗时不超过 latency_target，且并发确实用到了 limit 的一半以上：limit += 1/limit（加性增）
+    - 失败/超时或耗时超过 latency_target：limit *= backoff（乘性减；每个 latency_target 窗口最多减一次）
+    - 超过 limit 的调用直接 Overloaded，由调用方返回 503 或走降级路径
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        initial: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 200,
+        latency_target: float = 5.0,
+        backoff: float = 0.9,
+    ) -> None:
+        self.name = name
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._min = float(min_limit)
+        self._max = float(max_limit)
+        self._target = latency_target
+        self._backoff = backoff
+        self._inflight = 0
+        self._last_drop = 0.0
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def utilization(self) -> float:
+        return self._inflight / max(1.0, self._limit)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._inflight >= int(self._limit):
+                ok = False
+            else:
+                self._inflight += 1
+                ok = True
+        if not ok:
+            LIMITER_REJECTED.inc(name=self.name)
+        LIMITER_INFLIGHT.set(self._inflight, name=self.name)
+        return ok
+
+    def release(self, *, latency: float, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            used = self._inflight
+            self._inflight = max(0, self._inflight - 1)
+            if ok and latency <= self._target:
+                # 低负载时不抬高上限，避免空闲期把 limit 涨到 max 失去保护作用
+                if used * 2 >= self._limit:
+                    self._limit = min(self._max, self._limit + 1.0 / self._limit)
+            elif now - self._last_drop >= self._target:
+                self._limit = max(self._min, self._limit * self._backoff)
+                self._last_drop = now
+        self._publish()
+
+    @contextmanager
+    def acquire(self) -> Iterator[None]:
+        if not self.try_acquire():
+            raise Overloaded(self.name)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.release(latency=time.perf_counter() - t0, ok=ok)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "inflight": self._inflight,
+            "utilization": round(self.utilization(), 3),
+            "latency_target_s": self._target,
+            "rejected_total": LIMITER_REJECTED.get(name=self.name),
+        }
+
+    def _publish(self) -> None:
+        LIMITER_LIMIT.set(self._limit, name=self.name)
+        LIMITER_INFLIGHT.set(self._inflight, name=self.name)
+
+
+@contextmanager
+def guarded(limiter: AdaptiveLimiter | None) -> Iterator[None]:
+    """limiter 为 None 时不做限制，方便在可选依赖处统一写法。"""
+    if limiter is None:
+        yield
+        return
+    with limiter.acquire():
+        yield
+
+
+def build_limiters(settings: Settings) -> dict[str, AdaptiveLimiter]:
+    """qwen / embed / milvus 三个独立限流器；LIMITER_ENABLED=false 时返回空 dict。"""
+    if not settings.limiter_enabled:
+        return {}
+    qwen_max = settings.limiter_qwen_max
+    retrieval_max = settings.limiter_retrieval_max
+    return {
+        "qwen": AdaptiveLimiter(
+            "qwen",
+            initial=max(1, qwen_max // 4),
+            max_limit=qwen_max,
+            latency_target=settings.limiter_qwen_target_ms / 1000.0,
+        ),
+        "embed": AdaptiveLimiter(
+            "embed",
+            initial=max(1, retrieval_max // 4),
+            max_limit=retrieval_max,
+            latency_target=settings.limiter_retrieval_target_ms / 1000.0,
+        ),
+        "milvus": AdaptiveLimiter(
+            "milvus",
+            initial=max(1, retrieval_max // 4),
+            max_limit=retrieval_max,
+            latency_target=settings.limiter_retrieval_target_ms / 1000.0,
+        ),
+    }
@@ -0,0 +1,287 @@
+"""进程内轻量指标（Prometheus 文本格式）+ 可选 OpenTelemetry span。
+
+不依赖 prometheus_client：热路径上只有一次 perf_counter 和一把锁。
+注意：uvicorn 多 worker 时每个进程各自一份指标，由 Prometheus 按实例抓取后聚合。
+"""
+from __future__ import annotations
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+
+_DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()) -> None:
+        self._values: dict[tuple[str, ...], float] = {}
+        super().__init__(name, doc, labelnames)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def get(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()) -> None:
+        self._values: dict[tuple[str, ...], float] = {}
+        super().__init__(name, doc, labelnames)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = float(value)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> None:
+        self._buckets = tuple(sorted(buckets))
+        # label 值 -> [各桶计数..., +Inf 计数], sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+        super().__init__(name, doc, labelnames)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        k = self._key(labels)
+        idx = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            counts = self._counts.get(k)
+            if counts is None:
+                counts = self._counts[k] = [0] * (len(self._buckets) + 1)
+                self._sums[k] = 0.0
+            counts[idx] += 1
+            self._sums[k] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(c), self._sums[k]) for k, c in self._counts.items()]
+        lines: list[str] = []
+        for k, counts, total in items:
+            acc = 0
+            for le, c in zip(self._buckets, counts):
+                acc += c
+                le_label = 'le="%s"' % le
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, le_label)} {acc}")
+            acc += counts[-1]
+            inf_label = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, inf_label)} {acc}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, k)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, k)} {acc}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        out: list[str] = []
+        for m in self._metrics:
+            out.append(f"# HELP {m.name} {m.doc}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.render())
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram(
+    "telecom_stage_seconds", "各阶段耗时（秒）", ("stage",)
+)
+STAGE_ERRORS = Counter(
+    "telecom_stage_errors_total", "各阶段抛出异常次数", ("stage",)
+)
+LLM_TOKENS = Counter(
+    "telecom_llm_tokens_total", "Qwen usage 返回的 token 数", ("model", "kind")
+)
+CACHE_REQUESTS = Counter(
+    "telecom_cache_requests_total", "缓存命中/未命中次数（命中率 = hit / (hit + miss)）", ("cache", "result")
+)
+INFLIGHT = Gauge(
+    "telecom_inflight", "当前进行中的请求/调用数", ("what",)
+)
+
+
+# ---------------- 请求上下文 / 单请求阶段耗时 ----------------
+
+_request_ctx: contextvars.ContextVar[Optional[dict[str, str]]] = contextvars.ContextVar(
+    "telecom_request_ctx", default=None
+)
+_timings: contextvars.ContextVar[Optional[dict[str, float]]] = contextvars.ContextVar(
+    "telecom_stage_timings", default=None
+)
+
+
+@contextmanager
+def request_context(*, conversation_id: str, request_id: str) -> Iterator[None]:
+    """把 conversation_id/request_id 绑定到当前上下文，供 span 属性使用。"""
+    token = _request_ctx.set({"conversation_id": conversation_id, "request_id": request_id})
+    try:
+        yield
+    finally:
+        _request_ctx.reset(token)
+
+
+@contextmanager
+def collect_timings() -> Iterator[dict[str, float]]:
+    """收集本上下文内各阶段累计耗时（秒），用于单请求维度的耗时明细。"""
+    bucket: dict[str, float] = {}
+    token = _timings.set(bucket)
+    try:
+        yield bucket
+    finally:
+        _timings.reset(token)
+
+
+# ---------------- OpenTelemetry（可选） ----------------
+
+_tracer: Any = None
+
+
+def enable_tracing(service_name: str = "telecom") -> bool:
+    """安装了 opentelemetry-api 时启用 span；否则静默返回 False。"""
+    global _tracer
+    try:
+        from opentelemetry import trace  # type: ignore
+    except Exception:
+        return False
+    _tracer = trace.get_tracer(service_name)
+    return True
+
+
+@contextmanager
+def _span(name: str) -> Iterator[None]:
+    if _tracer is None:
+        yield
+        return
+    with _tracer.start_as_current_span(name) as span:
+        ctx = _request_ctx.get()
+        if ctx:
+            for k, v in ctx.items():
+                span.set_attribute(k, v)
+        yield
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录一个阶段的耗时直方图，并（可选）开启同名 span。"""
+    t0 = time.perf_counter()
+    try:
+        with _span(name):
+            yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def observe_stage(name: str, seconds: float, *, error: bool = False) -> None:
+    """在调用方线程补记一个阶段耗时：阶段实际跑在别的线程/事件循环里时，stage 记不进本请求的 timings。"""
+    if error:
+        STAGE_ERRORS.inc(stage=name)
+    STAGE_SECONDS.observe(seconds, stage=name)
+    bucket = _timings.get()
+    if bucket is not None:
+        bucket[name] = bucket.get(name, 0.0) + seconds
+
+
+@contextmanager
+def inflight(what: str) -> Iterator[None]:
+    INFLIGHT.inc(what=what)
+    try:
+        yield
+    finally:
+        INFLIGHT.dec(what=what)
+
+
+def record_usage(model: str, usage: Any) -> None:
+    """从 OpenAI 兼容返回的 usage 中累计 token。"""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        n = getattr(usage, kind, None)
+        if n is None and isinstance(usage, dict):
+            n = usage.get(kind)
+        if n:
+            LLM_TOKENS.inc(float(n), model=model, kind=kind.split("_")[0])
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from datetime import datetime
 from typing import Any, Literal, Optional
 
 from pydantic import BaseModel, Field
@@ -15,6 +16,7 @@ class ChatMessage(BaseModel):
     content: str
     ts: float
     answer_id: Optional[str] = None
+    user_id: Optional[str] = None
     meta: dict[str, Any] = Field(default_factory=dict)
 
 
@@ -41,3 +43,18 @@ class EndRequest(BaseModel):
 class EndResponse(BaseModel):
     conversation_id: str
     flushed_message_count: int
+
+
+class HistoryItem(BaseModel):
+    id: int
+    conversation_id: str
+    request_id: str
+    user_id: Optional[str] = None
+    message: str
+    answer: str
+    time: datetime
+
+
+class HistoryResponse(BaseModel):
+    items: list[HistoryItem]
+    next_cursor: Optional[str] = None
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import time
 import uuid
+from typing import Any
 
 
 def new_id() -> str:
@@ -10,3 +13,17 @@ def new_id() -> str:
 
 def now_ts() -> float:
     return time.time()
+
+
+def knowledge_hash(question: str, knowledge: str) -> str:
+    """知识条目的内容指纹：入库增量比对与预计算答案失效判断共用。"""
+    return hashlib.sha1(f"{question}\x1f{knowledge}".encode("utf-8")).hexdigest()
+
+
+def json_with_raw(obj: dict[str, Any], **raw: str) -> str:
+    """json.dumps(obj) 后追加字段，raw 的值是已序列化好的 JSON，原样拼接不再编码。"""
+    text = json.dumps(obj, ensure_ascii=False)
+    if not raw:
+        return text
+    extra = ",".join(f"{json.dumps(k)}:{v}" for k, v in raw.items())
+    return f"{text[:-1]},{extra}}}" if obj else f"{{{extra}}}"
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Literal, TypedDict
 
 from langgraph.graph import END, StateGraph
 
+from app.core import metrics
+from app.core.limiter import Overloaded
 from app.core.utils import now_ts
 
 
@@ -17,10 +19,12 @@ class GraphState(TypedDict, total=False):
     user_id: str | None
 
     query: str
-    history: list[dict[str, Any]]
+    # HistoryMessage（app.integrations.redis_memory）或同字段的 dict，只读 role/content
+    history: list[Any]
 
     route: Route
-    retrieved: list[dict[str, Any]]
+    # RetrievedDoc：直接持有检索结果，不再复制成 dict
+    retrieved: list[Any]
 
     answer: str
     citations: list[dict[str, Any]]
@@ -31,6 +35,12 @@ class GraphDeps:
     router_mode: str
     retriever: Any
     llm: Any
+    # 可选 AdaptiveLimiter：qwen/embed/milvus，用于按负载逐级降级
+    limiters: dict[str, Any] = field(default_factory=dict)
+    # qwen 并发利用率达到该值时 react 路由退化为 heuristic
+    degrade_router_at: float = 0.8
+    # 可选 ToolRegistry（app.integrations.business_tools）：TOOL 路由直接调用业务查询工具
+    tools: Any = None
 
 
 def react_route(query: str, history: list[dict[str, Any]], llm: Any) -> Route:
@@ -51,13 +61,25 @@ def react_route(query: str, history: list[dict[str, Any]], llm: Any) -> Route:
         result = (llm.chat(messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
-        ]) or "").strip().upper()
+        ], purpose="route") or "").strip().upper()
+    except Overloaded:
+        return heuristic_route(query, history)
     except Exception:
         return "RAG"
 
     return "RAG" if "RAG" in result else "NO_RAG"
 
 
+# 查本人账户信息的关键词
+TOOL_KEYWORDS = ("查话费", "查余额", "查流量", "查订单", "物流", "余额", "账单", "详单")
+# 问办法/规则/后果的说法：即使提到余额、账单也是知识类问题（如“余额不足会停机吗”）
+HOWTO_MARKERS = ("怎么", "如何", "怎样", "会不会", "能不能", "为什么", "是什么", "什么是", "不足", "停机", "取消", "退订")
+
+
+def is_howto(query: str) -> bool:
+    return any(k in (query or "") for k in HOWTO_MARKERS)
+
+
 def heuristic_route(query: str, history: list[dict[str, Any]]) -> Route:
     q = (query or "").strip()
 
@@ -79,8 +101,8 @@ def heuristic_route(query: str, history: list[dict[str, Any]]) -> Route:
     ):
         return "NO_RAG"
 
-    # 业务查询（示例关键词，可按你的电信业务扩充）
-    if any(k in q for k in ["查话费", "查余额", "查流量", "查订单", "物流", "余额", "账单", "详单"]):
+    # 业务查询（示例关键词，可按你的电信业务扩充）；问办法/规则的仍走知识库
+    if any(k in q for k in TOOL_KEYWORDS) and not is_howto(q):
         return "TOOL"
 
     # 指代比较：通常可脱离知识库，只基于历史候选项做推荐
@@ -147,16 +169,25 @@ def build_graph(deps: GraphDeps):
             text = text[-max_chars:]
         return text
 
+    def _saturated(name: str, threshold: float) -> bool:
+        lim = deps.limiters.get(name)
+        return lim is not None and lim.utilization() >= threshold
+
     def node_route(state: GraphState) -> GraphState:
         query = state.get("query", "")
         history = state.get("history", [])
 
-        if deps.router_mode == "heuristic":
-            route: Route = heuristic_route(query, history)
-        elif deps.router_mode == "react":
-            route: Route = react_route(query, history, deps.llm)
-        else:
-            route = heuristic_route(query, history)
+        with metrics.stage("node_route"):
+            if deps.router_mode == "heuristic":
+                route: Route = heuristic_route(query, history)
+            elif deps.tools is not None and heuristic_route(query, history) == "TOOL":
+                # 明确的账户查询：直接走工具，省掉一次路由调用（react 路由只会输出 RAG/NO_RAG）
+                route = "TOOL"
+            elif deps.router_mode == "react" and not _saturated("qwen", deps.degrade_router_at):
+                route: Route = react_route(query, history, deps.llm)
+            else:
+                # 一级降级：大模型吃紧时省掉路由这次调用
+                route = heuristic_route(query, history)
 
         return {"route": route}
 
@@ -165,7 +196,7 @@ def build_graph(deps: GraphDeps):
         route = state.get("route", "NO_RAG")
         history = state.get("history", [])
 
-        tool_retrieved: list[dict[str, Any]] = []
+        tool_retrieved: list[Any] = []
         tool_citations: list[dict[str, Any]] = []
 
         tools = [
@@ -187,6 +218,7 @@ def build_graph(deps: GraphDeps):
         ]
 
         def tool_executor(name: str, args: dict[str, Any]) -> Any:
+            # 返回已编码的 JSON 文本：qwen_openai 原样作为 tool 消息内容
             nonlocal tool_retrieved, tool_citations
             if name != "search_knowledge":
                 return {"error": f"unknown tool: {name}"}
@@ -198,21 +230,15 @@ def build_graph(deps: GraphDeps):
             except Exception:
                 top_k_int = None
 
-            docs = deps.retriever.retrieve(q)
-            if top_k_int is not None and top_k_int > 0:
-                docs = docs[:top_k_int]
-
-            tool_retrieved = [
-                {
-                    "id": d.id,
-                    "score": d.score,
-                    "question": d.question,
-                    "knowledge": d.knowledge,
-                }
-                for d in docs
-            ]
+            try:
+                # top_k 下推到检索（检索器以 MILVUS_TOP_K 为上限）：两阶段检索只为选中的 id 取正文
+                docs = deps.retriever.retrieve(q, top_k=top_k_int)
+            except Overloaded:
+                return {"docs": [], "error": "knowledge base busy"}
+
+            tool_retrieved = list(docs)
             tool_citations = [d.to_citation() for d in docs]
-            return {"docs": tool_retrieved}
+            return '{"docs":[' + ",".join(d.to_tool_json() for d in docs) + "]}"
 
         # system 提示：在需要业务知识时先调用工具；无知识则追问澄清
         system_policy = (
@@ -230,31 +256,69 @@ def build_graph(deps: GraphDeps):
         if hist_text:
             messages.append({"role": "system", "content": f"对话历史（供参考）：\n{hist_text}"})
 
+        # 二级降级：检索链路已满，跳过工具调用，直接按路由结果作答
+        skip_retrieval = route != "NO_RAG" and (_saturated("embed", 1.0) or _saturated("milvus", 1.0))
+        if skip_retrieval:
+            messages.append({
+                "role": "system",
+                "content": "知识库暂时繁忙无法查询：不要编造具体资费数字，优先给出自助办理链接或请用户稍后再问。",
+            })
+
         messages.append({"role": "user", "content": query})
 
-        # 恢复为 LLMWrapper 的 chat/chat_with_tools 调用
-        if route == "NO_RAG":
-            answer = deps.llm.chat(messages=messages)
-        else:
-            if hasattr(deps.llm, "chat_with_tools"):
-                answer = deps.llm.chat_with_tools(
-                    messages=messages,
-                    tools=tools,
-                    tool_executor=tool_executor,
-                )
+        # TieredLLM：NO_RAG 追问走 followup 模型，其余按 tool/answer 分层
+        with metrics.stage("node_answer"):
+            if route == "NO_RAG":
+                answer = deps.llm.chat(messages=messages, purpose="followup")
+            elif skip_retrieval:
+                answer = deps.llm.chat(messages=messages, purpose="answer")
             else:
-                answer = deps.llm.chat(messages=messages)
-        answer = _sanitize_answer(answer)
+                if hasattr(deps.llm, "chat_with_tools"):
+                    answer = deps.llm.chat_with_tools(
+                        messages=messages,
+                        tools=tools,
+                        tool_executor=tool_executor,
+                    )
+                else:
+                    answer = deps.llm.chat(messages=messages)
+        with metrics.stage("sanitize"):
+            answer = _sanitize_answer(answer)
         if route in ("RAG", "TOOL") and not tool_retrieved:
             answer = answer or _clarify_question(query)
         if not answer:
             answer = _clarify_question(query)
         return {"answer": answer, "retrieved": tool_retrieved, "citations": tool_citations}
 
-    def node_tool_placeholder(state: GraphState) -> GraphState:
-        # 目前 TOOL 路由也交给 node_answer 处理（function call / 澄清）。
+    def node_tool(state: GraphState) -> GraphState:
         query = state.get("query", "")
-        return {"answer": _clarify_question(query), "citations": [], "retrieved": []}
+        user_id = state.get("user_id")
+
+        specs = deps.tools.match(query) if deps.tools is not None and not is_howto(query) else []
+        if not specs:
+            # 未启用工具、没有对应的工具或是在问办法：仍交给 node_answer（function call / 澄清）
+            return node_answer(state)
+        if not user_id:
+            return {
+                "answer": "查询话费、流量、订单、账单等账户信息需要先登录，请登录后再问我，或在营业厅小程序中自助查询。",
+                "citations": [],
+                "retrieved": [],
+            }
+
+        # 关键词已确定要调哪些工具：并发直接调用，按模板作答，不经过大模型
+        with metrics.stage("node_tool"):
+            results = deps.tools.call_many(
+                user_id, [(s, s.extract_args(query) if s.extract_args else {}) for s in specs]
+            )
+        parts: list[str] = []
+        for spec, res in zip(specs, results):
+            text = ""
+            if res.ok:
+                try:
+                    text = spec.render(res.data)
+                except Exception:
+                    text = ""
+            parts.append(text or f"{spec.description}暂时不可用，请稍后再试，或在营业厅小程序中自助查询。")
+        return {"answer": _sanitize_answer(" ".join(parts)), "citations": [], "retrieved": []}
 
     def node_clarify(state: GraphState) -> GraphState:
         query = state.get("query", "")
@@ -262,7 +326,7 @@ def build_graph(deps: GraphDeps):
 
     g.add_node("route", node_route)
     g.add_node("answer", node_answer)
-    g.add_node("tool", node_tool_placeholder)
+    g.add_node("tool", node_tool)
     g.add_node("clarify", node_clarify)
 
     g.set_entry_point("route")
@@ -276,7 +340,7 @@ def build_graph(deps: GraphDeps):
         {
             "RAG": "answer",
             "NO_RAG": "answer",
-            "TOOL": "answer",
+            "TOOL": "tool",
             "CLARIFY": "clarify",
         },
     )
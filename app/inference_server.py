@@ -0,0 +1,219 @@
+"""本机推理 sidecar：一个进程加载 embedding（与可选的 reranker）模型，供同机所有 uvicorn worker 共用。
+
+    python -m app.inference_server --socket /run/telecom/infer.sock --threads 8
+    INFERENCE_SOCKET=/run/telecom/infer.sock uvicorn app.main:app --workers 8
+
+- 每个 worker 不再各自加载 bge-large-zh + torch，内存不再随 worker 数线性增长；
+- 所有请求进入同一个调度线程，按 --max-batch / --max-wait-ms 合并成批再推理，
+  torch 线程数由 --threads 统一控制，不会出现多个 worker 抢 CPU；
+- 每条连接一块共享内存（app.integrations.inference_client 的线协议），结果向量不经 socket 传输。
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+
+from app.integrations.embedding import DEFAULT_EMBED_MODEL, load_embedder
+from app.integrations.inference_client import MAX_ITEMS, recv_msg, send_msg
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Job:
+    op: str  # embed | rerank
+    texts: list[str]
+    query: str = ""
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[np.ndarray] = None
+    error: Optional[str] = None
+
+
+class BatchScheduler:
+    """单线程推理循环：取第一个请求后最多再等 max_wait 秒，把同类请求拼成不超过 max_batch 条的一批。"""
+
+    def __init__(self, *, embedder: Any, reranker: Any = None, max_batch: int = 64, max_wait: float = 0.005) -> None:
+        self._embedder = embedder
+        self._reranker = reranker
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._q: "queue.Queue[_Job]" = queue.Queue()
+        self._held: Optional[_Job] = None
+        self.stats = {"batches": 0, "items": 0, "requests": 0, "busy_seconds": 0.0}
+        self._thread = threading.Thread(target=self._loop, name="inference-scheduler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def submit(self, job: _Job) -> _Job:
+        self._q.put(job)
+        job.done.wait()
+        return job
+
+    def _next_batch(self) -> list[_Job]:
+        first = self._held or self._q.get()
+        self._held = None
+        batch, size = [first], len(first.texts)
+        deadline = time.monotonic() + self._max_wait
+        while size < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job.op != first.op or size + len(job.texts) > self._max_batch:
+                # 不同类/放不下的留到下一批打头
+                self._held = job
+                break
+            batch.append(job)
+            size += len(job.texts)
+        return batch
+
+    def _run(self, batch: list[_Job]) -> None:
+        op = batch[0].op
+        texts = [t for job in batch for t in job.texts]
+        if op == "embed":
+            out = np.asarray(self._embedder.encode_documents(texts), dtype=np.float32)
+        elif op == "rerank":
+            if self._reranker is None:
+                raise RuntimeError("no reranker loaded (start the sidecar with --rerank-model)")
+            pairs = [(job.query, d) for job in batch for d in job.texts]
+            out = np.asarray(self._reranker.predict(pairs), dtype=np.float32).reshape(-1, 1)
+        else:
+            raise RuntimeError(f"unknown op: {op}")
+        offset = 0
+        for job in batch:
+            job.result = out[offset : offset + len(job.texts)]
+            offset += len(job.texts)
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            t0 = time.perf_counter()
+            try:
+                self._run(batch)
+            except Exception as e:
+                logger.exception("inference batch failed")
+                for job in batch:
+                    job.error = str(e)
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(batch)
+            self.stats["items"] += sum(len(j.texts) for j in batch)
+            self.stats["busy_seconds"] += time.perf_counter() - t0
+            for job in batch:
+                job.done.set()
+
+
+class InferenceServer:
+    def __init__(self, *, socket_path: str, scheduler: BatchScheduler, dim: int, max_items: int = MAX_ITEMS) -> None:
+        self._path = socket_path
+        self._scheduler = scheduler
+        self._dim = dim
+        self._max_items = max_items
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        srv.bind(self._path)
+        # 只允许同用户/同组的 worker 连接
+        os.chmod(self._path, 0o660)
+        srv.listen(256)
+        logger.info("inference sidecar listening on %s (dim=%d)", self._path, self._dim)
+        try:
+            while True:
+                conn, _ = srv.accept()
+                threading.Thread(target=self._handle, args=(conn,), name="inference-conn", daemon=True).start()
+        finally:
+            srv.close()
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+    def _handle(self, conn: socket.socket) -> None:
+        # 向量与 rerank 分数共用同一块：max_items 行 × max(dim, 1) 列 float32
+        shm = shared_memory.SharedMemory(create=True, size=self._max_items * max(self._dim, 1) * 4)
+        try:
+            with conn:
+                while True:
+                    try:
+                        req = recv_msg(conn)
+                    except ConnectionError:
+                        return
+                    send_msg(conn, self._dispatch(req, shm))
+        except OSError as e:
+            logger.debug("inference connection closed: %s", e)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _dispatch(self, req: dict[str, Any], shm: shared_memory.SharedMemory) -> dict[str, Any]:
+        op = req.get("op")
+        if op == "hello":
+            return {"ok": True, "shm": shm.name, "dim": self._dim, "max_items": self._max_items}
+        if op == "stats":
+            return {"ok": True, **self._scheduler.stats}
+        if op not in ("embed", "rerank"):
+            return {"ok": False, "error": f"unknown op: {op}"}
+
+        texts = [str(t) for t in (req.get("texts") if op == "embed" else req.get("docs")) or []]
+        if len(texts) > self._max_items:
+            return {"ok": False, "error": f"too many items (max {self._max_items})"}
+        if not texts:
+            return {"ok": True, "n": 0, "width": 1}
+        job = self._scheduler.submit(_Job(op=op, texts=texts, query=str(req.get("query") or "")))
+        if job.error is not None or job.result is None:
+            return {"ok": False, "error": job.error or "no result"}
+
+        out = np.ascontiguousarray(job.result, dtype=np.float32)
+        view = np.ndarray(out.shape, dtype=np.float32, buffer=shm.buf)
+        view[...] = out
+        del view
+        return {"ok": True, "n": out.shape[0], "width": out.shape[1]}
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--socket", default=os.getenv("INFERENCE_SOCKET") or "/tmp/telecom-inference.sock")
+    ap.add_argument("--model", default=DEFAULT_EMBED_MODEL)
+    ap.add_argument("--rerank-model", default="", help="如 BAAI/bge-reranker-base；为空不加载")
+    ap.add_argument("--device", default=None)
+    ap.add_argument("--threads", type=int, default=os.cpu_count() or 4, help="torch 推理线程数（整机预算）")
+    ap.add_argument("--max-batch", type=int, default=64)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    import torch
+
+    torch.set_num_threads(max(1, args.threads))
+    embedder = load_embedder(args.model, device=args.device)
+    reranker = None
+    if args.rerank_model:
+        from sentence_transformers import CrossEncoder
+
+        reranker = CrossEncoder(args.rerank_model, device=args.device)
+    dim = len(embedder.encode_documents(["warmup"])[0])
+
+    scheduler = BatchScheduler(
+        embedder=embedder, reranker=reranker, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000
+    )
+    scheduler.start()
+    InferenceServer(socket_path=args.socket, scheduler=scheduler, dim=dim).serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,292 @@
+"""业务查询工具（话费/流量/订单/账单）：声明式注册、并发调用、超时与按用户的短 TTL 缓存。
+
+TOOL 路由由 node_tool 按关键词直接选工具并调用，不经过大模型规划；结果用模板渲染成回答。
+后端是 async 函数 (user_id, args) -> dict，在注册表自带的事件循环线程里并发执行，
+同步的图节点通过 call_many 阻塞等待（每个工具单独超时，互不拖累）。
+
+工具按请求里的 user_id 查数据，而 /chat 的 user_id 来自请求体、未经鉴权：目前只提供按 user_id
+生成假数据的 mock 后端，APP_ENV=prod 时拒绝启用。接入真实后端前必须先由网关鉴权，
+把鉴权后的身份传进来，不能直接信任请求体里的 user_id。
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core import metrics
+
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, dict[str, Any]], Awaitable[dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    name: str
+    description: str
+    handler: Handler
+    # 结果 dict -> 回答文本
+    render: Callable[[dict[str, Any]], str]
+    # JSON Schema（与 function calling 的 parameters 同格式）；调用前按 properties 过滤参数
+    parameters: dict[str, Any] = field(default_factory=lambda: {"type": "object", "properties": {}})
+    # 已判定为 TOOL 路由（heuristic_route）后，命中任一关键词即调用
+    keywords: tuple[str, ...] = ()
+    # 从用户问题里抽取参数（如账单月份）
+    extract_args: Optional[Callable[[str], dict[str, Any]]] = None
+    timeout_seconds: float = 2.0
+    cache_ttl_seconds: int = 30
+
+
+@dataclass(frozen=True)
+class ToolResult:
+    name: str
+    ok: bool
+    data: dict[str, Any] = field(default_factory=dict)
+    error: str = ""
+    cached: bool = False
+    # 事件循环线程里测得的耗时，由 call_many 在调用方线程记到 tool_<name> 阶段
+    seconds: float = 0.0
+
+
+class ToolRegistry:
+    def __init__(
+        self,
+        *,
+        redis_client: Any = None,
+        prefix: str = "",
+    ) -> None:
+        self._specs: dict[str, ToolSpec] = {}
+        self._r = redis_client
+        self._prefix = prefix
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    # ---------------- 注册 / 选择 ----------------
+
+    def register(self, spec: ToolSpec) -> None:
+        if spec.name in self._specs:
+            raise ValueError(f"tool already registered: {spec.name}")
+        self._specs[spec.name] = spec
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def match(self, query: str) -> list[ToolSpec]:
+        q = query or ""
+        return [s for s in self._specs.values() if any(k in q for k in s.keywords)]
+
+    # ---------------- 调用 ----------------
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="tool-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _cache_key(self, user_id: str, name: str, args: dict[str, Any]) -> str:
+        digest = hashlib.sha1(json.dumps(args, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        # hash tag 用 user_id：同一用户的工具缓存落在同一 slot
+        return f"{self._prefix}:tool:{{{user_id}}}:{name}:{digest}"
+
+    def _cache_get(self, key: str) -> Optional[dict[str, Any]]:
+        if self._r is None:
+            return None
+        try:
+            raw = self._r.get(key)
+        except Exception as e:
+            logger.warning("tool cache get failed: %s", e)
+            return None
+        return json.loads(raw) if raw else None
+
+    def _cache_put(self, key: str, data: dict[str, Any], ttl: int) -> None:
+        if self._r is None or ttl <= 0:
+            return
+        try:
+            self._r.set(key, json.dumps(data, ensure_ascii=False), ex=ttl)
+        except Exception as e:
+            logger.warning("tool cache put failed: %s", e)
+
+    async def _call_one(self, spec: ToolSpec, user_id: str, args: dict[str, Any]) -> ToolResult:
+        t0 = time.perf_counter()
+        try:
+            data = await asyncio.wait_for(spec.handler(user_id, args), timeout=spec.timeout_seconds)
+            return ToolResult(name=spec.name, ok=True, data=data, seconds=time.perf_counter() - t0)
+        except asyncio.TimeoutError:
+            logger.warning("tool %s timed out", spec.name)
+            return ToolResult(name=spec.name, ok=False, error="timeout", seconds=time.perf_counter() - t0)
+        except Exception as e:
+            logger.warning("tool %s failed: %s", spec.name, e)
+            return ToolResult(name=spec.name, ok=False, error=str(e), seconds=time.perf_counter() - t0)
+
+    async def _gather(self, calls: list[tuple[ToolSpec, str, dict[str, Any]]]) -> list[ToolResult]:
+        return list(await asyncio.gather(*(self._call_one(s, u, a) for s, u, a in calls)))
+
+    def call_many(self, user_id: str, calls: list[tuple[ToolSpec, dict[str, Any]]]) -> list[ToolResult]:
+        """并发调用多个工具，按 calls 顺序返回；先查缓存，未命中的一起并发执行。"""
+        results: list[Optional[ToolResult]] = [None] * len(calls)
+        pending: list[tuple[int, ToolSpec, dict[str, Any], str]] = []
+        for i, (spec, args) in enumerate(calls):
+            props = (spec.parameters or {}).get("properties") or {}
+            args = {k: v for k, v in args.items() if k in props}
+            key = self._cache_key(user_id, spec.name, args)
+            cached = self._cache_get(key)
+            metrics.record_cache("tool", cached is not None)
+            if cached is not None:
+                results[i] = ToolResult(name=spec.name, ok=True, data=cached, cached=True)
+            else:
+                pending.append((i, spec, args, key))
+
+        if pending:
+            budget = max(s.timeout_seconds for _, s, _, _ in pending) + 1.0
+            fut = asyncio.run_coroutine_threadsafe(
+                self._gather([(s, user_id, a) for _, s, a, _ in pending]), self._event_loop()
+            )
+            try:
+                done = fut.result(timeout=budget)
+            except concurrent.futures.TimeoutError:
+                fut.cancel()
+                done = [ToolResult(name=s.name, ok=False, error="timeout", seconds=budget) for _, s, _, _ in pending]
+            for (i, spec, _, key), res in zip(pending, done):
+                results[i] = res
+                # 协程跑在注册表的事件循环线程，拿不到本请求的 timings：回到调用方线程再记
+                metrics.observe_stage(f"tool_{spec.name}", res.seconds, error=not res.ok)
+                if res.ok:
+                    self._cache_put(key, res.data, spec.cache_ttl_seconds)
+        return [r for r in results if r is not None]
+
+
+# ---------------- 本地 mock 后端 ----------------
+
+def _mock_rng(user_id: str, salt: str) -> random.Random:
+    return random.Random(int(hashlib.sha1(f"{user_id}:{salt}".encode("utf-8")).hexdigest()[:12], 16))
+
+
+def _bill_month(query: str) -> dict[str, Any]:
+    today = datetime.now()
+    if any(k in query for k in ("上个月", "上月")):
+        today = today.replace(day=1) - timedelta(days=1)
+    return {"month": f"{today:%Y-%m}"}
+
+
+def build_mock_registry(
+    *,
+    redis_client: Any = None,
+    prefix: str = "",
+    timeout_seconds: float = 2.0,
+    cache_ttl_seconds: int = 30,
+    latency_seconds: float = 0.05,
+) -> ToolRegistry:
+    """按 user_id 生成确定性假数据的本地后端，用于联调与压测。"""
+
+    async def balance(user_id: str, args: dict[str, Any]) -> dict[str, Any]:
+        await asyncio.sleep(latency_seconds)
+        rng = _mock_rng(user_id, "balance")
+        return {"balance": round(rng.uniform(-20, 200), 2), "as_of": f"{datetime.now():%Y-%m-%d %H:%M}"}
+
+    async def data_usage(user_id: str, args: dict[str, Any]) -> dict[str, Any]:
+        await asyncio.sleep(latency_seconds)
+        rng = _mock_rng(user_id, "data")
+        total = rng.choice([30, 60, 100, 200])
+        used = round(rng.uniform(0, total), 1)
+        return {"total_gb": total, "used_gb": used, "remaining_gb": round(total - used, 1)}
+
+    async def orders(user_id: str, args: dict[str, Any]) -> dict[str, Any]:
+        await asyncio.sleep(latency_seconds)
+        rng = _mock_rng(user_id, "orders")
+        status = rng.choice(["已下单", "已发货", "运输中", "已签收"])
+        return {"orders": [{"order_id": f"SO{rng.randint(10**9, 10**10 - 1)}", "item": "5G 手机卡", "status": status}]}
+
+    async def bill(user_id: str, args: dict[str, Any]) -> dict[str, Any]:
+        await asyncio.sleep(latency_seconds)
+        rng = _mock_rng(user_id, f"bill:{args.get('month')}")
+        return {"month": args.get("month"), "amount": round(rng.uniform(39, 299), 2)}
+
+    reg = ToolRegistry(redis_client=redis_client, prefix=prefix)
+    common = {"timeout_seconds": timeout_seconds, "cache_ttl_seconds": cache_ttl_seconds}
+    reg.register(
+        ToolSpec(
+            name="query_balance",
+            description="查询账户余额",
+            handler=balance,
+            keywords=("查话费", "查余额", "余额", "话费"),
+            render=lambda d: f"您的账户余额为 {d['balance']} 元（截至 {d['as_of']}）。",
+            **common,
+        )
+    )
+    reg.register(
+        ToolSpec(
+            name="query_data_usage",
+            description="查询本月流量使用情况",
+            handler=data_usage,
+            keywords=("查流量", "流量还剩", "剩余流量", "流量用了"),
+            render=lambda d: (
+                f"您本月套餐内流量共 {d['total_gb']}GB，已使用 {d['used_gb']}GB，剩余 {d['remaining_gb']}GB。"
+            ),
+            **common,
+        )
+    )
+    reg.register(
+        ToolSpec(
+            name="query_orders",
+            description="查询最近订单与物流状态",
+            handler=orders,
+            keywords=("查订单", "物流", "订单"),
+            render=lambda d: (
+                "；".join(f"订单 {o['order_id']}（{o['item']}）当前状态：{o['status']}" for o in d["orders"]) + "。"
+                if d["orders"]
+                else "您近期没有订单。"
+            ),
+            **common,
+        )
+    )
+    reg.register(
+        ToolSpec(
+            name="query_bill",
+            description="查询月账单金额",
+            handler=bill,
+            parameters={
+                "type": "object",
+                "properties": {"month": {"type": "string", "description": "账单月份，YYYY-MM"}},
+            },
+            keywords=("账单", "详单"),
+            extract_args=_bill_month,
+            render=lambda d: f"您 {d['month']} 的账单金额为 {d['amount']} 元，详单可在营业厅小程序“账单查询”中查看。",
+            **common,
+        )
+    )
+    return reg
+
+
+def build_tool_registry(settings: Any, *, redis_client: Any = None) -> Optional[ToolRegistry]:
+    """TOOLS_BACKEND=mock 时返回本地 mock 注册表；为空时返回 None（TOOL 路由沿用 node_answer）。
+
+    mock 后端信任请求体里的 user_id，只用于联调与压测：APP_ENV=prod 时拒绝启用。
+    """
+    backend = (settings.tools_backend or "").strip().lower()
+    if not backend:
+        return None
+    if backend == "mock":
+        if (settings.app_env or "").strip().lower() in ("prod", "production"):
+            raise ValueError("TOOLS_BACKEND=mock trusts the unauthenticated user_id; not allowed with APP_ENV=prod")
+        return build_mock_registry(
+            redis_client=redis_client,
+            prefix=settings.redis_prefix,
+            timeout_seconds=settings.tool_timeout_seconds,
+            cache_ttl_seconds=settings.tool_cache_ttl_seconds,
+        )
+    raise ValueError(f"unknown TOOLS_BACKEND: {backend}")
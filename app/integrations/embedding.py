@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Any, Callable
+
+
+DEFAULT_EMBED_MODEL = "BAAI/bge-large-zh"
+# bge 检索指令前缀：建库与在线查询必须一致，否则向量空间不匹配
+BGE_QUERY_PREFIX = "为这个句子生成表示以用于检索相关文章："
+
+
+class STWrapper:
+    def __init__(self, model):
+        self.model = model
+
+    def encode_documents(self, texts):
+        texts = [f"{BGE_QUERY_PREFIX}{t}" for t in texts]
+        embeddings = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return embeddings.tolist() if hasattr(embeddings, 'tolist') else embeddings
+
+
+def load_embedder(model_name: str = DEFAULT_EMBED_MODEL, *, device: str | None = None) -> STWrapper:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    if device:
+        model = model.to(device)
+    elif torch.cuda.is_available():
+        model = model.to('cuda')
+    return STWrapper(model)
+
+
+def make_embed_texts(embedder: Any) -> Callable[[list[str]], list[list[float]]]:
+    def embed_texts(texts: list[str]) -> list[list[float]]:
+        vecs = embedder.encode_documents(texts)
+        return [list(map(float, v)) for v in vecs]
+
+    return embed_texts
@@ -0,0 +1,149 @@
+"""本机推理 sidecar（app.inference_server）的瘦客户端与线协议。
+
+一条 Unix domain socket 连接 = 一块共享内存：服务端在握手时为连接创建共享内存并告知名字，
+之后每个请求只在 socket 上传小的 JSON 头，向量/分数由服务端直接写进共享内存，客户端原地读取，
+避免大数组的序列化与拷贝。连接按线程复用（每个线程同一时刻只有一个在途请求）。
+
+帧格式：4 字节大端长度 + UTF-8 JSON。
+"""
+from __future__ import annotations
+
+import json
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+from app.core import metrics
+
+
+_LEN = struct.Struct(">I")
+# 单个请求最多的文本数；共享内存按 MAX_ITEMS * dim * 4 字节分配，客户端自动分块
+MAX_ITEMS = 256
+
+
+def send_msg(sock: socket.socket, obj: dict[str, Any]) -> None:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_LEN.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("inference sidecar closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def recv_msg(sock: socket.socket) -> dict[str, Any]:
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return json.loads(_recv_exact(sock, n))
+
+
+def attach_shm(name: str) -> shared_memory.SharedMemory:
+    """只读挂载对方创建的共享内存；不登记到本进程的 resource_tracker，避免退出时被误删。"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    except Exception:
+        pass
+    return shm
+
+
+class SidecarError(RuntimeError):
+    pass
+
+
+class _Conn:
+    def __init__(self, path: str, timeout: Optional[float]) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+            send_msg(self.sock, {"op": "hello"})
+            hello = recv_msg(self.sock)
+        except Exception:
+            self.sock.close()
+            raise
+        if not hello.get("ok"):
+            self.sock.close()
+            raise SidecarError(hello.get("error") or "handshake failed")
+        self.dim = int(hello["dim"])
+        self.max_items = int(hello.get("max_items") or MAX_ITEMS)
+        self.shm = attach_shm(hello["shm"])
+
+    def call(self, req: dict[str, Any]) -> tuple[dict[str, Any], memoryview]:
+        send_msg(self.sock, req)
+        resp = recv_msg(self.sock)
+        if not resp.get("ok"):
+            raise SidecarError(resp.get("error") or "inference failed")
+        return resp, self.shm.buf
+
+    def close(self) -> None:
+        try:
+            self.shm.close()
+        finally:
+            self.sock.close()
+
+
+class InferenceClient:
+    """embed/rerank 走本机 sidecar；与 make_embed_texts 返回的 embed_texts 同接口。"""
+
+    def __init__(self, socket_path: str, *, timeout: Optional[float] = 30.0) -> None:
+        self._path = socket_path
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self) -> _Conn:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _Conn(self._path, self._timeout)
+        return conn
+
+    def _call(self, req: dict[str, Any], n: int) -> list[list[float]]:
+        for attempt in (0, 1):
+            conn = self._conn()
+            try:
+                resp, buf = conn.call(req)
+                width = int(resp.get("width", 1))
+                flat = buf[: n * width * 4].cast("f")
+                try:
+                    return [list(flat[i * width : (i + 1) * width]) for i in range(n)]
+                finally:
+                    flat.release()
+            except (OSError, ConnectionError) as e:
+                # sidecar 重启过：丢弃旧连接重连一次
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise SidecarError(f"inference sidecar unavailable: {e}") from e
+        raise AssertionError("unreachable")
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        out: list[list[float]] = []
+        with metrics.stage("sidecar_embed"):
+            step = self._conn().max_items
+            for i in range(0, len(texts), step):
+                chunk = texts[i : i + step]
+                out.extend(self._call({"op": "embed", "texts": chunk}, len(chunk)))
+        return out
+
+    def rerank(self, query: str, docs: list[str]) -> list[float]:
+        """返回与 docs 一一对应的相关性分数（需 sidecar 加载了 reranker）。"""
+        scores: list[float] = []
+        with metrics.stage("sidecar_rerank"):
+            step = self._conn().max_items
+            for i in range(0, len(docs), step):
+                chunk = docs[i : i + step]
+                scores.extend(row[0] for row in self._call({"op": "rerank", "query": query, "docs": chunk}, len(chunk)))
+        return scores
+
+    def stats(self) -> dict[str, Any]:
+        conn = self._conn()
+        send_msg(conn.sock, {"op": "stats"})
+        return recv_msg(conn.sock)
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Optional
+import json
 import logging
+import threading
+import time
 
 from pymilvus import MilvusClient
 
+from app.core import metrics
+from app.core.limiter import Overloaded, guarded
+
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RetrievedDoc:
     id: int | str
     score: float
@@ -24,6 +31,77 @@ class RetrievedDoc:
             "question": self.question,
         }
 
+    def to_tool_json(self) -> str:
+        """回填给模型的工具结果条目，直接编码成 JSON 文本。"""
+        return json.dumps(
+            {"id": self.id, "score": self.score, "question": self.question, "knowledge": self.knowledge},
+            ensure_ascii=False,
+        )
+
+
+class DocCache:
+    """按知识 id 缓存 (question, knowledge) 的 LRU；ttl 兜底入库更新后的陈旧数据。"""
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 600.0) -> None:
+        self._max = max_size
+        self._ttl = ttl_seconds
+        self._data: OrderedDict[Any, tuple[float, Optional[str], str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, doc_id: Any) -> Optional[tuple[Optional[str], str]]:
+        with self._lock:
+            item = self._data.get(doc_id)
+            if item is None:
+                return None
+            expires, question, knowledge = item
+            if expires < time.monotonic():
+                del self._data[doc_id]
+                return None
+            self._data.move_to_end(doc_id)
+            return question, knowledge
+
+    def put(self, doc_id: Any, question: Optional[str], knowledge: str) -> None:
+        with self._lock:
+            self._data[doc_id] = (time.monotonic() + self._ttl, question, knowledge)
+            self._data.move_to_end(doc_id)
+            while len(self._data) > self._max:
+                self._data.popitem(last=False)
+
+    def invalidate(self, doc_ids: Optional[list[Any]] = None) -> None:
+        with self._lock:
+            if doc_ids is None:
+                self._data.clear()
+            else:
+                for i in doc_ids:
+                    self._data.pop(i, None)
+
+
+def _hit_fields(h: Any) -> tuple[float, dict[str, Any]]:
+    """兼容不同返回格式：Hit 对象 / dict，返回 (score, entity dict)。"""
+    if isinstance(h, dict):
+        score_val = h.get("distance", h.get("score", 0.0))
+        entity = h.get("entity") or h.get("fields") or h
+        if "id" not in entity and "id" in h:
+            entity = {**entity, "id": h["id"]}
+    else:
+        score_val = getattr(h, "distance", getattr(h, "score", 0.0))
+        entity = getattr(h, "entity", None) or {}
+
+    if hasattr(entity, "to_dict"):
+        try:
+            entity = entity.to_dict()
+        except Exception:
+            pass
+
+    if not isinstance(entity, dict):
+        # 最后兜底：尝试从属性读取
+        entity = {
+            "id": getattr(entity, "id", getattr(h, "id", None)),
+            "question": getattr(entity, "question", None),
+            "knowledge": getattr(entity, "knowledge", None),
+        }
+    return float(score_val), entity
+
 
 class MilvusRetriever:
     def __init__(
@@ -34,6 +112,15 @@ class MilvusRetriever:
         collection: str,
         embed_fn,
         top_k: int = 5,
+        timeout: float | None = None,
+        embed_limiter: Any = None,
+        search_limiter: Any = None,
+        two_phase: bool = True,
+        doc_cache: DocCache | None = None,
+        filter: str = "",
+        partition_names: list[str] | None = None,
+        metric_type: str = "",
+        search_params: dict[str, Any] | None = None,
     ) -> None:
         self._uri = uri
         self._token = token
@@ -41,68 +128,147 @@ class MilvusRetriever:
         self._collection = collection
         self._embed_fn = embed_fn
         self._top_k = top_k
+        self._timeout = timeout
+        self._embed_limiter = embed_limiter
+        self._search_limiter = search_limiter
+        # 两阶段：ANN 只取 id/距离，选中的 id 再批量取正文（走本地 LRU）
+        self._two_phase = two_phase
+        self._doc_cache = doc_cache if doc_cache is not None else DocCache()
+        # 默认标量过滤 / 分区（如业务类别、有效期），调用时可覆盖
+        self._filter = filter
+        self._partition_names = partition_names or None
+        # 如 HNSW {"ef": 64} / IVF {"nprobe": 16}；都为空时不传，由服务端按索引默认值检索
+        self._search_params: dict[str, Any] | None = None
+        if metric_type or search_params:
+            self._search_params = {"params": dict(search_params or {})}
+            if metric_type:
+                self._search_params["metric_type"] = metric_type
 
     def _get_client(self) -> MilvusClient:
         if self._client is None:
-            self._client = MilvusClient(uri=self._uri, token=self._token)
+            self._client = MilvusClient(uri=self._uri, token=self._token, timeout=self._timeout)
         return self._client
 
-    def retrieve(self, query: str) -> list[RetrievedDoc]:
+    @property
+    def doc_cache(self) -> DocCache:
+        return self._doc_cache
+
+    def retrieve(
+        self,
+        query: str,
+        *,
+        top_k: int | None = None,
+        filter: str | None = None,
+        partition_names: list[str] | None = None,
+    ) -> list[RetrievedDoc]:
+        """检索失败时返回 []；并发超限时抛 Overloaded，交给上层降级。
+
+        top_k 可能来自模型的 function call 参数，只能在 MILVUS_TOP_K 以内往小调。
+        """
+        limit = min(top_k, self._top_k) if top_k is not None and top_k > 0 else self._top_k
         try:
-            vec = self._embed_fn([query])[0]
+            with guarded(self._embed_limiter), metrics.stage("embed"):
+                vec = self._embed_fn([query])[0]
+        except Overloaded:
+            raise
         except Exception as e:
             logger.exception("MilvusRetriever embed failed: %s", e)
             return []
 
+        search_kwargs: dict[str, Any] = {}
+        expr = self._filter if filter is None else filter
+        if expr:
+            search_kwargs["filter"] = expr
+        partitions = partition_names or self._partition_names
+        if partitions:
+            search_kwargs["partition_names"] = partitions
+        if self._search_params:
+            search_kwargs["search_params"] = self._search_params
+
+        output_fields = ["id"] if self._two_phase else ["id", "question", "knowledge"]
         try:
             client = self._get_client()
-            res = client.search(
-                collection_name=self._collection,
-                data=[vec],
-                anns_field="question_emb",
-                limit=self._top_k,
-                output_fields=["id", "question", "knowledge"],
-            )
+            with guarded(self._search_limiter), metrics.stage("milvus_search"):
+                res = client.search(
+                    collection_name=self._collection,
+                    data=[vec],
+                    anns_field="question_emb",
+                    limit=limit,
+                    output_fields=output_fields,
+                    timeout=self._timeout,
+                    **search_kwargs,
+                )
+        except Overloaded:
+            raise
         except Exception as e:
             # 典型：gRPC DEADLINE_EXCEEDED / 网络不可达 / token/uri 错误
             logger.exception("MilvusRetriever search failed: %s", e)
             return []
 
-        docs: list[RetrievedDoc] = []
         # pymilvus search 返回二维 list：每个 query 对应一个 hits 列表
-        hits = res[0] if res else []
-        for h in hits:
-            # 兼容不同返回格式：Hit 对象 / dict
-            if isinstance(h, dict):
-                score_val = h.get("distance", h.get("score", 0.0))
-                entity = h.get("entity") or h.get("fields") or h
+        hits = [_hit_fields(h) for h in (res[0] if res else [])][:limit]
+        if not self._two_phase:
+            return [self._to_doc(score, entity) for score, entity in hits]
+        return self._hydrate(hits)
+
+    def _hydrate(self, hits: list[tuple[float, dict[str, Any]]]) -> list[RetrievedDoc]:
+        texts: dict[Any, tuple[Optional[str], str]] = {}
+        missing: list[Any] = []
+        for _, entity in hits:
+            kid = entity.get("id")
+            cached = self._doc_cache.get(kid)
+            metrics.record_cache("milvus_doc", cached is not None)
+            if cached is None:
+                missing.append(kid)
             else:
-                score_val = getattr(h, "distance", getattr(h, "score", 0.0))
-                entity = getattr(h, "entity", None) or {}
-
-            if hasattr(entity, "to_dict"):
-                try:
-                    entity = entity.to_dict()
-                except Exception:
-                    pass
-
-            if not isinstance(entity, dict):
-                # 最后兜底：尝试从属性读取
-                entity = {
-                    "id": getattr(entity, "id", None),
-                    "question": getattr(entity, "question", None),
-                    "knowledge": getattr(entity, "knowledge", None),
-                }
+                texts[kid] = cached
 
+        if missing:
+            try:
+                with guarded(self._search_limiter), metrics.stage("milvus_hydrate"):
+                    fetched = self.fetch_texts(missing)
+            except Overloaded:
+                raise
+            except Exception as e:
+                logger.exception("MilvusRetriever hydrate failed: %s", e)
+                fetched = {}
+            for kid, (q, kb) in fetched.items():
+                self._doc_cache.put(kid, q, kb)
+                texts[kid] = (q, kb)
+
+        docs: list[RetrievedDoc] = []
+        for score, entity in hits:
             kid = entity.get("id")
-            q = entity.get("question")
-            kb = entity.get("knowledge") or ""
-            docs.append(
-                RetrievedDoc(
-                    id=kid,
-                    score=float(score_val),
-                    question=q if isinstance(q, str) else None,
-                    knowledge=str(kb),
-                )
-            )
+            if kid not in texts:
+                # 正文取不到（刚被删除/查询失败）的命中不返回，避免给模型空知识
+                continue
+            q, kb = texts[kid]
+            docs.append(RetrievedDoc(id=kid, score=score, question=q, knowledge=kb))
         return docs
+
+    def fetch_texts(self, ids: list[Any]) -> dict[Any, tuple[Optional[str], str]]:
+        """按 id 直接从 Milvus 取 (question, knowledge)，不经过本地缓存；查不到的 id 不在结果里。"""
+        if not ids:
+            return {}
+        rows = self._get_client().query(
+            collection_name=self._collection,
+            ids=list(ids),
+            output_fields=["id", "question", "knowledge"],
+            timeout=self._timeout,
+        )
+        out: dict[Any, tuple[Optional[str], str]] = {}
+        for row in rows or []:
+            q = row.get("question")
+            out[row.get("id")] = (q if isinstance(q, str) else None, str(row.get("knowledge") or ""))
+        return out
+
+    @staticmethod
+    def _to_doc(score: float, entity: dict[str, Any]) -> RetrievedDoc:
+        q = entity.get("question")
+        kb = entity.get("knowledge") or ""
+        return RetrievedDoc(
+            id=entity.get("id"),
+            score=score,
+            question=q if isinstance(q, str) else None,
+            knowledge=str(kb),
+        )
@@ -1,11 +1,23 @@
 from __future__ import annotations
 
+import base64
+import json
+import uuid
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any, Iterable
+from typing import Any, Iterable, Iterator, Optional
 
 import psycopg2
-from psycopg2.extras import execute_values
+from psycopg2 import sql
+from psycopg2.extras import Json, execute_values
+
+from app.core import metrics
+
+
+TABLE = "chat_history"
+SCHEMA = "public"
+FAQ_TABLE = "faq_answers"
+FAQ_VERSIONS_TABLE = "faq_versions"
 
 
 @dataclass(frozen=True)
@@ -15,16 +27,256 @@ class ChatHistoryRow:
     message: str
     answer: str
     time: datetime
+    user_id: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class HistoryPage:
+    items: list[dict[str, Any]]
+    next_cursor: Optional[str]
+
+
+# ---------------- 分区 / 游标工具 ----------------
+
+def month_start(dt: datetime) -> datetime:
+    dt = dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    idx = month.year * 12 + (month.month - 1) + n
+    return month.replace(year=idx // 12, month=idx % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = json.dumps({"t": ts.isoformat(), "id": int(row_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """游标非法时抛 ValueError（由接口层转成 400）。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), int(data["id"])
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {e}") from e
+
+
+# 父表上的索引会自动建到每个分区：
+# - BRIN(time)：按时间追加写入，BRIN 只有几页，代替随数据无限增长的 btree；
+# - (conversation_id, time, id) / (user_id, time, id)：/history 的 keyset 翻页。
+# (conversation_id, request_id) 的唯一性只能按分区保证（父表唯一索引必须包含分区键 time），
+# 由 _ensure_partition 为每个分区单独建唯一索引，写入时直接插分区并 ON CONFLICT。
+# PG16 及以前分区不继承父表的 identity，直接插分区时 id 为 NULL，同样由 _ensure_partition 补默认值。
+_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    conversation_id uuid NOT NULL,
+    request_id text NOT NULL,
+    user_id text,
+    message text NOT NULL,
+    answer text NOT NULL,
+    time timestamp with time zone NOT NULL DEFAULT now()
+) PARTITION BY RANGE (time);
+CREATE INDEX IF NOT EXISTS {brin} ON {table} USING brin (time);
+CREATE INDEX IF NOT EXISTS {conv_idx} ON {table} (conversation_id, time, id);
+CREATE INDEX IF NOT EXISTS {user_idx} ON {table} (user_id, time, id) WHERE user_id IS NOT NULL;
+"""
 
 
 class PostgresStore:
     def __init__(self, dsn: str) -> None:
         self._dsn = dsn
+        # 本进程已确认存在的月分区，避免每次写入都执行 DDL
+        self._known_partitions: set[str] = set()
+        # 写入路径首次确认的表结构：True 为分区表，False 为尚未迁移的老表
+        self._partitioned: Optional[bool] = None
+
+    def _connect(self):
+        return psycopg2.connect(self._dsn)
+
+    @staticmethod
+    def _table() -> sql.Composed:
+        return sql.SQL("{}.{}").format(sql.Identifier(SCHEMA), sql.Identifier(TABLE))
+
+    # ---------------- schema / 分区维护 ----------------
+
+    def is_partitioned(self) -> Optional[bool]:
+        """表不存在返回 None；老的非分区表返回 False。"""
+        with self._connect() as conn, conn.cursor() as cur:
+            return self._is_partitioned(cur)
+
+    @staticmethod
+    def _is_partitioned(cur) -> Optional[bool]:
+        cur.execute(
+            "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = %s AND c.relname = %s",
+            (SCHEMA, TABLE),
+        )
+        row = cur.fetchone()
+        return None if row is None else row[0] == "p"
+
+    def ensure_schema(self, *, months_ahead: int = 2, now: Optional[datetime] = None) -> list[str]:
+        """建分区父表与索引，并确保当月到 months_ahead 个月后的分区存在。返回新建的分区名。"""
+        try:
+            with self._connect() as conn, conn.cursor() as cur:
+                return self._create_schema(cur, months_ahead=months_ahead, now=now)
+        except Exception:
+            self._known_partitions.clear()
+            raise
+
+    def _create_schema(self, cur, *, months_ahead: int, now: Optional[datetime]) -> list[str]:
+        if self._is_partitioned(cur) is False:
+            raise RuntimeError(
+                f"{SCHEMA}.{TABLE} exists but is not partitioned; "
+                "run python -m app.jobs.pg_partitions --migrate-legacy first"
+            )
+        ddl = sql.SQL(_DDL).format(
+            table=self._table(),
+            brin=sql.Identifier(f"{TABLE}_time_brin"),
+            conv_idx=sql.Identifier(f"{TABLE}_conv_time_idx"),
+            user_idx=sql.Identifier(f"{TABLE}_user_time_idx"),
+        )
+        first = month_start(now or datetime.now(timezone.utc))
+        created: list[str] = []
+        cur.execute(ddl)
+        for i in range(max(0, months_ahead) + 1):
+            if self._ensure_partition(cur, add_months(first, i)):
+                created.append(partition_name(add_months(first, i)))
+        return created
+
+    def _ensure_partition(self, cur, month: datetime) -> bool:
+        name = partition_name(month)
+        if name in self._known_partitions:
+            return False
+        part = sql.Identifier(SCHEMA, name)
+        cur.execute("SELECT to_regclass(%s)", (f"{SCHEMA}.{name}",))
+        exists = cur.fetchone()[0] is not None
+        if not exists:
+            cur.execute(
+                sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {part} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)"
+                ).format(part=part, table=self._table()),
+                (month, add_months(month, 1)),
+            )
+        cur.execute(
+            sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {idx} ON {part} (conversation_id, request_id)").format(
+                idx=sql.Identifier(f"{name}_conv_req_uq"), part=part
+            )
+        )
+        # PG17 起分区会继承 identity；更早的版本 id 没有默认值，让分区共用父表的 identity 序列
+        cur.execute(
+            "SELECT column_default IS NULL AND is_identity = 'NO' FROM information_schema.columns "
+            "WHERE table_schema = %s AND table_name = %s AND column_name = 'id'",
+            (SCHEMA, name),
+        )
+        if cur.fetchone()[0]:
+            cur.execute(
+                sql.SQL(
+                    "ALTER TABLE {part} ALTER COLUMN id SET DEFAULT nextval(pg_get_serial_sequence(%s, 'id'))"
+                ).format(part=part),
+                (f"{SCHEMA}.{TABLE}",),
+            )
+        self._known_partitions.add(name)
+        return not exists
+
+    def list_partitions(self) -> list[str]:
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "JOIN pg_namespace n ON n.oid = p.relnamespace "
+                "WHERE n.nspname = %s AND p.relname = %s ORDER BY c.relname",
+                (SCHEMA, TABLE),
+            )
+            return [r[0] for r in cur.fetchall()]
+
+    def drop_partitions_before(self, cutoff: datetime) -> list[str]:
+        """删除整月都早于 cutoff 所在月份的分区（DETACH 后 DROP，不影响在写的分区）。"""
+        limit = partition_name(month_start(cutoff))
+        prefix = f"{TABLE}_p"
+        dropped: list[str] = []
+        for name in self.list_partitions():
+            if not name.startswith(prefix) or name >= limit:
+                continue
+            with self._connect() as conn, conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL("ALTER TABLE {table} DETACH PARTITION {part}").format(
+                        table=self._table(), part=sql.Identifier(SCHEMA, name)
+                    )
+                )
+                cur.execute(sql.SQL("DROP TABLE {part}").format(part=sql.Identifier(SCHEMA, name)))
+            self._known_partitions.discard(name)
+            dropped.append(name)
+        return dropped
+
+    def migrate_legacy(self, *, legacy_name: str = f"{TABLE}_legacy", months_ahead: int = 2) -> int:
+        """把老的非分区 chat_history 改名为 legacy，建分区表并按月搬迁数据。返回搬迁行数。
+
+        改名与建分区表在同一个事务里，中途失败时 chat_history 仍是原来的老表；
+        搬迁按月各自提交，重跑时 ON CONFLICT 跳过已搬的行。
+        """
+        try:
+            with self._connect() as conn, conn.cursor() as cur:
+                if self._is_partitioned(cur) is False:
+                    cur.execute(
+                        sql.SQL("ALTER TABLE {table} RENAME TO {legacy}").format(
+                            table=self._table(), legacy=sql.Identifier(legacy_name)
+                        )
+                    )
+                self._create_schema(cur, months_ahead=months_ahead, now=None)
+        except Exception:
+            self._known_partitions.clear()
+            raise
+        self._partitioned = True
+        legacy = sql.Identifier(SCHEMA, legacy_name)
+
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT min(time), max(time) FROM {legacy}").format(legacy=legacy))
+            lo, hi = cur.fetchone()
+        if lo is None:
+            return 0
+
+        moved = 0
+        month, last = month_start(lo), month_start(hi)
+        while month <= last:
+            name = partition_name(month)
+            with self._connect() as conn, conn.cursor() as cur:
+                self._ensure_partition(cur, month)
+                cur.execute(
+                    sql.SQL(
+                        "INSERT INTO {part} (id, conversation_id, request_id, message, answer, time) "
+                        "SELECT id, conversation_id, request_id, message, answer, time FROM {legacy} "
+                        "WHERE time >= %s AND time < %s "
+                        "ON CONFLICT (conversation_id, request_id) DO NOTHING"
+                    ).format(part=sql.Identifier(SCHEMA, name), legacy=legacy),
+                    (month, add_months(month, 1)),
+                )
+                moved += cur.rowcount or 0
+            month = add_months(month, 1)
+
+        # 沿用老 id 后，把 identity 推到最大值之后，避免新行与老行 id 重复（keyset 依赖 (time, id) 唯一）
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), (SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+                ).format(table=self._table()),
+                (f"{SCHEMA}.{TABLE}",),
+            )
+        return moved
+
+    # ---------------- 写入 ----------------
 
     def persist_chat_history_from_messages(
         self, *, conversation_id: str, messages: list[dict[str, Any]]
     ) -> int:
-        """把 Redis messages(list) 写入 public.chat_history。
+        """把 Redis messages(list) 写入 public.chat_history 的月分区。
 
         约定：messages 里包含 user/assistant 两条，且共享相同 request_id。
         返回：成功插入的行数（遇到冲突会 DO NOTHING）。
@@ -41,6 +293,8 @@ class PostgresStore:
             content = str(m.get("content") or "")
             ts = m.get("ts")
             entry = grouped.setdefault(rid, {})
+            if m.get("user_id") and "user_id" not in entry:
+                entry["user_id"] = str(m["user_id"])
             if role == "user" and "message" not in entry:
                 entry["message"] = content
                 entry["user_ts"] = ts
@@ -70,31 +324,352 @@ class PostgresStore:
                     message=message,
                     answer=answer,
                     time=dt,
+                    user_id=entry.get("user_id"),
                 )
             )
 
         if not rows:
             return 0
 
+        # 按月分组，直接写目标分区：省掉父表的路由开销，ON CONFLICT 命中分区自己的唯一索引
+        by_month: dict[datetime, list[ChatHistoryRow]] = {}
+        for r in rows:
+            by_month.setdefault(month_start(r.time), []).append(r)
+
+        inserted = 0
+        try:
+            if not self._ensure_layout():
+                try:
+                    return self._insert_legacy(rows)
+                except psycopg2.Error:
+                    # 其他进程可能已执行 --migrate-legacy：老表的 ON CONFLICT 在分区父表上无法匹配唯一索引，
+                    # 重新确认一次表结构，已迁移就改写分区，不必重启
+                    self._partitioned = None
+                    if not self._ensure_layout():
+                        raise
+            inserted = self._insert_by_month(by_month)
+        except Exception:
+            # 事务回滚后本次新建的分区也不存在了，下次写入重新确认
+            self._known_partitions.clear()
+            raise
+        return inserted
+
+    def _ensure_layout(self) -> bool:
+        """写入路径只确认一次表结构：表不存在时直接建分区表；老的非分区表在迁移前照旧写老表。"""
+        if self._partitioned is None:
+            with self._connect() as conn, conn.cursor() as cur:
+                partitioned = self._is_partitioned(cur)
+                if partitioned is None:
+                    self._create_schema(cur, months_ahead=0, now=None)
+                    partitioned = True
+            self._partitioned = partitioned
+        return self._partitioned
+
+    def _detect_layout(self) -> Optional[bool]:
+        """读取路径只探测、不建表；表不存在时不缓存，交给写入路径去建。"""
+        with self._connect() as conn, conn.cursor() as cur:
+            partitioned = self._is_partitioned(cur)
+        if partitioned is not None:
+            self._partitioned = partitioned
+        return partitioned
+
+    def _has_user_col(self) -> bool:
+        if self._partitioned is None:
+            return self._detect_layout() is not False
+        return self._partitioned
+
+    def _user_col(self) -> sql.Composable:
+        return sql.SQL("user_id" if self._has_user_col() else "NULL")
+
+    def _insert_legacy(self, rows: list[ChatHistoryRow]) -> int:
+        # 老表没有 user_id 列，写法与分区改造前一致
         values: Iterable[tuple[Any, ...]] = (
             (r.conversation_id, r.request_id, r.message, r.answer, r.time) for r in rows
         )
-
-        sql = (
-            "INSERT INTO public.chat_history (conversation_id, request_id, message, answer, time) "
-            "VALUES %s "
-            "ON CONFLICT (conversation_id, request_id) DO NOTHING"
-        )
-
-        with psycopg2.connect(self._dsn) as conn:
+        with metrics.stage("postgres_flush"), self._connect() as conn:
             with conn.cursor() as cur:
                 execute_values(
                     cur,
-                    sql,
+                    sql.SQL(
+                        "INSERT INTO {table} (conversation_id, request_id, message, answer, time) "
+                        "VALUES %s "
+                        "ON CONFLICT (conversation_id, request_id) DO NOTHING"
+                    ).format(table=self._table()).as_string(cur),
                     values,
                     page_size=200,
-                    # conversation_id 列通常是 UUID；这里用显式 cast，兼容 text/uuid 两种列类型
                     template="(%s::uuid, %s, %s, %s, %s)",
                 )
                 inserted = cur.rowcount
         return int(inserted if inserted is not None else 0)
+
+    def _insert_by_month(self, by_month: dict[datetime, list[ChatHistoryRow]]) -> int:
+        inserted = 0
+        with metrics.stage("postgres_flush"), self._connect() as conn:
+            with conn.cursor() as cur:
+                for month, month_rows in by_month.items():
+                    self._ensure_partition(cur, month)
+                    values: Iterable[tuple[Any, ...]] = (
+                        (r.conversation_id, r.request_id, r.user_id, r.message, r.answer, r.time)
+                        for r in month_rows
+                    )
+                    execute_values(
+                        cur,
+                        sql.SQL(
+                            "INSERT INTO {part} (conversation_id, request_id, user_id, message, answer, time) "
+                            "VALUES %s "
+                            "ON CONFLICT (conversation_id, request_id) DO NOTHING"
+                        ).format(part=sql.Identifier(SCHEMA, partition_name(month))).as_string(cur),
+                        values,
+                        page_size=200,
+                        # conversation_id 列通常是 UUID；这里用显式 cast，兼容 text/uuid 两种列类型
+                        template="(%s::uuid, %s, %s, %s, %s, %s)",
+                    )
+                    inserted += cur.rowcount or 0
+        return int(inserted)
+
+    # ---------------- 读取 ----------------
+
+    def load_recent_turns(
+        self, conversation_id: str, *, limit: int, since: Optional[datetime] = None
+    ) -> list[dict[str, Any]]:
+        """会话最近 limit 轮（按时间正序），走 (conversation_id, time, id) 索引；since 用于分区裁剪。"""
+        query = sql.SQL(
+            "SELECT request_id, {user_col}, message, answer, time FROM {table} "
+            "WHERE conversation_id = %s::uuid {since} ORDER BY time DESC, id DESC LIMIT %s"
+        ).format(
+            table=self._table(),
+            user_col=self._user_col(),
+            since=sql.SQL("AND time >= %s" if since is not None else ""),
+        )
+        params: list[Any] = [str(uuid.UUID(str(conversation_id)))]
+        if since is not None:
+            params.append(since)
+        params.append(limit)
+
+        with metrics.stage("postgres_load_recent_turns"), self._connect() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+        return [
+            {"request_id": r[0], "user_id": r[1], "message": r[2], "answer": r[3], "time": r[4]}
+            for r in reversed(rows)
+        ]
+
+    def page_history(
+        self,
+        *,
+        conversation_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> HistoryPage:
+        """按 (time, id) 倒序的 keyset 翻页；cursor 为上一页返回的 next_cursor。
+
+        since/until 会下推为 time 条件，让 Postgres 只扫描相关月分区。
+        """
+        if not conversation_id and not user_id:
+            raise ValueError("conversation_id or user_id is required")
+
+        where: list[sql.Composable] = []
+        params: list[Any] = []
+        if conversation_id:
+            where.append(sql.SQL("conversation_id = %s::uuid"))
+            params.append(str(uuid.UUID(str(conversation_id))))
+        if user_id:
+            # 缓存的老表结构可能已过期（迁移由别的进程执行），报错前再确认一次
+            if not self._has_user_col() and not self._detect_layout():
+                raise ValueError(f"{TABLE} is not partitioned yet; user_id paging needs --migrate-legacy")
+            where.append(sql.SQL("user_id = %s"))
+            params.append(str(user_id))
+        if since is not None:
+            where.append(sql.SQL("time >= %s"))
+            params.append(since)
+        if until is not None:
+            where.append(sql.SQL("time < %s"))
+            params.append(until)
+        if cursor:
+            ts, row_id = decode_cursor(cursor)
+            where.append(sql.SQL("(time, id) < (%s, %s)"))
+            params.extend([ts, row_id])
+
+        query = sql.SQL(
+            "SELECT id, conversation_id::text, request_id, {user_col}, message, answer, time "
+            "FROM {table} WHERE {where} ORDER BY time DESC, id DESC LIMIT %s"
+        ).format(table=self._table(), user_col=self._user_col(), where=sql.SQL(" AND ").join(where))
+        # 多取一行判断是否还有下一页
+        params.append(limit + 1)
+
+        with metrics.stage("postgres_history"), self._connect() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+
+        items = [
+            {
+                "id": r[0],
+                "conversation_id": r[1],
+                "request_id": r[2],
+                "user_id": r[3],
+                "message": r[4],
+                "answer": r[5],
+                "time": r[6],
+            }
+            for r in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit and items:
+            last = items[-1]
+            next_cursor = encode_cursor(last["time"], last["id"])
+        return HistoryPage(items=items, next_cursor=next_cursor)
+
+    def iter_first_turn_questions(
+        self, *, since: Optional[datetime] = None, limit: Optional[int] = None, batch_size: int = 5000
+    ) -> Iterator[str]:
+        """每个会话的第一轮问题（按 time, id 最早的一行），服务端游标流式读取。
+
+        先在整个会话范围内取第一轮，再按第一轮自己的 time 过滤 since：
+        窗口开始前就开始的会话，其窗口内的后续追问不会被当成第一轮。
+        内层只看窗口内出现过的会话（走 (conversation_id, time, id) 索引），不必对全表做 DISTINCT。
+        """
+        query = sql.SQL(
+            "SELECT message FROM ("
+            "SELECT DISTINCT ON (conversation_id) message, time FROM {table} {active} "
+            "ORDER BY conversation_id, time, id"
+            ") first_turns {where} ORDER BY time DESC {limit}"
+        ).format(
+            table=self._table(),
+            active=(
+                sql.SQL("WHERE conversation_id IN (SELECT conversation_id FROM {table} WHERE time >= %s)").format(
+                    table=self._table()
+                )
+                if since is not None
+                else sql.SQL("")
+            ),
+            where=sql.SQL("WHERE time >= %s" if since is not None else ""),
+            limit=sql.SQL("LIMIT %s" if limit else ""),
+        )
+        params: list[Any] = []
+        if since is not None:
+            params.extend([since, since])
+        if limit:
+            params.append(int(limit))
+
+        with self._connect() as conn:
+            with conn.cursor(name="first_turns") as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                for (message,) in cur:
+                    if message:
+                        yield str(message)
+
+    # ---------------- 预计算答案（FAQ） ----------------
+
+    def ensure_faq_schema(self) -> None:
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(
+                    """
+                    CREATE TABLE IF NOT EXISTS {versions} (
+                        version bigint PRIMARY KEY,
+                        created_at timestamp with time zone NOT NULL DEFAULT now(),
+                        clusters integer NOT NULL,
+                        params jsonb NOT NULL DEFAULT '{{}}',
+                        active boolean NOT NULL DEFAULT false
+                    );
+                    CREATE TABLE IF NOT EXISTS {answers} (
+                        version bigint NOT NULL REFERENCES {versions} (version) ON DELETE CASCADE,
+                        cluster_id integer NOT NULL,
+                        question text NOT NULL,
+                        aliases text[] NOT NULL,
+                        answer text NOT NULL,
+                        citations jsonb NOT NULL,
+                        knowledge_hashes jsonb NOT NULL,
+                        volume integer NOT NULL,
+                        PRIMARY KEY (version, cluster_id)
+                    );
+                    """
+                ).format(
+                    versions=sql.Identifier(SCHEMA, FAQ_VERSIONS_TABLE),
+                    answers=sql.Identifier(SCHEMA, FAQ_TABLE),
+                )
+            )
+
+    def publish_faq(self, entries: list[dict[str, Any]], *, params: dict[str, Any], keep: int = 5) -> int:
+        """在一个事务里写入新版本并切换为 active；只保留最近 keep 个版本。返回新版本号。"""
+        version = int(datetime.now(timezone.utc).timestamp() * 1000)
+        versions = sql.Identifier(SCHEMA, FAQ_VERSIONS_TABLE)
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("INSERT INTO {versions} (version, clusters, params) VALUES (%s, %s, %s)").format(
+                    versions=versions
+                ),
+                (version, len(entries), Json(params)),
+            )
+            execute_values(
+                cur,
+                sql.SQL(
+                    "INSERT INTO {answers} (version, cluster_id, question, aliases, answer, citations, "
+                    "knowledge_hashes, volume) VALUES %s"
+                ).format(answers=sql.Identifier(SCHEMA, FAQ_TABLE)).as_string(cur),
+                [
+                    (
+                        version,
+                        e["cluster_id"],
+                        e["question"],
+                        list(e["aliases"]),
+                        e["answer"],
+                        Json(e["citations"]),
+                        Json(e["knowledge_hashes"]),
+                        e["volume"],
+                    )
+                    for e in entries
+                ],
+                page_size=200,
+            )
+            cur.execute(
+                sql.SQL("UPDATE {versions} SET active = (version = %s)").format(versions=versions), (version,)
+            )
+            cur.execute(
+                sql.SQL(
+                    "DELETE FROM {versions} WHERE version NOT IN "
+                    "(SELECT version FROM {versions} ORDER BY version DESC LIMIT %s)"
+                ).format(versions=versions),
+                (max(1, keep),),
+            )
+        return version
+
+    def load_faq(self) -> tuple[Optional[int], list[dict[str, Any]]]:
+        """当前 active 版本的全部条目；没有发布过（或表不存在）返回 (None, [])。"""
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (f"{SCHEMA}.{FAQ_VERSIONS_TABLE}",))
+            if cur.fetchone()[0] is None:
+                return None, []
+            cur.execute(
+                sql.SQL("SELECT version FROM {versions} WHERE active ORDER BY version DESC LIMIT 1").format(
+                    versions=sql.Identifier(SCHEMA, FAQ_VERSIONS_TABLE)
+                )
+            )
+            row = cur.fetchone()
+            if row is None:
+                return None, []
+            version = int(row[0])
+            cur.execute(
+                sql.SQL(
+                    "SELECT cluster_id, question, aliases, answer, citations, knowledge_hashes, volume "
+                    "FROM {answers} WHERE version = %s"
+                ).format(answers=sql.Identifier(SCHEMA, FAQ_TABLE)),
+                (version,),
+            )
+            entries = [
+                {
+                    "cluster_id": r[0],
+                    "question": r[1],
+                    "aliases": list(r[2] or []),
+                    "answer": r[3],
+                    "citations": r[4] or [],
+                    "knowledge_hashes": r[5] or {},
+                    "volume": r[6],
+                }
+                for r in cur.fetchall()
+            ]
+        return version, entries
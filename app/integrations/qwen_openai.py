@@ -2,18 +2,26 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 import json
-from typing import Any, Callable
+import time
+from typing import Any, Callable, Optional
 
 from openai import OpenAI
 
+from app.core import metrics
+from app.core.limiter import guarded
+
 
 @dataclass(frozen=True)
 class QwenClient:
     api_key: str
     base_url: str
+    # 单次请求超时（秒）；上游变慢时尽快释放 worker 线程
+    timeout: float = 30.0
+    # 可选 AdaptiveLimiter：超过并发上限时抛 Overloaded，不排队
+    limiter: Any = None
 
     def _client(self) -> OpenAI:
-        return OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout)
 
     def chat(
         self,
@@ -24,12 +32,14 @@ class QwenClient:
         max_tokens: int = 1024,
     ) -> str:
         client = self._client()
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
+        with guarded(self.limiter), metrics.stage("qwen_chat"):
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        metrics.record_usage(model, getattr(resp, "usage", None))
         return (resp.choices[0].message.content or "").strip()
 
     def chat_with_tools(
@@ -42,28 +52,54 @@ class QwenClient:
         temperature: float = 0.2,
         max_tokens: int = 1024,
         max_steps: int = 3,
+        answer_model: str | None = None,
+        max_tool_calls: int | None = None,
+        tool_choice: str = "auto",
+        transcript: Optional[list[dict[str, Any]]] = None,
+        on_step: Optional[Callable[[str, float], None]] = None,
     ) -> str:
         """最小工具调用（function calling）循环。
 
         - 如果模型返回 tool_calls：执行工具并把结果以 role=tool 回填，然后继续。
         - 如果模型返回 content：结束并返回 content。
+        - answer_model：拿到工具结果之后的步骤改用该模型（规划用小模型、作答用大模型）。
+        - max_tool_calls：累计工具调用数超过该值时放弃并返回 ""，由调用方决定是否升级模型。
+        - transcript：传入时作为工作消息列表，返回后其中是 messages + 已完成的工具轮次，
+          调用方升级模型时可以复用工具结果，不必重新执行工具。
+        - on_step：每次模型调用结束后回调 (实际使用的模型, 耗时秒)。
         """
         client = self._client()
-        work_msgs: list[dict[str, Any]] = list(messages)
-
-        for _ in range(max_steps):
-            resp = client.chat.completions.create(
-                model=model,
-                messages=work_msgs,
-                tools=tools,
-                tool_choice="auto",
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
+        work_msgs: list[dict[str, Any]] = transcript if transcript is not None else []
+        work_msgs.extend(messages)
+        tool_call_count = 0
+        # 指标标签只用已注册的工具名：模型可能编出任意函数名，直接拼进标签会撑爆时间序列
+        known_tools = {(t.get("function") or {}).get("name") for t in tools}
+
+        for step in range(max_steps):
+            step_model = answer_model if (answer_model and tool_call_count) else model
+            with guarded(self.limiter), metrics.stage(f"qwen_tool_step_{step}"):
+                t0 = time.perf_counter()
+                try:
+                    resp = client.chat.completions.create(
+                        model=step_model,
+                        messages=work_msgs,
+                        tools=tools,
+                        tool_choice=tool_choice,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                    )
+                finally:
+                    if on_step is not None:
+                        on_step(step_model, time.perf_counter() - t0)
+            metrics.record_usage(step_model, getattr(resp, "usage", None))
 
             msg = resp.choices[0].message
             tool_calls = getattr(msg, "tool_calls", None)
             if tool_calls:
+                tool_call_count += len(tool_calls)
+                if max_tool_calls is not None and tool_call_count > max_tool_calls:
+                    return ""
+
                 assistant_msg: dict[str, Any] = {
                     "role": "assistant",
                     "content": msg.content or "",
@@ -95,7 +131,9 @@ class QwenClient:
                         args = {}
 
                     try:
-                        result = tool_executor(fn.name, args)
+                        stage = f"tool_{fn.name}" if fn.name in known_tools else "tool_unknown"
+                        with metrics.stage(stage):
+                            result = tool_executor(fn.name, args)
                     except Exception as e:
                         result = {"error": str(e)}
 
@@ -103,7 +141,8 @@ class QwenClient:
                         {
                             "role": "tool",
                             "tool_call_id": tc.id,
-                            "content": json.dumps(result, ensure_ascii=False),
+                            # 工具可直接返回已编码好的 JSON 文本，避免再编码一遍
+                            "content": result if isinstance(result, str) else json.dumps(result, ensure_ascii=False),
                         }
                     )
                 continue
@@ -115,5 +154,7 @@ class QwenClient:
 
     def embed(self, *, model: str, texts: list[str]) -> list[list[float]]:
         client = self._client()
-        resp = client.embeddings.create(model=model, input=texts)
+        with metrics.stage("qwen_embed"):
+            resp = client.embeddings.create(model=model, input=texts)
+        metrics.record_usage(model, getattr(resp, "usage", None))
         return [list(map(float, d.embedding)) for d in resp.data]
@@ -2,29 +2,60 @@ from __future__ import annotations
 
 import json
 from dataclasses import dataclass
-from typing import Any, Optional
+from typing import Any, Optional, Union
 
 import redis
 
+from app.core import metrics
+
 
 @dataclass(frozen=True)
 class RedisKeys:
     prefix: str
     conversation_id: str
+    # True 时 conversation_id 用 {} 包裹成 hash tag，同一会话的所有 key 落在同一个 slot（Redis Cluster）
+    hash_tag: bool = False
+
+    @property
+    def base(self) -> str:
+        if self.hash_tag:
+            return f"{self.prefix}:chat:{{{self.conversation_id}}}"
+        return f"{self.prefix}:chat:{self.conversation_id}"
 
     @property
     def messages(self) -> str:
-        return f"{self.prefix}:chat:{self.conversation_id}:messages"
+        return f"{self.base}:messages"
 
     @property
     def req_ids(self) -> str:
-        return f"{self.prefix}:chat:{self.conversation_id}:req_ids"
+        return f"{self.base}:req_ids"
 
     def response(self, request_id: str) -> str:
-        return f"{self.prefix}:chat:{self.conversation_id}:resp:{request_id}"
+        return f"{self.base}:resp:{request_id}"
 
     def inflight(self, request_id: str) -> str:
-        return f"{self.prefix}:chat:{self.conversation_id}:inflight:{request_id}"
+        return f"{self.base}:inflight:{request_id}"
+
+    @property
+    def cold(self) -> str:
+        # 负缓存：Postgres 里也没有该会话，短时间内不再回源
+        return f"{self.base}:cold"
+
+
+@dataclass(frozen=True, slots=True)
+class HistoryMessage:
+    """进图的历史消息只需要 role/content：解码后立即丢掉 message_id/meta/citations 等字段。"""
+
+    role: str
+    content: str
+
+    @classmethod
+    def from_dict(cls, m: dict[str, Any]) -> "HistoryMessage":
+        return cls(role=str(m.get("role") or ""), content=str(m.get("content") or ""))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # 与 dict 消息同样的读取方式，路由/提示词拼接的代码两者通用
+        return getattr(self, key, default) if key in ("role", "content") else default
 
 
 SET_TTL_LUA = """
@@ -43,23 +74,78 @@ return vals
 """
 
 
+REHYDRATE_LUA = """
+-- KEYS[1] = messages_list_key
+-- KEYS[2] = req_ids_set_key
+-- ARGV[1] = ttl, ARGV[2] = 消息条数 n, ARGV[3..2+n] = 消息, 其余 = request_id
+-- 只在 messages 不存在时写入：并发的新一轮对话已写入的历史不会被覆盖
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+local n = tonumber(ARGV[2])
+for i = 3, 2 + n do
+  redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+for i = 3 + n, #ARGV do
+  redis.call('SADD', KEYS[2], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+if #ARGV > 2 + n then
+  redis.call('EXPIRE', KEYS[2], tonumber(ARGV[1]))
+end
+return 1
+"""
+
+
 class RedisMemory:
-    def __init__(self, client: redis.Redis, *, prefix: str, ttl_seconds: int) -> None:
+    def __init__(
+        self,
+        client: redis.Redis,
+        *,
+        prefix: str,
+        ttl_seconds: int,
+        hash_tag: bool = False,
+    ) -> None:
+        # 历史紧跟上一轮写入读取，副本延迟会漏掉最近一轮（回填也会误判会话为空），读写都走主节点
         self._r = client
         self._prefix = prefix
         self._ttl_seconds = ttl_seconds
+        self._hash_tag = hash_tag
 
     @classmethod
-    def from_url(cls, url: str, *, prefix: str, ttl_seconds: int) -> "RedisMemory":
-        client = redis.Redis.from_url(url, decode_responses=True)
-        return cls(client, prefix=prefix, ttl_seconds=ttl_seconds)
+    def from_url(
+        cls,
+        url: str,
+        *,
+        prefix: str,
+        ttl_seconds: int,
+        cluster: bool = False,
+        hash_tag: Optional[bool] = None,
+    ) -> "RedisMemory":
+        if not cluster:
+            client = redis.Redis.from_url(url, decode_responses=True)
+            return cls(client, prefix=prefix, ttl_seconds=ttl_seconds, hash_tag=bool(hash_tag))
+
+        from redis.cluster import RedisCluster
+
+        # Cluster 下多 key 脚本/UNLINK 要求同 slot，必须开启 hash tag
+        if hash_tag is False:
+            raise ValueError("hash_tag=False is not supported with cluster=True")
+        client = RedisCluster.from_url(url, decode_responses=True)
+        return cls(client, prefix=prefix, ttl_seconds=ttl_seconds, hash_tag=True)
+
+    @property
+    def client(self) -> redis.Redis:
+        return self._r
 
     def _keys(self, conversation_id: str) -> RedisKeys:
-        return RedisKeys(prefix=self._prefix, conversation_id=conversation_id)
+        return RedisKeys(prefix=self._prefix, conversation_id=conversation_id, hash_tag=self._hash_tag)
 
     def get_cached_response(self, conversation_id: str, request_id: str) -> Optional[dict[str, Any]]:
         k = self._keys(conversation_id).response(request_id)
-        raw = self._r.get(k)
+        with metrics.stage("redis_get_cached_response"):
+            raw = self._r.get(k)
+        metrics.record_cache("response", bool(raw))
         if not raw:
             return None
         return json.loads(raw)
@@ -67,51 +153,93 @@ class RedisMemory:
     def mark_inflight(self, conversation_id: str, request_id: str, *, ttl_seconds: int = 300) -> bool:
         """用 SET NX 做同一 request_id 的并发保护。"""
         k = self._keys(conversation_id).inflight(request_id)
-        return bool(self._r.set(k, "1", nx=True, ex=ttl_seconds))
+        with metrics.stage("redis_mark_inflight"):
+            return bool(self._r.set(k, "1", nx=True, ex=ttl_seconds))
 
     def clear_inflight(self, conversation_id: str, request_id: str) -> None:
         k = self._keys(conversation_id).inflight(request_id)
-        self._r.delete(k)
+        with metrics.stage("redis_clear_inflight"):
+            self._r.delete(k)
 
     def ensure_request_id_unique(self, conversation_id: str, request_id: str) -> bool:
         """返回 True 表示首次出现；False 表示重复。"""
         k = self._keys(conversation_id).req_ids
-        added = self._r.sadd(k, request_id)
-        if added:
-            self._r.eval(SET_TTL_LUA, 1, k, str(self._ttl_seconds))
+        with metrics.stage("redis_ensure_request_id_unique"):
+            added = self._r.sadd(k, request_id)
+            if added:
+                self._r.eval(SET_TTL_LUA, 1, k, str(self._ttl_seconds))
         return bool(added)
 
-    def append_messages(self, conversation_id: str, messages: list[dict[str, Any]]) -> None:
+    def append_messages(self, conversation_id: str, messages: list[Union[dict[str, Any], str]]) -> None:
+        """messages 可以是 dict，也可以是已编码好的 JSON 文本（原样写入）。"""
         k = self._keys(conversation_id).messages
-        payloads = [json.dumps(m, ensure_ascii=False) for m in messages]
+        payloads = [m if isinstance(m, str) else json.dumps(m, ensure_ascii=False) for m in messages]
         if payloads:
-            self._r.rpush(k, *payloads)
-            self._r.eval(SET_TTL_LUA, 1, k, str(self._ttl_seconds))
+            with metrics.stage("redis_append_messages"):
+                self._r.rpush(k, *payloads)
+                self._r.eval(SET_TTL_LUA, 1, k, str(self._ttl_seconds))
 
-    def get_recent_messages(self, conversation_id: str, limit: int = 20) -> list[dict[str, Any]]:
+    def get_recent_history(self, conversation_id: str, limit: int = 20) -> list[HistoryMessage]:
+        """最近 limit 条消息，逐条投影成 HistoryMessage，不留完整 dict。"""
         k = self._keys(conversation_id).messages
-        raw = self._r.lrange(k, -limit, -1)  # key 不存在 => []
-        return [json.loads(x) for x in raw]
+        with metrics.stage("redis_get_recent_messages"):
+            raw = self._r.lrange(k, -limit, -1)  # key 不存在 => []
+        return [HistoryMessage.from_dict(json.loads(x)) for x in raw]
 
     def get_all_messages(self, conversation_id: str) -> list[dict[str, Any]]:
         k = self._keys(conversation_id).messages
-        raw = self._r.lrange(k, 0, -1)  # key 不存在 => []
+        with metrics.stage("redis_get_all_messages"):
+            raw = self._r.lrange(k, 0, -1)  # key 不存在 => []
         return [json.loads(x) for x in raw]
 
+    def rehydrate_messages(self, conversation_id: str, messages: list[dict[str, Any]]) -> bool:
+        """把从 Postgres 恢复的历史原子写回 Redis；messages 已存在时不写，返回 False。"""
+        if not messages:
+            return False
+        keys = self._keys(conversation_id)
+        payloads = [json.dumps(m, ensure_ascii=False) for m in messages]
+        request_ids = sorted({str(m["request_id"]) for m in messages if m.get("request_id")})
+        with metrics.stage("redis_rehydrate_messages"):
+            written = self._r.eval(
+                REHYDRATE_LUA,
+                2,
+                keys.messages,
+                keys.req_ids,
+                str(self._ttl_seconds),
+                str(len(payloads)),
+                *payloads,
+                *request_ids,
+            )
+        return bool(written)
+
+    def is_cold(self, conversation_id: str) -> bool:
+        with metrics.stage("redis_is_cold"):
+            return bool(self._r.exists(self._keys(conversation_id).cold))
+
+    def mark_cold(self, conversation_id: str, *, ttl_seconds: int) -> None:
+        with metrics.stage("redis_mark_cold"):
+            self._r.set(self._keys(conversation_id).cold, "1", ex=max(1, ttl_seconds))
+
     def cache_response(self, conversation_id: str, request_id: str, response: dict[str, Any]) -> None:
         k = self._keys(conversation_id).response(request_id)
-        self._r.set(k, json.dumps(response, ensure_ascii=False), ex=self._ttl_seconds)
+        with metrics.stage("redis_cache_response"):
+            self._r.set(k, json.dumps(response, ensure_ascii=False), ex=self._ttl_seconds)
 
     def flush_and_delete(self, conversation_id: str) -> list[dict[str, Any]]:
         keys = self._keys(conversation_id)
-        raw = self._r.eval(FLUSH_AND_DELETE_LUA, 2, keys.messages, keys.req_ids)
+        with metrics.stage("redis_flush_and_delete"):
+            raw = self._r.eval(FLUSH_AND_DELETE_LUA, 2, keys.messages, keys.req_ids)
         return [json.loads(x) for x in raw]
 
     def delete_conversation(self, conversation_id: str) -> None:
         """删除该会话相关数据（messages/req_ids/resp/inflight）。"""
         keys = self._keys(conversation_id)
+        with metrics.stage("redis_delete_conversation"):
+            self._delete_conversation_keys(keys)
+
+    def _delete_conversation_keys(self, keys: RedisKeys) -> None:
         request_ids = list(self._r.smembers(keys.req_ids) or [])
-        delete_keys: list[str] = [keys.messages, keys.req_ids]
+        delete_keys: list[str] = [keys.messages, keys.req_ids, keys.cold]
         for request_id in request_ids:
             delete_keys.append(keys.response(request_id))
             delete_keys.append(keys.inflight(request_id))
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from app.core import metrics
+
+
+logger = logging.getLogger(__name__)
+
+RATELIMIT_REQUESTS = metrics.Counter(
+    "telecom_ratelimit_requests_total",
+    "令牌桶限流判定次数（result=allowed|rejected_ip|rejected_user|rejected_conversation|rejected_batch|error）",
+    ("result",),
+)
+
+
+TOKEN_BUCKET_LUA = """
+-- KEYS[i] = 第 i 个桶（hash：tokens, ts）
+-- ARGV[1] = cost；ARGV[2i] = 第 i 个桶每秒补充的令牌数，ARGV[2i+1] = 桶容量
+-- 所有桶都够才一起扣减，否则一个都不扣；返回 {是否放行, 需等待毫秒数, 不够的桶序号}
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local tokens = {}
+local wait_ms, which = 0, 0
+for i = 1, #KEYS do
+  local rate = tonumber(ARGV[2 * i])
+  local burst = tonumber(ARGV[2 * i + 1])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local tk = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  tk = math.min(burst, tk + math.max(0, now - ts) * rate / 1000)
+  tokens[i] = tk
+  if tk < cost then
+    local w = math.ceil((cost - tk) * 1000 / rate)
+    if w > wait_ms then
+      wait_ms, which = w, i
+    end
+  end
+end
+if which > 0 then
+  return {0, wait_ms, which}
+end
+for i = 1, #KEYS do
+  local rate = tonumber(ARGV[2 * i])
+  local burst = tonumber(ARGV[2 * i + 1])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i] - cost), 'ts', now)
+  -- 桶补满后 key 即可过期，不常来的用户不占内存
+  redis.call('PEXPIRE', KEYS[i], math.ceil(burst * 1000 / rate) + 1000)
+end
+return {1, 0, 0}
+"""
+
+
+@dataclass(frozen=True)
+class RateDecision:
+    allowed: bool
+    retry_after_seconds: float = 0.0
+    scope: str = ""  # 被哪个桶拒绝：ip | user | conversation；Redis 出错放行时为 error
+
+
+class RateLimiter:
+    """按来源 IP + 按用户 + 按会话的令牌桶（Redis 脚本原子判定，跨 worker 共享）。
+
+    用户桶与会话桶的 key 都用调用方标识做 hash tag，Cluster 下同 slot、一次脚本完成判定与扣减；
+    会话桶挡住同一会话的重试风暴，用户桶挡住不断换 request_id/conversation_id 的客户端。
+    user_id 来自请求体、未经认证：IP 桶（另一个 slot，先单独判定）挡住不断换 user_id 的客户端，
+    调用方标识由接口层拼上来源 IP，伪造别人的 user_id 也只会耗尽自己那份桶。
+    IP 桶放行而用户桶拒绝时，IP 桶的令牌照样扣掉（被拒的请求也算来源 IP 的流量）。
+    Redis 不可用时放行（限流不应成为新的故障点）。
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        prefix: str,
+        user_per_minute: float,
+        user_burst: int,
+        conversation_per_minute: float,
+        conversation_burst: int,
+        ip_per_minute: float = 0.0,
+        ip_burst: int = 1,
+        batch_items_per_minute: float = 0.0,
+        batch_burst: int = 1,
+    ) -> None:
+        self._r = client
+        self._prefix = prefix
+        self._ip = (ip_per_minute / 60.0, max(1, ip_burst))
+        self._batch = (batch_items_per_minute / 60.0, max(1, batch_burst))
+        self._user = (user_per_minute / 60.0, max(1, user_burst))
+        self._conv = (conversation_per_minute / 60.0, max(1, conversation_burst))
+
+    def _key(self, user_key: str, suffix: str) -> str:
+        return f"{self._prefix}:rl:{{{user_key}}}:{suffix}"
+
+    def check(
+        self,
+        user_key: str,
+        conversation_id: Optional[str] = None,
+        *,
+        ip: Optional[str] = None,
+        cost: int = 1,
+    ) -> RateDecision:
+        if ip and self._ip[0] > 0:
+            decision = self._take([("ip", self._key(f"ip:{ip}", "ip"), self._ip)], cost)
+            if not decision.allowed:
+                return decision
+
+        buckets: list[tuple[str, str, tuple[float, int]]] = []
+        if self._user[0] > 0:
+            buckets.append(("user", self._key(user_key, "user"), self._user))
+        if conversation_id and self._conv[0] > 0:
+            buckets.append(("conversation", self._key(user_key, f"conv:{conversation_id}"), self._conv))
+        decision = self._take(buckets, cost) if buckets else RateDecision(True)
+        if decision.allowed and decision.scope != "error":
+            RATELIMIT_REQUESTS.inc(result="allowed")
+        return decision
+
+    def check_batch(self, ip: str, items: int) -> RateDecision:
+        """批量接口按条数扣来源 IP 的 batch 桶（与 /chat 的桶分开，批量不会挤掉同 IP 的在线对话）。"""
+        if self._batch[0] <= 0:
+            return RateDecision(True)
+        decision = self._take([("batch", self._key(f"ip:{ip}", "batch"), self._batch)], max(1, items))
+        if decision.allowed and decision.scope != "error":
+            RATELIMIT_REQUESTS.inc(result="allowed")
+        return decision
+
+    def _take(self, buckets: list[tuple[str, str, tuple[float, int]]], cost: int) -> RateDecision:
+        argv: list[Any] = [cost]
+        for _, _, (rate, burst) in buckets:
+            argv.extend([repr(rate), burst])
+        try:
+            with metrics.stage("redis_ratelimit"):
+                allowed, wait_ms, which = self._r.eval(
+                    TOKEN_BUCKET_LUA, len(buckets), *[k for _, k, _ in buckets], *argv
+                )
+        except Exception as e:
+            logger.warning("rate limit check failed, allowing: %s", e)
+            RATELIMIT_REQUESTS.inc(result="error")
+            return RateDecision(True, scope="error")
+
+        if int(allowed):
+            return RateDecision(True)
+        scope = buckets[int(which) - 1][0]
+        RATELIMIT_REQUESTS.inc(result=f"rejected_{scope}")
+        return RateDecision(False, retry_after_seconds=int(wait_ms) / 1000.0, scope=scope)
+
+
+def build_rate_limiter(settings: Any, *, redis_client: Any) -> Optional[RateLimiter]:
+    """RATE_LIMIT_ENABLED=false 时返回 None。"""
+    if not settings.rate_limit_enabled:
+        return None
+    return RateLimiter(
+        redis_client,
+        prefix=settings.redis_prefix,
+        user_per_minute=settings.rate_limit_user_per_minute,
+        user_burst=settings.rate_limit_user_burst,
+        conversation_per_minute=settings.rate_limit_conversation_per_minute,
+        conversation_burst=settings.rate_limit_conversation_burst,
+        ip_per_minute=settings.rate_limit_ip_per_minute,
+        ip_burst=settings.rate_limit_ip_burst,
+        batch_items_per_minute=settings.rate_limit_batch_items_per_minute,
+        batch_burst=settings.batch_max_items,
+    )
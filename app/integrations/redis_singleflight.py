@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+import redis
+
+from app.core import metrics
+from app.core.utils import new_id
+
+
+logger = logging.getLogger(__name__)
+
+_PUNCT = set("，。！？、；：,.!?;:~～…\"'“”‘’（）()【】[] ")
+
+
+RELEASE_LOCK_LUA = """
+-- KEYS[1] = lock_key, ARGV[1] = 本次加锁的 token
+-- 只删自己的锁：执行超过 lock_ttl 后锁可能已过期并被新的执行者拿走
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def normalize_query(text: str) -> str:
+    """合并“同一个问题”的不同写法：全半角、大小写、空白与首尾标点。"""
+    t = unicodedata.normalize("NFKC", text or "").lower()
+    t = "".join(t.split())
+    return t.strip("".join(_PUNCT))
+
+
+@dataclass
+class _Call:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[dict[str, Any]] = None
+    error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """相同 key 的并发计算只执行一次，其余请求等待并共享结果。
+
+    - 进程内：同一 key 只有一个线程执行 fn，其余线程等待 Event。
+    - 跨 worker：进程内的执行者再用 Redis SET NX 抢锁；抢到的执行 fn 并把结果写入
+      短 TTL 的 result key 后 PUBLISH；没抢到的订阅频道等待，超时则自己执行兜底。
+
+    fn 的返回值必须可 JSON 序列化。
+    """
+
+    def __init__(
+        self,
+        client: Optional[redis.Redis],
+        *,
+        prefix: str,
+        lock_ttl_seconds: int = 60,
+        result_ttl_seconds: int = 5,
+        wait_timeout_seconds: float = 30.0,
+    ) -> None:
+        self._r = client
+        self._prefix = prefix
+        self._lock_ttl = lock_ttl_seconds
+        self._result_ttl = result_ttl_seconds
+        self._wait_timeout = wait_timeout_seconds
+        self._mu = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def _redis_key(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        # hash tag 保证 lock/result 在 Cluster 下同 slot
+        return f"{self._prefix}:sf:{{{digest}}}"
+
+    def do(self, key: str, fn: Callable[[], dict[str, Any]]) -> tuple[dict[str, Any], bool]:
+        """返回 (结果, 是否复用了他人的结果)。"""
+        with self._mu:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self._wait_timeout):
+                logger.warning("singleflight local wait timed out, computing locally")
+                return fn(), False
+            if call.error is not None:
+                raise call.error
+            return dict(call.result or {}), True
+
+        try:
+            call.result, shared = self._do_cluster(key, fn)
+            return call.result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._mu:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _do_cluster(self, key: str, fn: Callable[[], dict[str, Any]]) -> tuple[dict[str, Any], bool]:
+        if self._r is None:
+            return fn(), False
+
+        base = self._redis_key(key)
+        lock_key, result_key, channel = f"{base}:lock", f"{base}:result", f"{base}:done"
+        token = new_id()
+        try:
+            with metrics.stage("redis_singleflight_lock"):
+                acquired = bool(self._r.set(lock_key, token, nx=True, ex=self._lock_ttl))
+        except Exception as e:
+            logger.warning("singleflight lock failed, computing locally: %s", e)
+            return fn(), False
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    payload = json.dumps(result, ensure_ascii=False)
+                    pipe = self._r.pipeline(transaction=False)
+                    pipe.set(result_key, payload, ex=self._result_ttl)
+                    pipe.publish(channel, "1")
+                    pipe.execute()
+                except Exception as e:
+                    logger.warning("singleflight publish failed: %s", e)
+                return result, False
+            finally:
+                try:
+                    self._r.eval(RELEASE_LOCK_LUA, 1, lock_key, token)
+                except Exception:
+                    pass
+
+        shared = self._wait_remote(result_key, channel, lock_key)
+        if shared is not None:
+            return shared, True
+        return fn(), False
+
+    def _wait_remote(self, result_key: str, channel: str, lock_key: str) -> Optional[dict[str, Any]]:
+        assert self._r is not None
+        pubsub = self._r.pubsub(ignore_subscribe_messages=True)
+        try:
+            with metrics.stage("redis_singleflight_wait"):
+                # 先订阅再查结果，避免错过订阅前刚发出的通知
+                pubsub.subscribe(channel)
+                deadline = time.monotonic() + self._wait_timeout
+                while True:
+                    raw = self._r.get(result_key)
+                    if raw:
+                        return json.loads(raw)
+                    # 执行者已退出（失败/崩溃）且没有结果：交给调用方自己算
+                    if not self._r.exists(lock_key):
+                        raw = self._r.get(result_key)
+                        return json.loads(raw) if raw else None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning("singleflight remote wait timed out")
+                        return None
+                    pubsub.get_message(timeout=min(remaining, 1.0))
+        except Exception as e:
+            logger.warning("singleflight wait failed, computing locally: %s", e)
+            return None
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Callable
+
+from app.core import metrics
+from app.core.config import Settings
+
+
+LLM_SECONDS = metrics.Histogram(
+    "telecom_llm_seconds", "按用途/模型统计的大模型调用耗时（秒）", ("purpose", "model")
+)
+LLM_ESCALATIONS = metrics.Counter(
+    "telecom_llm_escalations_total", "小模型结果不可用而升级到大模型的次数", ("purpose", "reason")
+)
+
+
+class TieredLLM:
+    """按用途选模型：路由 / NO_RAG 追问 / 工具规划 / 最终作答。
+
+    小模型返回空内容，或工具调用次数超过 max_tool_calls 时，用大模型（qwen_chat_model）重做一次；
+    工具循环里已拿到的工具结果直接复用，只让大模型重做作答这一步。
+    """
+
+    def __init__(self, qwen: Any, settings: Settings) -> None:
+        self._qwen = qwen
+        self._large = settings.qwen_chat_model
+        self._models = {
+            "route": settings.qwen_route_model or self._large,
+            "followup": settings.qwen_followup_model or self._large,
+            "tool": settings.qwen_tool_model or self._large,
+            "answer": settings.qwen_answer_model or self._large,
+        }
+        self._max_tool_calls = settings.qwen_escalate_max_tool_calls
+
+    def model_for(self, purpose: str) -> str:
+        return self._models.get(purpose, self._large)
+
+    def chat(self, *, messages: list[dict[str, Any]], purpose: str = "answer") -> str:
+        model = self.model_for(purpose)
+        out = self._timed(purpose, model, lambda: self._qwen.chat(model=model, messages=messages))
+        if not out and model != self._large:
+            LLM_ESCALATIONS.inc(purpose=purpose, reason="empty")
+            out = self._timed(purpose, self._large, lambda: self._qwen.chat(model=self._large, messages=messages))
+        return out
+
+    def chat_with_tools(
+        self,
+        *,
+        messages: list[dict[str, Any]],
+        tools: list[dict[str, Any]],
+        tool_executor: Callable[[str, dict[str, Any]], Any],
+    ) -> str:
+        tool_model = self.model_for("tool")
+        answer_model = self.model_for("answer")
+        small = tool_model != self._large or answer_model != self._large
+
+        def observe(model: str, seconds: float) -> None:
+            # 每次调用按实际使用的模型计：拿到工具结果后的步骤跑在 answer_model 上
+            LLM_SECONDS.observe(seconds, purpose="tool", model=model)
+
+        transcript: list[dict[str, Any]] = []
+        out = self._qwen.chat_with_tools(
+            model=tool_model,
+            answer_model=answer_model,
+            messages=messages,
+            tools=tools,
+            tool_executor=tool_executor,
+            max_tool_calls=self._max_tool_calls if small else None,
+            transcript=transcript,
+            on_step=observe,
+        )
+        if not out and small:
+            # 空内容包括：小模型没给出答案 / 工具调用次数超限
+            LLM_ESCALATIONS.inc(purpose="tool", reason="empty_or_tool_limit")
+            if any(m.get("role") == "tool" for m in transcript):
+                # 工具已执行过（可能有副作用）：带着已有结果，大模型只做作答这一步，不再调工具
+                out = self._qwen.chat_with_tools(
+                    model=self._large,
+                    messages=transcript,
+                    tools=tools,
+                    tool_executor=tool_executor,
+                    max_steps=1,
+                    tool_choice="none",
+                    on_step=observe,
+                )
+            else:
+                out = self._qwen.chat_with_tools(
+                    model=self._large,
+                    messages=messages,
+                    tools=tools,
+                    tool_executor=tool_executor,
+                    on_step=observe,
+                )
+        return out
+
+    def _timed(self, purpose: str, model: str, fn: Callable[[], str]) -> str:
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - t0, purpose=purpose, model=model)
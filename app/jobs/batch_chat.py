@@ -0,0 +1,78 @@
+"""离线批量 /chat：读取 JSONL，按会话并行执行，结果流式写入 JSONL，可中断续跑。
+
+    python -m app.jobs.batch_chat --input requests.jsonl --output results.jsonl --concurrency 16
+
+输入每行：{"conversation_id"?: str, "request_id"?: str, "user_id"?: str, "message": str}
+输出每行：输入字段 + status/answer/route/citations/cached/timings_ms/elapsed_ms（失败时为 error）。
+重复执行同一命令会跳过 output 中已成功的 (conversation_id, request_id)。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from app.assembly import build_chat_service, create_backends
+from app.core.config import get_settings
+from app.services.batch import load_done, parse_jsonl, run_batch
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--input", required=True, help="JSONL 文件；- 表示 stdin")
+    ap.add_argument("--output", required=True)
+    ap.add_argument("--concurrency", type=int, default=8, help="同时执行的会话数")
+    ap.add_argument("--no-resume", action="store_true", help="忽略已有结果，覆盖 output")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    settings = get_settings()
+    backends = create_backends(settings)
+    service = build_chat_service(
+        settings=settings,
+        qwen=backends["qwen"],
+        retriever=backends["retriever"],
+        memory=backends["memory"],
+        limiters=backends["limiters"],
+        pg_store=backends["pg_store"],
+    )
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with src:
+        items = list(parse_jsonl(src))
+
+    done = set() if args.no_resume else load_done(args.output)
+    mode = "w" if args.no_resume else "a"
+    # 上次中断可能留下半行：先补换行，避免与新结果粘连
+    if mode == "a" and os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        with open(args.output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    t0 = time.perf_counter()
+    with open(args.output, mode, encoding="utf-8") as out:
+        if needs_newline:
+            out.write("\n")
+
+        def write(rec: dict) -> None:
+            out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            out.flush()
+
+        stats = run_batch(items, service, concurrency=args.concurrency, on_result=write, done=done)
+
+    elapsed = time.perf_counter() - t0
+    ran = stats.get("ok", 0) + stats.get("error", 0)
+    print(
+        f"ok={stats.get('ok', 0)} error={stats.get('error', 0)} skipped={stats.get('skipped', 0)} "
+        f"elapsed={elapsed:.1f}s ({ran / elapsed if elapsed > 0 else 0:.1f} turns/s)"
+    )
+    return 0 if not stats.get("error") else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
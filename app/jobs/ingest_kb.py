@@ -0,0 +1,437 @@
+"""知识库增量入库：xlsx/CSV/JSONL → Milvus qa_collection。
+
+    python -m app.jobs.ingest_kb --source kb.xlsx --workers 4
+
+流程：
+1. 流式读取源文件的 question/knowledge 两列（同一 question 以最后一行为准）。
+2. 主键由 question 派生（question_id），内容指纹 sha1(question, knowledge) 存在标量字段 content_hash；
+   用 query_iterator 只拉取库内 id/content_hash 比对：
+   - 未变化：跳过；
+   - 仅 knowledge 变化：复用库内向量，只 upsert 文本（question 没变，向量不变）；
+   - 新 question：多进程批量 embedding（与 STWrapper 相同的 bge 前缀）后分块 upsert。
+   同一问题在任何一次入库里都是同一个 id，两个入库任务同时跑也不会分配出重复 id。
+3. 源文件里已不存在的 question 对应的 id 分块删除（--no-delete 关闭）。
+4. 输出各阶段条数与吞吐。
+
+老集合（顺序 id、没有 content_hash）第一次运行时会自动加上 content_hash 字段，
+并把老行复用原向量搬到派生 id 上（只这一次需要读取 question/knowledge 全文）。
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+from app.core.config import get_settings
+from app.core.utils import knowledge_hash
+from app.integrations.embedding import DEFAULT_EMBED_MODEL, STWrapper, load_embedder
+
+
+logger = logging.getLogger(__name__)
+
+ANNS_FIELD = "question_emb"
+HASH_FIELD = "content_hash"
+
+
+def row_hash(question: str, knowledge: str) -> str:
+    return knowledge_hash(question, knowledge)
+
+
+def question_id(question: str) -> int:
+    """INT64 主键：sha1(question) 的前 60 位。"""
+    return int(hashlib.sha1(question.encode("utf-8")).hexdigest()[:15], 16)
+
+
+# ---------------- 源文件读取 ----------------
+
+def _iter_xlsx(path: str, sheet: str | None) -> Iterator[dict[str, Any]]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet else wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = [str(c or "").strip() for c in next(rows, ())]
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        wb.close()
+
+
+def _iter_csv(path: str) -> Iterator[dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def _iter_jsonl(path: str) -> Iterator[dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_source(
+    path: str, *, question_col: str, knowledge_col: str, sheet: str | None = None
+) -> Iterator[tuple[str, str]]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        rows: Iterable[dict[str, Any]] = _iter_xlsx(path, sheet)
+    elif ext == ".csv":
+        rows = _iter_csv(path)
+    elif ext in (".jsonl", ".ndjson"):
+        rows = _iter_jsonl(path)
+    else:
+        raise ValueError(f"unsupported source type: {ext}")
+
+    for row in rows:
+        q = str(row.get(question_col) or "").strip()
+        k = str(row.get(knowledge_col) or "").strip()
+        if q:
+            yield q, k
+
+
+# ---------------- 多进程 embedding ----------------
+
+_worker_embedder: STWrapper | None = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _worker_embedder
+    import torch
+
+    torch.set_num_threads(max(1, threads))
+    _worker_embedder = load_embedder(model_name)
+
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    assert _worker_embedder is not None
+    return [list(map(float, v)) for v in _worker_embedder.encode_documents(texts)]
+
+
+def _batches(items: list[Any], size: int) -> Iterator[list[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+# ---------------- 主流程 ----------------
+
+@dataclass
+class IngestReport:
+    source_rows: int = 0
+    unchanged: int = 0
+    text_only: int = 0
+    migrated: int = 0
+    embedded: int = 0
+    deleted: int = 0
+    timings: dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        total = sum(self.timings.values()) or 1e-9
+        embed_s = self.timings.get("embed_upsert", 0.0) or 1e-9
+        return (
+            f"source={self.source_rows} unchanged={self.unchanged} text_only={self.text_only} "
+            f"migrated={self.migrated} "
+            f"embedded={self.embedded} deleted={self.deleted} | "
+            + " ".join(f"{k}={v:.1f}s" for k, v in self.timings.items())
+            + f" | {self.source_rows / total:.0f} rows/s overall, {self.embedded / embed_s:.0f} embeds/s"
+        )
+
+
+def _iter_query(client, collection: str, *, filter: str, output_fields: list[str], batch_size: int):
+    it = client.query_iterator(
+        collection_name=collection, batch_size=batch_size, filter=filter, output_fields=output_fields
+    )
+    try:
+        while True:
+            batch = it.next()
+            if not batch:
+                break
+            yield from batch
+    finally:
+        it.close()
+
+
+def _ensure_hash_field(client, collection: str, *, create: bool) -> bool:
+    """集合是否有 content_hash 字段；create=True 时缺失则加上（可空，老行为 NULL）。"""
+    fields = {f.get("name") for f in client.describe_collection(collection_name=collection).get("fields", [])}
+    if HASH_FIELD in fields:
+        return True
+    if not create:
+        return False
+    from pymilvus import DataType
+
+    logger.info("adding scalar field %s to %s", HASH_FIELD, collection)
+    client.add_collection_field(
+        collection_name=collection,
+        field_name=HASH_FIELD,
+        data_type=DataType.VARCHAR,
+        max_length=64,
+        nullable=True,
+    )
+    return True
+
+
+def _load_existing(client, collection: str, batch_size: int) -> dict[int, str]:
+    """id -> content_hash；只读这两个标量字段。"""
+    rows = _iter_query(
+        client,
+        collection,
+        filter=f"{HASH_FIELD} IS NOT NULL",
+        output_fields=["id", HASH_FIELD],
+        batch_size=batch_size,
+    )
+    return {int(r["id"]): str(r[HASH_FIELD]) for r in rows}
+
+
+def _load_legacy(client, collection: str, batch_size: int, *, has_hash_field: bool) -> dict[str, int]:
+    """还没有 content_hash 的老行：question -> 老 id。迁移完成后结果为空。"""
+    rows = _iter_query(
+        client,
+        collection,
+        filter=f"{HASH_FIELD} IS NULL" if has_hash_field else "",
+        output_fields=["id", "question"],
+        batch_size=batch_size,
+    )
+    return {str(r.get("question") or "").strip(): int(r["id"]) for r in rows}
+
+
+def rebuild_index(client, collection: str, *, index_type: str, metric_type: str, params: dict[str, Any]) -> None:
+    """按 Settings 里的索引类型/参数重建 question_emb 索引。
+
+    Milvus 要求先 release 才能删改索引：从 release 到重新 load 完成之前，线上检索不可用
+    （/chat 拿到空上下文），只应在维护窗口执行。
+    """
+    client.release_collection(collection_name=collection)
+    for name in client.list_indexes(collection_name=collection, field_name=ANNS_FIELD):
+        client.drop_index(collection_name=collection, index_name=name)
+    index_params = client.prepare_index_params()
+    index_params.add_index(
+        field_name=ANNS_FIELD,
+        index_name=ANNS_FIELD,
+        index_type=index_type,
+        metric_type=metric_type,
+        params=params,
+    )
+    client.create_index(collection_name=collection, index_params=index_params)
+    client.load_collection(collection_name=collection)
+
+
+def ingest(
+    *,
+    source: str,
+    question_col: str = "question",
+    knowledge_col: str = "knowledge",
+    sheet: str | None = None,
+    model_name: str = DEFAULT_EMBED_MODEL,
+    workers: int = 2,
+    embed_batch: int = 256,
+    upsert_chunk: int = 500,
+    delete_missing: bool = True,
+    max_delete_ratio: float = 0.5,
+    dry_run: bool = False,
+    reindex: bool = False,
+) -> IngestReport:
+    from pymilvus import MilvusClient
+
+    settings = get_settings()
+    collection = settings.milvus_collection
+    client = MilvusClient(uri=settings.milvus_uri, token=settings.milvus_token)
+    rep = IngestReport()
+
+    t0 = time.perf_counter()
+    src: dict[str, str] = {}
+    for q, k in iter_source(source, question_col=question_col, knowledge_col=knowledge_col, sheet=sheet):
+        rep.source_rows += 1
+        src[q] = k
+    rep.timings["read"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    has_hash_field = _ensure_hash_field(client, collection, create=not dry_run)
+    existing = _load_existing(client, collection, batch_size=upsert_chunk * 2) if has_hash_field else {}
+    legacy = _load_legacy(client, collection, batch_size=upsert_chunk * 2, has_hash_field=has_hash_field)
+    rep.timings["scan"] = time.perf_counter() - t0
+
+    to_embed: list[tuple[int, str, str]] = []
+    # (向量来源 id, 写入 id, question, knowledge)：仅 knowledge 变化时两者相同，老行迁移时来源为老 id
+    reuse: list[tuple[int, int, str, str]] = []
+    moved_ids: list[int] = []
+    for q, k in src.items():
+        qid = question_id(q)
+        if qid in existing:
+            if existing[qid] == row_hash(q, k):
+                rep.unchanged += 1
+            else:
+                reuse.append((qid, qid, q, k))
+        elif q in legacy:
+            reuse.append((legacy[q], qid, q, k))
+            moved_ids.append(legacy[q])
+        else:
+            to_embed.append((qid, q, k))
+    src_ids = {question_id(q) for q in src}
+    stale_ids = [i for i in existing if i not in src_ids] + [i for q, i in legacy.items() if q not in src]
+
+    total = len(existing) + len(legacy)
+    if delete_missing and total and len(stale_ids) > max_delete_ratio * total:
+        raise RuntimeError(
+            f"refusing to delete {len(stale_ids)}/{total} rows; "
+            "check the source file or raise --max-delete-ratio"
+        )
+
+    logger.info(
+        "plan: embed=%d text_only=%d migrate=%d unchanged=%d delete=%d",
+        len(to_embed), len(reuse) - len(moved_ids), len(moved_ids), rep.unchanged,
+        len(stale_ids) if delete_missing else 0,
+    )
+    if dry_run:
+        rep.embedded, rep.text_only, rep.migrated = len(to_embed), len(reuse) - len(moved_ids), len(moved_ids)
+        rep.deleted = len(stale_ids) if delete_missing else 0
+        return rep
+
+    # 仅 knowledge 变化 / 老行迁移：取回原向量，和新文本一起 upsert
+    t0 = time.perf_counter()
+    for chunk in _batches(reuse, upsert_chunk):
+        got = client.get(
+            collection_name=collection, ids=[src_id for src_id, _, _, _ in chunk], output_fields=[ANNS_FIELD]
+        )
+        vecs = {int(r["id"]): r[ANNS_FIELD] for r in got}
+        rows: list[dict[str, Any]] = []
+        moved: list[int] = []
+        for src_id, i, q, k in chunk:
+            if src_id not in vecs:
+                # 扫描之后被删掉了（或并发写入）：没有向量可复用，改为重新 embed
+                to_embed.append((i, q, k))
+                continue
+            rows.append(
+                {
+                    "id": i,
+                    "question": q,
+                    "knowledge": k,
+                    HASH_FIELD: row_hash(q, k),
+                    ANNS_FIELD: list(map(float, vecs[src_id])),
+                }
+            )
+            if src_id != i:
+                moved.append(src_id)
+        if rows:
+            client.upsert(collection_name=collection, data=rows)
+        # 老 id 上的行已搬到派生 id，无论是否 --no-delete 都要删掉，否则检索会召回两份；
+        # 只删确实 upsert 过的，否则这条 question 会从库里消失
+        if moved:
+            client.delete(collection_name=collection, ids=moved)
+        rep.migrated += len(moved)
+        rep.text_only += len(rows) - len(moved)
+    rep.timings["text_upsert"] = time.perf_counter() - t0
+
+    # 新 question：按批分发到进程池，按完成顺序分块 upsert
+    t0 = time.perf_counter()
+    batches = list(_batches(to_embed, embed_batch))
+    pending: list[dict[str, Any]] = []
+
+    def flush(force: bool = False) -> None:
+        nonlocal pending
+        while pending and (force or len(pending) >= upsert_chunk):
+            chunk, pending = pending[:upsert_chunk], pending[upsert_chunk:]
+            client.upsert(collection_name=collection, data=chunk)
+
+    def consume(batch: list[tuple[int, str, str]], vecs: list[list[float]]) -> None:
+        for (i, q, k), v in zip(batch, vecs):
+            pending.append({"id": i, "question": q, "knowledge": k, HASH_FIELD: row_hash(q, k), ANNS_FIELD: v})
+        rep.embedded += len(batch)
+        flush()
+
+    if batches:
+        if workers > 0:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(model_name, threads)
+            ) as pool:
+                texts = ([q for _, q, _ in b] for b in batches)
+                for batch, vecs in zip(batches, pool.map(_embed_batch, texts)):
+                    consume(batch, vecs)
+        else:
+            embedder = load_embedder(model_name)
+            for batch in batches:
+                vecs = [list(map(float, v)) for v in embedder.encode_documents([q for _, q, _ in batch])]
+                consume(batch, vecs)
+    flush(force=True)
+    rep.timings["embed_upsert"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if delete_missing:
+        for chunk in _batches(stale_ids, upsert_chunk):
+            client.delete(collection_name=collection, ids=chunk)
+            rep.deleted += len(chunk)
+    rep.timings["delete"] = time.perf_counter() - t0
+
+    if reindex:
+        t0 = time.perf_counter()
+        rebuild_index(
+            client,
+            collection,
+            index_type=settings.milvus_index_type,
+            metric_type=settings.milvus_metric_type or "COSINE",
+            params=settings.milvus_index_params,
+        )
+        rep.timings["reindex"] = time.perf_counter() - t0
+    return rep
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--source", required=True, help=".xlsx / .csv / .jsonl")
+    ap.add_argument("--sheet", default=None)
+    ap.add_argument("--question-col", default="question")
+    ap.add_argument("--knowledge-col", default="knowledge")
+    ap.add_argument("--model", default=DEFAULT_EMBED_MODEL)
+    ap.add_argument("--workers", type=int, default=2, help="embedding 进程数；0 表示在当前进程内计算")
+    ap.add_argument("--embed-batch", type=int, default=256)
+    ap.add_argument("--upsert-chunk", type=int, default=500)
+    ap.add_argument("--no-delete", action="store_true", help="不删除源文件中已不存在的行")
+    ap.add_argument("--max-delete-ratio", type=float, default=0.5, help="删除比例超过该值时中止（防误删）")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="入库后按 MILVUS_INDEX_TYPE/MILVUS_INDEX_PARAMS/MILVUS_METRIC_TYPE 重建向量索引",
+    )
+    ap.add_argument(
+        "--i-know-this-releases",
+        action="store_true",
+        help="确认 --rebuild-index 会 release 线上集合，重建并重新 load 完成前检索不可用",
+    )
+    args = ap.parse_args(argv)
+    if args.rebuild_index and not args.i_know_this_releases and not args.dry_run:
+        ap.error(
+            "--rebuild-index releases the serving collection; retrieval is down until the new index "
+            "is built and loaded. Re-run with --i-know-this-releases during a maintenance window."
+        )
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    rep = ingest(
+        source=args.source,
+        question_col=args.question_col,
+        knowledge_col=args.knowledge_col,
+        sheet=args.sheet,
+        model_name=args.model,
+        workers=args.workers,
+        embed_batch=args.embed_batch,
+        upsert_chunk=args.upsert_chunk,
+        delete_missing=not args.no_delete,
+        max_delete_ratio=args.max_delete_ratio,
+        dry_run=args.dry_run,
+        reindex=args.rebuild_index,
+    )
+    print(rep.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
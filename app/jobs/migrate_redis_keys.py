@@ -0,0 +1,138 @@
+"""把会话 key 从旧布局迁移到 hash tag 布局（Redis Cluster 前置步骤）。
+
+    旧：{prefix}:chat:<conversation_id>:messages
+    新：{prefix}:chat:{<conversation_id>}:messages
+
+    # 单机原地迁移（先 --dry-run 看数量）
+    python -m app.jobs.migrate_redis_keys --source-url redis://localhost:6379/0 --dry-run
+    # 迁到 Cluster
+    python -m app.jobs.migrate_redis_keys --source-url redis://old:6379/0 \\
+        --target-url redis://cluster-node:6379 --target-cluster --delete-source
+
+用 DUMP/RESTORE 搬运并保留剩余 TTL，因此 list/set/string 等类型都能原样迁移。
+新布局中已存在的 key 不会被覆盖（计为 conflicts）。
+建议在低峰期先跑一遍本脚本，再以 REDIS_HASH_TAGS=true（或 REDIS_CLUSTER=true）发布应用，
+发布后再跑一遍补齐窗口期内旧布局写入的 key。
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from dataclasses import dataclass
+
+import redis
+
+
+logger = logging.getLogger(__name__)
+
+
+def new_key_for(old_key: str, prefix: str) -> str | None:
+    """旧布局 key -> 新布局 key；已是新布局或不认识的 key 返回 None。"""
+    head = f"{prefix}:chat:"
+    if not old_key.startswith(head):
+        return None
+    rest = old_key[len(head):]
+    if rest.startswith("{"):
+        return None
+    conversation_id, sep, suffix = rest.partition(":")
+    if not sep or not conversation_id:
+        return None
+    return f"{head}{{{conversation_id}}}:{suffix}"
+
+
+@dataclass
+class MigrationReport:
+    scanned: int = 0
+    migrated: int = 0
+    skipped: int = 0
+    expired: int = 0
+    conflicts: int = 0
+
+
+def migrate(
+    source: redis.Redis,
+    target,
+    *,
+    prefix: str,
+    delete_source: bool = False,
+    dry_run: bool = False,
+    scan_count: int = 1000,
+) -> MigrationReport:
+    rep = MigrationReport()
+    for raw_key in source.scan_iter(match=f"{prefix}:chat:*", count=scan_count):
+        old_key = raw_key.decode("utf-8") if isinstance(raw_key, bytes) else raw_key
+        rep.scanned += 1
+        new_key = new_key_for(old_key, prefix)
+        if new_key is None:
+            rep.skipped += 1
+            continue
+        if dry_run:
+            rep.migrated += 1
+            continue
+
+        pipe = source.pipeline(transaction=False)
+        pipe.dump(old_key)
+        pipe.pttl(old_key)
+        payload, pttl = pipe.execute()
+        if payload is None:
+            rep.expired += 1
+            continue
+
+        # pttl: -1 无过期；-2 已不存在
+        if pttl == -2:
+            rep.expired += 1
+            continue
+        try:
+            # 不覆盖：新布局里已有的 key 是应用切换后写入的更新数据
+            target.restore(new_key, int(pttl) if pttl > 0 else 0, payload)
+        except redis.ResponseError as e:
+            if "BUSYKEY" not in str(e):
+                raise
+            rep.conflicts += 1
+            continue
+        if delete_source:
+            source.unlink(old_key)
+        rep.migrated += 1
+        if rep.migrated % 10000 == 0:
+            logger.info("migrated %d keys", rep.migrated)
+    return rep
+
+
+def main(argv: list[str] | None = None) -> int:
+    from app.core.config import get_settings
+
+    settings = get_settings()
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--source-url", default=settings.redis_url)
+    ap.add_argument("--target-url", default="", help="为空则原地迁移到 source")
+    ap.add_argument("--target-cluster", action="store_true", help="target 是 Redis Cluster")
+    ap.add_argument("--prefix", default=settings.redis_prefix)
+    ap.add_argument("--delete-source", action="store_true", help="迁移成功后删除旧 key")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # DUMP 返回二进制，必须关闭 decode_responses
+    source = redis.Redis.from_url(args.source_url, decode_responses=False)
+    if not args.target_url:
+        target = source
+    elif args.target_cluster:
+        from redis.cluster import RedisCluster
+
+        target = RedisCluster.from_url(args.target_url, decode_responses=False)
+    else:
+        target = redis.Redis.from_url(args.target_url, decode_responses=False)
+
+    rep = migrate(
+        source, target, prefix=args.prefix, delete_source=args.delete_source, dry_run=args.dry_run
+    )
+    print(
+        f"scanned={rep.scanned} migrated={rep.migrated} skipped={rep.skipped} "
+        f"expired={rep.expired} conflicts={rep.conflicts}"
+        + (" (dry-run)" if args.dry_run else "")
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,232 @@
+"""高频问题挖掘：从 chat_history 聚类首轮问题，为头部问题预生成答案并发布为新版本。
+
+    python -m app.jobs.mine_faq --days 90 --top 200 --dry-run --output faq_preview.jsonl
+    python -m app.jobs.mine_faq --days 90 --top 200
+
+流程：
+1. 取近 --days 天每个会话的第一轮问题（追问依赖上下文，不参与），按 normalize_query 归并计数；
+2. 用线上同一个 embedding 模型向量化，按频次从高到低做贪心聚类（与已有簇代表问题余弦 >= --threshold 归入该簇）；
+3. 按簇内总频次取前 --top 个簇，用代表问题走正常的对话图（路由 → 检索 → 作答）重新生成答案，
+   只保留走了 RAG 且有引用的答案，并记录被引用知识的内容指纹；
+4. 事务内写入 faq_answers/faq_versions 并切换为 active；服务按 FAQ_REFRESH_SECONDS 自动加载。
+
+线上按归一化问题精确匹配：簇里与代表问题余弦 >= --alias-threshold 的写法才作为别名，
+阈值比聚类更严，避免把“相似但不同”的问题答成同一个答案。知识库更新后，引用的知识指纹不一致的条目会被服务丢弃。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+from app.assembly import build_rag_graph, create_backends, make_embed_fn
+from app.core.config import get_settings
+from app.core.utils import knowledge_hash
+from app.integrations.redis_singleflight import normalize_query
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Cluster:
+    cluster_id: int
+    question: str  # 代表问题：簇内频次最高的写法
+    volume: int = 0
+    aliases: list[str] = field(default_factory=list)
+
+
+def count_questions(questions: Iterable[str], *, min_len: int = 2, max_len: int = 200) -> list[tuple[str, int]]:
+    """按归一化问题计数，返回 (最常见的原始写法, 次数)，按次数降序。"""
+    counts: Counter[str] = Counter()
+    surface: dict[str, Counter[str]] = {}
+    for q in questions:
+        q = q.strip()
+        key = normalize_query(q)
+        if not (min_len <= len(key) <= max_len):
+            continue
+        counts[key] += 1
+        surface.setdefault(key, Counter())[q] += 1
+    return [(surface[k].most_common(1)[0][0], n) for k, n in counts.most_common()]
+
+
+def greedy_cluster(
+    texts: list[str],
+    counts: list[int],
+    vectors: np.ndarray,
+    *,
+    threshold: float,
+    alias_threshold: float,
+    max_aliases: int = 50,
+) -> list[Cluster]:
+    """texts 需按频次降序；每条归入余弦最高且 >= threshold 的已有簇，否则自成一簇（自己为代表问题）。"""
+    n, dim = vectors.shape
+    centers = np.empty((n, dim), dtype=np.float32)
+    clusters: list[Cluster] = []
+    for i in range(n):
+        v = vectors[i]
+        if clusters:
+            sims = centers[: len(clusters)] @ v
+            j = int(np.argmax(sims))
+            if sims[j] >= threshold:
+                c = clusters[j]
+                c.volume += counts[i]
+                if sims[j] >= alias_threshold and len(c.aliases) < max_aliases:
+                    c.aliases.append(texts[i])
+                continue
+        centers[len(clusters)] = v
+        clusters.append(Cluster(cluster_id=len(clusters), question=texts[i], volume=counts[i]))
+    return clusters
+
+
+def _embed_all(embed: Callable[[list[str]], list[list[float]]], texts: list[str], batch: int = 256) -> np.ndarray:
+    out: list[list[float]] = []
+    for i in range(0, len(texts), batch):
+        out.extend(embed(texts[i : i + batch]))
+    m = np.asarray(out, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def regenerate(graph: Any, clusters: list[Cluster], *, concurrency: int) -> list[tuple[Cluster, dict[str, Any]]]:
+    """用代表问题走一遍对话图；只保留 RAG 路由且带引用的答案。"""
+
+    def run(c: Cluster) -> tuple[Cluster, dict[str, Any]] | None:
+        try:
+            res = graph.invoke(
+                {
+                    "conversation_id": f"faq-{c.cluster_id}",
+                    "request_id": f"faq-{c.cluster_id}",
+                    "user_id": None,
+                    "query": c.question,
+                    "history": [],
+                }
+            )
+        except Exception as e:
+            logger.warning("regenerate failed for %r: %s", c.question, e)
+            return None
+        answer = (res.get("answer") or "").strip()
+        citations = res.get("citations") or []
+        if res.get("route") != "RAG" or not citations or not answer:
+            logger.info("skip %r: route=%s citations=%d", c.question, res.get("route"), len(citations))
+            return None
+        return c, {"answer": answer, "citations": citations}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return [r for r in pool.map(run, clusters) if r is not None]
+
+
+def build_entries(
+    generated: list[tuple[Cluster, dict[str, Any]]], fetch_texts: Callable[[list[Any]], dict[Any, tuple[Any, str]]]
+) -> list[dict[str, Any]]:
+    cited = sorted({c["id"] for _, g in generated for c in g["citations"]}, key=str)
+    texts = fetch_texts(cited) if cited else {}
+    hashes = {str(k): knowledge_hash(str(q or "").strip(), str(kb or "").strip()) for k, (q, kb) in texts.items()}
+
+    entries: list[dict[str, Any]] = []
+    for cluster, g in generated:
+        ids = [str(c["id"]) for c in g["citations"]]
+        if any(i not in hashes for i in ids):
+            # 引用的知识刚被删除：不发布
+            continue
+        entries.append(
+            {
+                "cluster_id": cluster.cluster_id,
+                "question": cluster.question,
+                "aliases": cluster.aliases,
+                "answer": g["answer"],
+                "citations": g["citations"],
+                "knowledge_hashes": {i: hashes[i] for i in ids},
+                "volume": cluster.volume,
+            }
+        )
+    return entries
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--max-questions", type=int, default=500000, help="最多读取的首轮问题数（最近优先）")
+    ap.add_argument("--max-unique", type=int, default=50000, help="参与聚类的不同问题数上限（按频次）")
+    ap.add_argument("--threshold", type=float, default=0.88, help="聚类余弦阈值")
+    ap.add_argument("--alias-threshold", type=float, default=0.95, help="作为线上匹配别名的余弦阈值")
+    ap.add_argument("--top", type=int, default=200, help="发布的簇数")
+    ap.add_argument("--min-volume", type=int, default=5, help="簇内总频次下限")
+    ap.add_argument("--concurrency", type=int, default=4, help="重新生成答案的并发数")
+    ap.add_argument("--keep", type=int, default=5, help="保留的历史版本数")
+    ap.add_argument("--output", default="", help="同时把条目写入 JSONL 便于人工审核")
+    ap.add_argument("--dry-run", action="store_true", help="不发布")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    settings = get_settings()
+    embed = make_embed_fn(settings)
+    backends = create_backends(settings, embed_texts=embed)
+    pg_store = backends["pg_store"]
+    if pg_store is None:
+        raise SystemExit("Missing POSTGRES_DSN/DATABASE_URL")
+
+    t0 = time.perf_counter()
+    since = datetime.now(timezone.utc) - timedelta(days=args.days)
+    counted = count_questions(pg_store.iter_first_turn_questions(since=since, limit=args.max_questions))
+    total, unique = sum(n for _, n in counted), len(counted)
+    counted = counted[: args.max_unique]
+    logger.info("first-turn questions=%d unique=%d (clustering %d)", total, unique, len(counted))
+    if not counted:
+        print("no questions found")
+        return 0
+
+    texts = [q for q, _ in counted]
+    vectors = _embed_all(embed, texts)
+    clusters = greedy_cluster(
+        texts,
+        [n for _, n in counted],
+        vectors,
+        threshold=args.threshold,
+        alias_threshold=args.alias_threshold,
+    )
+    head = sorted((c for c in clusters if c.volume >= args.min_volume), key=lambda c: -c.volume)[: args.top]
+    covered = sum(c.volume for c in head)
+    logger.info("clusters=%d head=%d covering %.1f%% of first turns", len(clusters), len(head), 100 * covered / total)
+
+    graph = build_rag_graph(
+        settings=settings, qwen=backends["qwen"], retriever=backends["retriever"], limiters=backends["limiters"]
+    )
+    generated = regenerate(graph, head, concurrency=args.concurrency)
+    entries = build_entries(generated, backends["retriever"].fetch_texts)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for e in entries:
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+    published = sum(e["volume"] for e in entries)
+    summary = (
+        f"questions={total} clusters={len(clusters)} head={len(head)} published={len(entries)} "
+        f"coverage={100 * published / total:.1f}% elapsed={time.perf_counter() - t0:.0f}s"
+    )
+    if args.dry_run:
+        print(summary + " (dry-run)")
+        return 0
+
+    pg_store.ensure_faq_schema()
+    version = pg_store.publish_faq(
+        entries,
+        params={k: getattr(args, k) for k in ("days", "threshold", "alias_threshold", "top", "min_volume")},
+        keep=args.keep,
+    )
+    print(f"{summary} version={version}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,55 @@
+"""chat_history 月分区维护：建表/索引、预建未来分区、按保留期删除旧分区。
+
+    # 每天由 cron 执行一次即可（幂等）
+    python -m app.jobs.pg_partitions
+    # 首次上线：把老的非分区 chat_history 改名为 chat_history_legacy 并按月搬迁
+    python -m app.jobs.pg_partitions --migrate-legacy
+
+写入路径在遇到缺失的月分区时也会自动建分区，本任务保证月初第一批写入不需要做 DDL。
+保留期由 PG_RETENTION_MONTHS 控制（0 表示不删除），只会删除整月早于保留窗口的分区。
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from datetime import datetime, timezone
+
+from app.core.config import get_settings
+from app.integrations.postgres_store import TABLE, PostgresStore, add_months, month_start, partition_name
+
+
+def main(argv: list[str] | None = None) -> int:
+    settings = get_settings()
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--months-ahead", type=int, default=settings.pg_partition_months_ahead)
+    ap.add_argument("--retention-months", type=int, default=settings.pg_retention_months)
+    ap.add_argument("--migrate-legacy", action="store_true", help="迁移老的非分区表")
+    ap.add_argument("--dry-run", action="store_true", help="只列出将被删除的分区")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not settings.postgres_dsn:
+        raise SystemExit("Missing POSTGRES_DSN/DATABASE_URL")
+    store = PostgresStore(settings.postgres_dsn)
+
+    if args.migrate_legacy:
+        moved = store.migrate_legacy(months_ahead=args.months_ahead)
+        print(f"migrated {moved} rows from legacy table")
+
+    created = store.ensure_schema(months_ahead=args.months_ahead)
+    print(f"created partitions: {', '.join(created) or '-'}")
+
+    if args.retention_months > 0:
+        cutoff = add_months(month_start(datetime.now(timezone.utc)), -args.retention_months)
+        if args.dry_run:
+            limit = partition_name(cutoff)
+            old = [p for p in store.list_partitions() if p.startswith(f"{TABLE}_p") and p < limit]
+            print(f"would drop: {', '.join(old) or '-'}")
+        else:
+            dropped = store.drop_partitions_before(cutoff)
+            print(f"dropped partitions: {', '.join(dropped) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
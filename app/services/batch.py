@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from app.services.chat_service import ChatError, ChatService
+
+
+_BATCH_NAMESPACE = uuid.UUID("6f1d7f4e-3c1b-4b8e-9a43-1f0c2b7d5e10")
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[dict[str, Any]]:
+    """逐行解析；每行至少包含 request_id 与 message。行号记在 _line 里，用于生成稳定的会话 id。"""
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if not isinstance(item, dict) or not item.get("message"):
+            raise ValueError(f"line {lineno}: expected an object with 'message'")
+        item["_line"] = lineno
+        yield item
+
+
+def group_conversations(items: Iterable[dict[str, Any]]) -> list[list[dict[str, Any]]]:
+    """按 conversation_id 分组并保持文件内顺序。
+
+    没有 conversation_id 的行视为独立的单轮会话，用行号派生 uuid5，重跑时 id 不变（可续跑）。
+    没有 request_id 的行同理派生 r<行号>。
+    """
+    groups: dict[str, list[dict[str, Any]]] = {}
+    for item in items:
+        cid = str(item.get("conversation_id") or "")
+        if not cid:
+            cid = str(uuid.uuid5(_BATCH_NAMESPACE, f"line:{item['_line']}"))
+            item["_generated_id"] = True
+        item["conversation_id"] = cid
+        item["request_id"] = str(item.get("request_id") or f"r{item['_line']}")
+        groups.setdefault(cid, []).append(item)
+    return list(groups.values())
+
+
+def run_batch(
+    items: Iterable[dict[str, Any]],
+    service: ChatService,
+    *,
+    concurrency: int,
+    on_result: Callable[[dict[str, Any]], None],
+    done: Optional[set[tuple[str, str]]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> dict[str, int]:
+    """会话之间并行（最多 concurrency 个），同一会话内按顺序执行。
+
+    done 中的 (conversation_id, request_id) 会被跳过（续跑）。on_result 在锁内调用，可直接写文件。
+    某轮失败后，同一会话后续轮次仍会执行（结果里 status=error 标明失败原因）。
+    cancel 被置位后不再开始新的轮次（已在执行的轮次照常完成），如 HTTP 客户端已断开。
+    """
+    done = done or set()
+    lock = threading.Lock()
+    stats = {"ok": 0, "error": 0, "skipped": 0}
+
+    def emit(record: dict[str, Any]) -> None:
+        with lock:
+            stats[record["status"]] = stats.get(record["status"], 0) + 1
+            on_result(record)
+
+    def run_conversation(turns: list[dict[str, Any]]) -> None:
+        for item in turns:
+            if cancel is not None and cancel.is_set():
+                return
+            cid, rid = item["conversation_id"], item["request_id"]
+            if (cid, rid) in done:
+                with lock:
+                    stats["skipped"] += 1
+                continue
+
+            record: dict[str, Any] = {
+                "conversation_id": cid,
+                "request_id": rid,
+                "user_id": item.get("user_id"),
+                "message": item["message"],
+            }
+            t0 = time.perf_counter()
+            try:
+                turn = service.run_turn(
+                    conversation_id=cid,
+                    request_id=rid,
+                    message=str(item["message"]),
+                    user_id=item.get("user_id"),
+                    resume=not item.get("_generated_id"),
+                    # 整个批量在公平队列里只占一个调用方的份额
+                    client_key="batch",
+                )
+                record.update(
+                    status="ok",
+                    answer=turn.answer,
+                    route=turn.route,
+                    citations=turn.citations,
+                    cached=turn.cached,
+                    timings_ms={k: round(v * 1000, 2) for k, v in turn.timings.items()},
+                )
+            except ChatError as e:
+                record.update(status="error", error=e.detail, status_code=e.status_code)
+            except Exception as e:
+                record.update(status="error", error=str(e), status_code=500)
+            record["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            emit(record)
+
+    groups = group_conversations(items)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for fut in [pool.submit(run_conversation, g) for g in groups]:
+            fut.result()
+    return stats
+
+
+def load_done(path: str) -> set[tuple[str, str]]:
+    """读取已有结果文件中成功的 (conversation_id, request_id)；文件不存在返回空集。"""
+    done: set[tuple[str, str]] = set()
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # 中断时可能留下半行
+                    continue
+                if rec.get("status") == "ok":
+                    done.add((str(rec["conversation_id"]), str(rec["request_id"])))
+    except FileNotFoundError:
+        pass
+    return done
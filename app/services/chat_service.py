@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from app.core import metrics
+from app.core.fair_queue import fair_slot
+from app.core.limiter import Overloaded
+from app.core.utils import json_with_raw, new_id, now_ts
+from app.integrations.redis_singleflight import normalize_query
+
+
+class ChatError(Exception):
+    """单轮对话失败；status_code/headers 与 HTTP 语义一致，由调用方决定如何呈现。"""
+
+    def __init__(self, status_code: int, detail: str, headers: Optional[dict[str, str]] = None) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+@dataclass(slots=True)
+class ChatTurn:
+    conversation_id: str
+    request_id: str
+    answer: str
+    route: str = ""
+    # 引用只编码一次：写 Redis 历史时原样拼接；/chat 响应不含引用，只有批量结果才解码
+    citations_json: str = "[]"
+    cached: bool = False
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def citations(self) -> list[dict[str, Any]]:
+        return json.loads(self.citations_json)
+
+    def to_response(self) -> dict[str, Any]:
+        return {
+            "conversation_id": self.conversation_id,
+            "request_id": self.request_id,
+            "answer": self.answer,
+        }
+
+
+class ChatService:
+    """一轮 /chat 的完整流程：幂等缓存 → inflight 保护 → 历史 → 图执行 → 写历史与缓存。
+
+    /chat 路由与批量执行（/chat/batch、app.jobs.batch_chat）共用同一实例，复用已编译的图与各客户端。
+    """
+
+    def __init__(
+        self,
+        *,
+        memory: Any,
+        graph: Any,
+        singleflight: Any = None,
+        rehydrator: Any = None,
+        precomputed: Any = None,
+        personal_query: Optional[Callable[[str], Any]] = None,
+        rate_limiter: Any = None,
+        fair_queue: Any = None,
+    ) -> None:
+        self._memory = memory
+        self._graph = graph
+        self._singleflight = singleflight
+        self._rehydrator = rehydrator
+        self._precomputed = precomputed
+        # 判断问题是否依赖用户身份（如查话费）；这类答案不能跨用户共享
+        self._personal_query = personal_query
+        self._rate_limiter = rate_limiter
+        self._fair_queue = fair_queue
+
+    @property
+    def fair_queue(self) -> Any:
+        return self._fair_queue
+
+    @property
+    def rate_limiter(self) -> Any:
+        return self._rate_limiter
+
+    def run_turn(
+        self,
+        *,
+        conversation_id: str,
+        request_id: str,
+        message: str,
+        user_id: Optional[str] = None,
+        resume: bool = True,
+        client_key: Optional[str] = None,
+        client_ip: Optional[str] = None,
+        rate_limit: bool = False,
+    ) -> ChatTurn:
+        """resume=False 表示 conversation_id 是本次新生成的，不必去 Postgres 找历史。
+
+        client_key 是限流与公平排队用的调用方标识（默认 user_id，其次 conversation_id）；
+        rate_limit=True 时先过令牌桶，client_ip 非空时另有按来源 IP 的桶。
+        """
+        client_key = client_key or user_id or conversation_id
+        with metrics.collect_timings() as timings:
+            turn = self._run_turn(
+                conversation_id, request_id, message, user_id, resume, client_key, client_ip, rate_limit
+            )
+        turn.timings = dict(timings)
+        return turn
+
+    def _run_turn(
+        self,
+        conversation_id: str,
+        request_id: str,
+        message: str,
+        user_id: Optional[str],
+        resume: bool,
+        client_key: str,
+        client_ip: Optional[str],
+        rate_limit: bool,
+    ) -> ChatTurn:
+        memory = self._memory
+        cached = memory.get_cached_response(conversation_id, request_id)
+        if cached:
+            return ChatTurn(
+                conversation_id=conversation_id,
+                request_id=request_id,
+                answer=cached.get("answer", ""),
+                cached=True,
+            )
+
+        # 已完成请求的重放走上面的缓存，不消耗令牌
+        if rate_limit and self._rate_limiter is not None:
+            decision = self._rate_limiter.check(client_key, conversation_id if resume else None, ip=client_ip)
+            if not decision.allowed:
+                raise ChatError(
+                    429,
+                    f"Too many requests ({decision.scope})",
+                    {"Retry-After": str(max(1, math.ceil(decision.retry_after_seconds)))},
+                )
+
+        # 幂等保护：同 request_id 并发只允许一个 inflight
+        if not memory.mark_inflight(conversation_id, request_id):
+            raise ChatError(409, "Duplicate inflight request_id")
+
+        try:
+            # 这里确保 request_id 唯一；重复直接拒绝（或你也可以返回 cached）
+            if not memory.ensure_request_id_unique(conversation_id, request_id):
+                raise ChatError(409, "Duplicate request_id")
+
+            if self._rehydrator is not None:
+                history = self._rehydrator.recent_messages(conversation_id, limit=20, resume=resume)
+            else:
+                history = memory.get_recent_history(conversation_id, limit=20)
+
+            state_in: dict[str, Any] = {
+                "conversation_id": conversation_id,
+                "request_id": request_id,
+                "user_id": user_id,
+                "query": message,
+                "history": history,
+            }
+
+            def run_graph() -> dict[str, Any]:
+                # 按调用方加权公平排队：刷量的用户只会排在自己后面
+                with fair_slot(self._fair_queue, client_key), metrics.inflight("graph"):
+                    res = self._graph.invoke(state_in)
+                return {
+                    "answer": res.get("answer"),
+                    "route": res.get("route"),
+                    "citations_json": json.dumps(res.get("citations") or [], ensure_ascii=False),
+                }
+
+            # 无历史的首轮高频问题：直接用离线预计算的答案，不进图、不调模型
+            hit = self._precomputed.lookup(message) if self._precomputed is not None and not history else None
+
+            # 无历史的首轮问题与会话无关：相同问题并发时只算一次（跨 worker 经 Redis 协调）
+            sf_key = normalize_query(message) if self._singleflight is not None and not history else ""
+            if sf_key and self._personal_query is not None and self._personal_query(message):
+                sf_key = f"{sf_key}\x1f{user_id or ''}"
+            try:
+                if hit is not None:
+                    out = {"answer": hit.answer, "route": "PRECOMPUTED", "citations_json": hit.citations_json}
+                elif sf_key:
+                    out, shared = self._singleflight.do(sf_key, run_graph)
+                    metrics.record_cache("singleflight", shared)
+                else:
+                    out = run_graph()
+            except Overloaded as e:
+                # 上游已满：快速 503，让客户端稍后重试，而不是排队拖垮所有请求
+                raise ChatError(503, f"Service busy ({e.name})", {"Retry-After": "1"})
+
+            answer = (out.get("answer") or "").strip()
+            route = out.get("route") or "NO_RAG"
+            citations_json = out.get("citations_json") or "[]"
+
+            # 写入 Redis 历史（user+assistant）
+            memory.append_messages(
+                conversation_id,
+                [
+                    {
+                        "message_id": new_id(),
+                        "request_id": request_id,
+                        "role": "user",
+                        "user_id": user_id,
+                        "content": message,
+                        "ts": now_ts(),
+                    },
+                    json_with_raw(
+                        {
+                            "message_id": new_id(),
+                            "request_id": request_id,
+                            "answer_id": new_id(),
+                            "role": "assistant",
+                            "content": answer,
+                            "ts": now_ts(),
+                        },
+                        meta=f'{{"citations":{citations_json}}}',
+                    ),
+                ],
+            )
+
+            turn = ChatTurn(
+                conversation_id=conversation_id,
+                request_id=request_id,
+                answer=answer,
+                route=route,
+                citations_json=citations_json,
+            )
+            memory.cache_response(conversation_id, request_id, turn.to_response())
+            return turn
+        finally:
+            memory.clear_inflight(conversation_id, request_id)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from app.core import metrics
+from app.core.utils import new_id
+from app.integrations.redis_memory import HistoryMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+def turns_to_messages(turns: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """chat_history 行 -> 与 ChatService 写入格式一致的 user/assistant 消息对。"""
+    messages: list[dict[str, Any]] = []
+    for t in turns:
+        ts = t["time"].timestamp() if isinstance(t.get("time"), datetime) else float(t.get("time") or 0)
+        rid = str(t["request_id"])
+        messages.append(
+            {
+                "message_id": new_id(),
+                "request_id": rid,
+                "role": "user",
+                "user_id": t.get("user_id"),
+                "content": t.get("message") or "",
+                "ts": ts,
+            }
+        )
+        messages.append(
+            {
+                "message_id": new_id(),
+                "request_id": rid,
+                "answer_id": new_id(),
+                "role": "assistant",
+                "content": t.get("answer") or "",
+                "ts": ts,
+                "meta": {"rehydrated": True},
+            }
+        )
+    return messages
+
+
+class HistoryRehydrator:
+    """Redis 历史的回源层：会话 key 过期或 /end 之后，从 chat_history 恢复最近几轮。
+
+    - 只对客户端带来的 conversation_id 回源（新生成的 id 不可能有历史）；
+    - 一次索引查询取最近 turns 轮，用 Lua 原子写回 Redis（key 已存在则不覆盖）；
+    - 同一会话的并发回源经 single-flight 合并，避免突发请求打穿 Postgres；
+    - Postgres 里也没有的会话写短 TTL 的负缓存；回源失败只降级为无历史，不影响本轮回答。
+    """
+
+    def __init__(
+        self,
+        *,
+        memory: Any,
+        pg_store: Any,
+        singleflight: Any = None,
+        turns: int = 10,
+        negative_ttl_seconds: int = 60,
+        max_age_days: int = 0,
+    ) -> None:
+        self._memory = memory
+        self._pg = pg_store
+        self._singleflight = singleflight
+        self._turns = turns
+        self._negative_ttl = negative_ttl_seconds
+        self._max_age_days = max_age_days
+
+    def recent_messages(self, conversation_id: str, *, limit: int, resume: bool) -> list[HistoryMessage]:
+        history = self._memory.get_recent_history(conversation_id, limit=limit)
+        if history or not resume or self._turns <= 0:
+            return history
+        if self._memory.is_cold(conversation_id):
+            metrics.record_cache("rehydrate", False)
+            return []
+
+        try:
+            if self._singleflight is not None:
+                out, shared = self._singleflight.do(conversation_id, lambda: self._load(conversation_id))
+                metrics.record_cache("rehydrate_singleflight", shared)
+            else:
+                out = self._load(conversation_id)
+        except Exception as e:
+            logger.warning("history rehydrate failed for %s: %s", conversation_id, e)
+            return []
+
+        messages = out.get("messages") or []
+        metrics.record_cache("rehydrate", bool(messages))
+        return [HistoryMessage.from_dict(m) for m in messages[-limit:]]
+
+    def _load(self, conversation_id: str) -> dict[str, Any]:
+        since: Optional[datetime] = None
+        if self._max_age_days > 0:
+            since = datetime.now(timezone.utc) - timedelta(days=self._max_age_days)
+        with metrics.stage("rehydrate"):
+            turns = self._pg.load_recent_turns(conversation_id, limit=self._turns, since=since)
+            if not turns:
+                self._memory.mark_cold(conversation_id, ttl_seconds=self._negative_ttl)
+                return {"messages": []}
+            messages = turns_to_messages(turns)
+            if not self._memory.rehydrate_messages(conversation_id, messages):
+                # 期间已有新一轮写入：以 Redis 为准
+                messages = self._memory.get_all_messages(conversation_id)
+        return {"messages": messages}
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from app.core import metrics
+from app.core.utils import knowledge_hash
+from app.integrations.redis_singleflight import normalize_query
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class PrecomputedAnswer:
+    cluster_id: int
+    question: str
+    answer: str
+    knowledge_hashes: dict[str, str] = field(default_factory=dict)
+    # 引用只在加载时编码一次，命中时原样写入历史，不再持有解码后的列表
+    citations_json: str = "[]"
+
+
+class PrecomputedAnswers:
+    """离线挖掘（app.jobs.mine_faq）发布的高频问题答案，按归一化问题精确匹配。
+
+    - 启动时加载 active 版本，并用 Milvus 里当前的知识内容校验 knowledge_hashes，
+      被引用的知识已修改/删除的条目直接丢弃（回到正常 RAG 路径）；
+    - 之后每 refresh_seconds 在后台线程里重新加载并校验（新版本发布、知识库更新都会生效），
+      查询路径只做一次 dict 查找。
+    """
+
+    def __init__(
+        self,
+        *,
+        pg_store: Any,
+        fetch_texts: Optional[Callable[[list[Any]], dict[Any, tuple[Optional[str], str]]]] = None,
+        refresh_seconds: float = 300.0,
+    ) -> None:
+        self._pg = pg_store
+        self._fetch_texts = fetch_texts
+        self._refresh_seconds = refresh_seconds
+        self._entries: dict[str, PrecomputedAnswer] = {}
+        self._version: Optional[int] = None
+        self._loaded_at = 0.0
+        self._refreshing = threading.Lock()
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, query: str) -> Optional[PrecomputedAnswer]:
+        if self._refresh_seconds > 0 and time.monotonic() - self._loaded_at > self._refresh_seconds:
+            self._refresh_in_background()
+        if not self._entries:
+            return None
+        hit = self._entries.get(normalize_query(query))
+        metrics.record_cache("precomputed", hit is not None)
+        return hit
+
+    def _refresh_in_background(self) -> None:
+        if not self._refreshing.acquire(blocking=False):
+            return
+
+        def run() -> None:
+            try:
+                self.refresh()
+            finally:
+                self._refreshing.release()
+
+        # 先推后下次刷新时间，避免刷新期间每个请求都来尝试
+        self._loaded_at = time.monotonic()
+        threading.Thread(target=run, name="precomputed-refresh", daemon=True).start()
+
+    def refresh(self) -> int:
+        """重新加载并校验；失败时保留旧数据。返回生效的条目数。"""
+        try:
+            with metrics.stage("precomputed_refresh"):
+                version, rows = self._pg.load_faq()
+                valid = self._validate(rows)
+        except Exception as e:
+            logger.warning("precomputed answers refresh failed: %s", e)
+            self._loaded_at = time.monotonic()
+            return len(self._entries)
+
+        entries: dict[str, PrecomputedAnswer] = {}
+        for row in valid:
+            ans = PrecomputedAnswer(
+                cluster_id=int(row["cluster_id"]),
+                question=row["question"],
+                answer=row["answer"],
+                knowledge_hashes=dict(row.get("knowledge_hashes") or {}),
+                citations_json=json.dumps(row.get("citations") or [], ensure_ascii=False),
+            )
+            for alias in [row["question"], *row.get("aliases", [])]:
+                key = normalize_query(alias)
+                if key:
+                    entries.setdefault(key, ans)
+        self._entries = entries
+        self._version = version
+        self._loaded_at = time.monotonic()
+        if version is not None:
+            logger.info(
+                "precomputed answers v%s: %d/%d clusters valid, %d keys", version, len(valid), len(rows), len(entries)
+            )
+        return len(entries)
+
+    def _validate(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        if not rows or self._fetch_texts is None:
+            return rows
+        ids: set[Any] = set()
+        for row in rows:
+            ids.update(_as_id(k) for k in (row.get("knowledge_hashes") or {}))
+        current = self._fetch_texts(sorted(ids, key=str)) if ids else {}
+        current_hashes = {
+            str(kid): knowledge_hash(str(q or "").strip(), str(kb or "").strip()) for kid, (q, kb) in current.items()
+        }
+        return [
+            row
+            for row in rows
+            if all(current_hashes.get(str(k)) == h for k, h in (row.get("knowledge_hashes") or {}).items())
+        ]
+
+
+def _as_id(key: str) -> Any:
+    # jsonb 的 key 只能是字符串；知识 id 在 Milvus 里是 INT64
+    return int(key) if str(key).lstrip("-").isdigit() else key
@@ -0,0 +1,186 @@
+"""单轮对话的内存分配基准：本地替身（零延迟）上跑 ChatService.run_turn（即 /chat 的处理流程），
+
+    python -m bench.alloc_turn --turns 200 --history 10
+    python -m bench.alloc_turn --turns 2000 --concurrency 32 --json alloc.json
+
+- 分配：tracemalloc 统计每轮的峰值临时内存（peak - 起点）与留存内存（终点 - 起点）；
+- GC 压力：每轮触发的各代 GC 次数与 GC 暂停总时长（gc.callbacks），--concurrency > 1 时多线程并发跑，
+  不开 tracemalloc，只看吞吐与 GC。
+
+每个会话先预热 --history 轮（不计入），之后每轮都带着这些历史进图，贴近多轮对话的真实负载。
+默认用进程内 fakeredis，其自身的分配也会计入；设 BENCH_REDIS_URL 连本地 Redis 可以只看服务侧。
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import gc
+import json
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from app.assembly import build_chat_service
+from app.core.config import get_settings
+from bench.fakes import FakeLatency, FakeMilvusRetriever, FakeQwenClient, make_fake_memory
+from bench.stats import percentile
+
+
+QUESTIONS = [
+    "融合套餐包含宽带吗",
+    "定向流量怎么用",
+    "怎么开电子发票",
+    "国际漫游怎么开通",
+    "5G套餐有哪些资费",
+]
+
+
+class GcMonitor:
+    """通过 gc.callbacks 统计各代回收次数与暂停时长。"""
+
+    def __init__(self) -> None:
+        self.collections = [0, 0, 0]
+        self.pause_seconds = 0.0
+        self._t0 = 0.0
+
+    def __call__(self, phase: str, info: dict[str, Any]) -> None:
+        if phase == "start":
+            self._t0 = time.perf_counter()
+        else:
+            self.pause_seconds += time.perf_counter() - self._t0
+            self.collections[info["generation"]] += 1
+
+    def __enter__(self) -> "GcMonitor":
+        gc.callbacks.append(self)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        gc.callbacks.remove(self)
+
+
+def build_service() -> Any:
+    settings = dataclasses.replace(
+        get_settings(),
+        redis_prefix="bench-alloc",
+        router_mode="heuristic",
+        qwen_chat_model="fake-qwen",
+        faq_enabled=False,
+        tools_backend="",
+        rate_limit_enabled=False,
+        singleflight_enabled=False,
+    )
+    latency = FakeLatency(llm_ttft=0, llm_per_token=0, embed=0, milvus=0, postgres=0, jitter=0)
+    return build_chat_service(
+        settings=settings,
+        qwen=FakeQwenClient(latency=latency),
+        retriever=FakeMilvusRetriever(latency=latency, top_k=settings.milvus_top_k),
+        memory=make_fake_memory(prefix=settings.redis_prefix, ttl_seconds=600),
+    )
+
+
+def _turn(service: Any, cid: str, i: int) -> None:
+    service.run_turn(
+        conversation_id=cid,
+        request_id=f"{cid}-{i}",
+        message=f"{QUESTIONS[i % len(QUESTIONS)]}（{i}）",
+        user_id="bench-user",
+    )
+
+
+def warm(service: Any, conversations: int, history: int) -> list[str]:
+    cids = [uuid.uuid4().hex for _ in range(conversations)]
+    for cid in cids:
+        for i in range(history):
+            _turn(service, cid, i)
+    return cids
+
+
+def measure_serial(service: Any, *, turns: int, history: int) -> dict[str, Any]:
+    cids = warm(service, max(1, turns // 20), history)
+    gc.collect()
+    peaks: list[float] = []
+    retained: list[float] = []
+    tracemalloc.start()
+    try:
+        with GcMonitor() as mon:
+            for n in range(turns):
+                cid = cids[n % len(cids)]
+                i = history + n // len(cids)
+                tracemalloc.reset_peak()
+                start, _ = tracemalloc.get_traced_memory()
+                _turn(service, cid, i)
+                end, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - start)
+                retained.append(end - start)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "mode": "serial",
+        "turns": turns,
+        "history": history,
+        "peak_kib_p50": percentile(peaks, 50) / 1024,
+        "peak_kib_p99": percentile(peaks, 99) / 1024,
+        "retained_kib_mean": sum(retained) / len(retained) / 1024,
+        "gc_per_turn": [c / turns for c in mon.collections],
+        "gc_pause_ms_per_turn": 1000 * mon.pause_seconds / turns,
+    }
+
+
+def measure_concurrent(service: Any, *, turns: int, history: int, concurrency: int) -> dict[str, Any]:
+    cids = warm(service, concurrency, history)
+    gc.collect()
+    per_worker = max(1, turns // concurrency)
+
+    def worker(cid: str) -> None:
+        for n in range(per_worker):
+            _turn(service, cid, history + n)
+
+    with GcMonitor() as mon:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, cids))
+        elapsed = time.perf_counter() - t0
+    done = per_worker * concurrency
+    return {
+        "mode": "concurrent",
+        "turns": done,
+        "history": history,
+        "concurrency": concurrency,
+        "turns_per_second": done / elapsed,
+        "gc_per_turn": [c / done for c in mon.collections],
+        "gc_pause_ms_per_turn": 1000 * mon.pause_seconds / done,
+        "gc_pause_share": mon.pause_seconds / elapsed,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--turns", type=int, default=200)
+    ap.add_argument("--history", type=int, default=10, help="每个会话预热的轮数（带进图的历史）")
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--json", default="", help="把结果写入该文件")
+    args = ap.parse_args(argv)
+
+    service = build_service()
+    if args.concurrency > 1:
+        result = measure_concurrent(service, turns=args.turns, history=args.history, concurrency=args.concurrency)
+    else:
+        result = measure_serial(service, turns=args.turns, history=args.history)
+
+    for k, v in result.items():
+        if isinstance(v, float):
+            v = f"{v:.3f}"
+        elif isinstance(v, list):
+            v = " / ".join(f"{x:.4f}" for x in v)
+        print(f"{k:>22}: {v}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
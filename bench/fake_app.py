@@ -0,0 +1,63 @@
+"""全部后端替换为本地替身的应用，供 uvicorn 多 worker 压测：
+
+    BENCH_REDIS_URL=redis://localhost:6379/15 uvicorn bench.fake_app:app --workers 4
+
+未设置 BENCH_REDIS_URL 时用进程内 fakeredis，每个 worker 各一份会话，只能单 worker 运行：
+多 worker 下 /end 可能落到别的 worker、静默 flush 0 条，所以检测到多 worker 时直接拒绝启动
+（--reload 同样跑在子进程里，确认单 worker 时可设 BENCH_ALLOW_LOCAL_REDIS=1 跳过检查）。
+"""
+from __future__ import annotations
+
+import dataclasses
+import multiprocessing
+import os
+
+from fastapi import FastAPI
+
+from app.assembly import assemble_app
+from app.core.config import get_settings
+from app.core.limiter import build_limiters
+from bench.fakes import FakeLatency, FakeMilvusRetriever, FakePostgresStore, FakeQwenClient, make_fake_memory
+
+
+def _check_shared_redis() -> None:
+    if os.getenv("BENCH_REDIS_URL") or os.getenv("BENCH_ALLOW_LOCAL_REDIS") == "1":
+        return
+    # uvicorn --workers N（N>1）的 worker 是 multiprocessing 子进程；bench.loadgen 另外通过 BENCH_WORKERS 告知
+    if multiprocessing.parent_process() is not None or int(os.getenv("BENCH_WORKERS") or "1") > 1:
+        raise RuntimeError(
+            "bench.fake_app with multiple workers needs BENCH_REDIS_URL (a shared Redis); "
+            "in-process fakeredis is per worker and /end would silently flush nothing. "
+            "Set BENCH_ALLOW_LOCAL_REDIS=1 if this is a single worker (e.g. --reload)."
+        )
+
+
+def create_fake_app() -> FastAPI:
+    _check_shared_redis()
+    settings = dataclasses.replace(
+        get_settings(),
+        redis_prefix="bench",
+        router_mode=os.getenv("BENCH_ROUTER_MODE", "heuristic"),
+        qwen_chat_model="fake-qwen",
+        tools_backend=os.getenv("BENCH_TOOLS_BACKEND", "mock"),
+        # 压测客户端通常共用一个 IP/用户，默认不限流；测限流时设 BENCH_RATE_LIMIT=1
+        rate_limit_enabled=os.getenv("BENCH_RATE_LIMIT", "") == "1",
+    )
+    latency = FakeLatency.from_env()
+    limiters = build_limiters(settings)
+    return assemble_app(
+        settings=settings,
+        qwen=FakeQwenClient(latency=latency, limiter=limiters.get("qwen")),
+        retriever=FakeMilvusRetriever(
+            latency=latency,
+            top_k=settings.milvus_top_k,
+            embed_limiter=limiters.get("embed"),
+            search_limiter=limiters.get("milvus"),
+        ),
+        memory=make_fake_memory(prefix=settings.redis_prefix, ttl_seconds=settings.session_ttl_seconds),
+        pg_store=FakePostgresStore(latency=latency),
+        limiters=limiters,
+    )
+
+
+app = create_fake_app()
@@ -0,0 +1,271 @@
+"""与真实客户端同接口的本地替身，用于离线压测。
+
+- FakeQwenClient：继承 QwenClient，只替换底层 OpenAI 客户端，真实的工具调用循环/指标照常执行。
+- FakeMilvusRetriever：继承 MilvusRetriever，只替换 MilvusClient，真实的结果解析照常执行。
+- make_fake_memory：RedisMemory + fakeredis（需 lupa 支持 EVAL），或指向本地 Redis。
+- FakePostgresStore：内存里记录落库的轮次（供历史回源），只模拟耗时，不连数据库。
+
+所有延迟都可通过 FakeLatency / 环境变量配置。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Iterator
+
+from app.integrations.milvus_retriever import MilvusRetriever
+from app.integrations.postgres_store import PostgresStore
+from app.integrations.qwen_openai import QwenClient
+from app.integrations.redis_memory import RedisMemory
+
+
+def _env_ms(name: str, default: float) -> float:
+    val = os.getenv(name)
+    return float(val) / 1000.0 if val else default / 1000.0
+
+
+@dataclass(frozen=True)
+class FakeLatency:
+    """各替身的模拟耗时（秒）。jitter 为相对抖动比例。"""
+
+    llm_ttft: float = 0.3
+    llm_per_token: float = 0.02
+    llm_tokens: int = 60
+    embed: float = 0.015
+    milvus: float = 0.02
+    postgres: float = 0.03
+    jitter: float = 0.2
+
+    @classmethod
+    def from_env(cls) -> "FakeLatency":
+        return cls(
+            llm_ttft=_env_ms("BENCH_LLM_TTFT_MS", 300),
+            llm_per_token=_env_ms("BENCH_LLM_TOKEN_MS", 20),
+            llm_tokens=int(os.getenv("BENCH_LLM_TOKENS", "60")),
+            embed=_env_ms("BENCH_EMBED_MS", 15),
+            milvus=_env_ms("BENCH_MILVUS_MS", 20),
+            postgres=_env_ms("BENCH_PG_MS", 30),
+            jitter=float(os.getenv("BENCH_JITTER", "0.2")),
+        )
+
+    def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        if self.jitter:
+            seconds *= 1.0 + random.uniform(-self.jitter, self.jitter)
+        time.sleep(seconds)
+
+
+# ---------------- Qwen ----------------
+
+_FAKE_ANSWER = "您好，根据知识库，本月主推的是融合套餐，月费一百二十九元，包含一百GB流量和一千分钟通话，可通过小程序自助办理。"
+
+
+def _usage(prompt_chars: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=max(1, prompt_chars // 2), completion_tokens=completion_tokens)
+
+
+class _FakeCompletions:
+    def __init__(self, latency: FakeLatency) -> None:
+        self._lat = latency
+
+    def create(self, *, model: str, messages: list[dict[str, Any]], stream: bool = False, tools=None, **_: Any):
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in messages)
+        has_tool_result = any(m.get("role") == "tool" for m in messages)
+        user_msgs = [m for m in messages if m.get("role") == "user"]
+        query = str(user_msgs[-1].get("content") or "") if user_msgs else ""
+
+        # 首轮且带工具：像真实模型一样先要求检索
+        if tools and not has_tool_result:
+            self._lat.sleep(self._lat.llm_ttft)
+            tc = SimpleNamespace(
+                id=f"call_{random.randrange(1 << 30)}",
+                function=SimpleNamespace(
+                    name="search_knowledge",
+                    arguments=json.dumps({"query": query}, ensure_ascii=False),
+                ),
+            )
+            msg = SimpleNamespace(content="", tool_calls=[tc])
+            return SimpleNamespace(choices=[SimpleNamespace(message=msg)], usage=_usage(prompt_chars, 20))
+
+        n = self._lat.llm_tokens
+        text = (_FAKE_ANSWER * (1 + n // len(_FAKE_ANSWER)))[:n]
+        if stream:
+            return self._stream(text, prompt_chars)
+
+        self._lat.sleep(self._lat.llm_ttft + self._lat.llm_per_token * n)
+        msg = SimpleNamespace(content=text, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg)], usage=_usage(prompt_chars, n))
+
+    def _stream(self, text: str, prompt_chars: int) -> Iterator[SimpleNamespace]:
+        self._lat.sleep(self._lat.llm_ttft)
+        for ch in text:
+            self._lat.sleep(self._lat.llm_per_token)
+            delta = SimpleNamespace(content=ch, tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=_usage(prompt_chars, len(text)))
+
+
+class _FakeEmbeddings:
+    def __init__(self, latency: FakeLatency) -> None:
+        self._lat = latency
+
+    def create(self, *, model: str, input: list[str]):
+        self._lat.sleep(self._lat.embed)
+        data = [SimpleNamespace(embedding=fake_vector(t)) for t in input]
+        return SimpleNamespace(data=data, usage=_usage(sum(len(t) for t in input), 0))
+
+
+class FakeOpenAI:
+    def __init__(self, latency: FakeLatency) -> None:
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+        self.embeddings = _FakeEmbeddings(latency)
+
+
+@dataclass(frozen=True)
+class FakeQwenClient(QwenClient):
+    api_key: str = "fake"
+    base_url: str = "http://fake"
+    latency: FakeLatency = field(default_factory=FakeLatency)
+
+    def _client(self) -> Any:
+        return FakeOpenAI(self.latency)
+
+
+# ---------------- Embedding / Milvus ----------------
+
+FAKE_DIM = 1024
+
+
+def fake_vector(text: str, dim: int = FAKE_DIM) -> list[float]:
+    """按文本哈希生成确定性的单位向量。"""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    v = [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+    norm = sum(x * x for x in v) ** 0.5 or 1.0
+    return [x / norm for x in v]
+
+
+def make_fake_embed_fn(latency: FakeLatency):
+    def embed_texts(texts: list[str]) -> list[list[float]]:
+        latency.sleep(latency.embed)
+        return [fake_vector(t) for t in texts]
+
+    return embed_texts
+
+
+FAKE_KB: list[dict[str, Any]] = [
+    {
+        "id": i,
+        "question": f"示例问题{i}：套餐资费与办理方式",
+        "knowledge": f"示例知识{i}：" + "融合套餐包含流量、通话与宽带，可通过小程序办理。" * 20,
+    }
+    for i in range(1, 201)
+]
+
+
+class FakeMilvusClient:
+    def __init__(self, latency: FakeLatency, kb: list[dict[str, Any]] | None = None) -> None:
+        self._lat = latency
+        self._kb = kb or FAKE_KB
+        self._by_id = {row["id"]: row for row in self._kb}
+
+    def search(self, *, collection_name: str, data, anns_field: str, limit: int, output_fields=None, **_: Any):
+        self._lat.sleep(self._lat.milvus)
+        fields = list(output_fields or ["id"])
+        out = []
+        for vec in data:
+            start = int(abs(vec[0]) * 1e6) % len(self._kb)
+            hits = []
+            for rank in range(min(limit, len(self._kb))):
+                row = self._kb[(start + rank) % len(self._kb)]
+                hits.append(
+                    {
+                        "id": row["id"],
+                        "distance": 0.9 - 0.05 * rank,
+                        "entity": {k: row[k] for k in fields if k in row},
+                    }
+                )
+            out.append(hits)
+        return out
+
+    def query(self, *, collection_name: str, filter: str = "", ids=None, output_fields=None, **_: Any):
+        # 两阶段检索按 id 取正文
+        self._lat.sleep(self._lat.milvus / 2)
+        fields = list(output_fields or ["id"])
+        wanted = list(ids or [])
+        return [{k: self._by_id[i][k] for k in fields if k in self._by_id[i]} for i in wanted if i in self._by_id]
+
+
+class FakeMilvusRetriever(MilvusRetriever):
+    def __init__(self, *, latency: FakeLatency, top_k: int = 5, **kwargs: Any) -> None:
+        super().__init__(
+            uri="fake://milvus",
+            token="",
+            collection="qa_collection",
+            embed_fn=make_fake_embed_fn(latency),
+            top_k=top_k,
+            **kwargs,
+        )
+        self._fake_client = FakeMilvusClient(latency)
+
+    def _get_client(self) -> Any:
+        return self._fake_client
+
+
+# ---------------- Redis / Postgres ----------------
+
+def make_fake_memory(*, prefix: str = "bench", ttl_seconds: int = 7200) -> RedisMemory:
+    """BENCH_REDIS_URL 有值时连本地 Redis（多 worker 共享会话）；否则用进程内 fakeredis。"""
+    url = os.getenv("BENCH_REDIS_URL", "")
+    if url:
+        return RedisMemory.from_url(url, prefix=prefix, ttl_seconds=ttl_seconds)
+
+    import fakeredis  # type: ignore
+
+    return RedisMemory(fakeredis.FakeRedis(decode_responses=True), prefix=prefix, ttl_seconds=ttl_seconds)
+
+
+class FakePostgresStore(PostgresStore):
+    def __init__(self, *, latency: FakeLatency) -> None:
+        super().__init__("postgresql://fake")
+        self._lat = latency
+        self._lock = threading.Lock()
+        self.rows: dict[tuple[str, str], tuple[str, str]] = {}
+
+    def load_faq(self) -> tuple[None, list[dict[str, Any]]]:
+        return None, []
+
+    def load_recent_turns(self, conversation_id: str, *, limit: int, since=None) -> list[dict[str, Any]]:
+        self._lat.sleep(self._lat.postgres)
+        with self._lock:
+            turns = [
+                {"request_id": rid, "user_id": None, "message": q, "answer": a, "time": time.time()}
+                for (cid, rid), (q, a) in self.rows.items()
+                if cid == str(conversation_id)
+            ]
+        return turns[-limit:]
+
+    def persist_chat_history_from_messages(
+        self, *, conversation_id: str, messages: list[dict[str, Any]]
+    ) -> int:
+        self._lat.sleep(self._lat.postgres)
+        pending: dict[str, dict[str, str]] = {}
+        for m in messages:
+            rid = str(m.get("request_id") or "")
+            if rid:
+                pending.setdefault(rid, {}).setdefault(str(m.get("role")), str(m.get("content") or ""))
+        inserted = 0
+        with self._lock:
+            for rid, entry in pending.items():
+                key = (str(conversation_id), rid)
+                if key not in self.rows:
+                    self.rows[key] = (entry.get("user", ""), entry.get("assistant", ""))
+                    inserted += 1
+        return inserted
@@ -0,0 +1,427 @@
+"""向量索引参数扫描：在带标注的 问题→知识 id 集合上比较各索引的 recall@k / MRR / 延迟 / 内存。
+
+真实数据（与线上相同的 bge 模型与前缀；--corpus 为知识库导出的 JSONL：{"id", "question"}）：
+
+    python -m bench.index_sweep --corpus kb.jsonl --labels labeled.jsonl --k 5
+
+离线合成数据（随机单位向量，查询 = 目标向量 + 噪声）：
+
+    python -m bench.index_sweep --synthetic 20000 --dim 256 --queries 500
+
+labels 每行：{"question": str, "id": 知识 id} 或 {"question": str, "ids": [...]}（命中任一即算召回）。
+
+后端：
+- numpy（默认，进程内）：FLAT 精确检索、IVF_FLAT（k-means 聚类，扫 nlist/nprobe）、
+  HNSW（需 pip install hnswlib，扫 M/ef）。
+- milvus-lite（pip install milvus-lite）：本地 Milvus Lite 建库，FLAT / IVF_FLAT / AUTOINDEX；
+  Milvus Lite 不支持 HNSW，HNSW 的取舍用 numpy 后端的 hnswlib 评估。
+
+得到满意的参数后写入 MILVUS_INDEX_TYPE / MILVUS_INDEX_PARAMS / MILVUS_SEARCH_PARAMS，
+再在维护窗口用 python -m app.jobs.ingest_kb --rebuild-index --i-know-this-releases 重建线上索引。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterator
+
+import numpy as np
+
+from bench.stats import percentile
+
+
+# ---------------- 数据 ----------------
+
+@dataclass
+class Dataset:
+    ids: list[Any]
+    vectors: np.ndarray  # (n, dim) float32，已归一化
+    queries: np.ndarray  # (q, dim)
+    relevant: list[set[Any]]  # 每个查询的标注 id
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+def _read_jsonl(path: str) -> Iterator[dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def synthetic_dataset(n: int, dim: int, n_queries: int, noise: float, seed: int = 0) -> Dataset:
+    rng = np.random.default_rng(seed)
+    vectors = _normalize(rng.standard_normal((n, dim)))
+    targets = rng.choice(n, size=min(n_queries, n), replace=False)
+    # 噪声按维度缩放，使 noise≈查询与目标的向量距离量级
+    queries = _normalize(vectors[targets] + rng.standard_normal((len(targets), dim)) * noise / np.sqrt(dim))
+    return Dataset(
+        ids=list(range(n)),
+        vectors=vectors,
+        queries=queries,
+        relevant=[{int(t)} for t in targets],
+    )
+
+
+def labelled_dataset(corpus_path: str, labels_path: str, embed: Callable[[list[str]], list[list[float]]]) -> Dataset:
+    corpus = list(_read_jsonl(corpus_path))
+    labels = list(_read_jsonl(labels_path))
+    ids = [row["id"] for row in corpus]
+    known = set(ids)
+    relevant: list[set[Any]] = []
+    questions: list[str] = []
+    for row in labels:
+        wanted = set(row.get("ids") or [row.get("id")]) & known
+        if wanted and row.get("question"):
+            questions.append(str(row["question"]))
+            relevant.append(wanted)
+    if not questions:
+        raise SystemExit("no labelled question refers to an id in the corpus")
+
+    def embed_all(texts: list[str], batch: int = 256) -> np.ndarray:
+        out: list[list[float]] = []
+        for i in range(0, len(texts), batch):
+            out.extend(embed(texts[i : i + batch]))
+        return _normalize(np.asarray(out, dtype=np.float32))
+
+    return Dataset(
+        ids=ids,
+        vectors=embed_all([str(row.get("question") or "") for row in corpus]),
+        queries=embed_all(questions),
+        relevant=relevant,
+    )
+
+
+# ---------------- 索引 ----------------
+
+class FlatIndex:
+    def __init__(self, vectors: np.ndarray) -> None:
+        self._v = vectors
+
+    def set_search_params(self, **_: Any) -> None:
+        pass
+
+    def search(self, q: np.ndarray, k: int) -> list[int]:
+        scores = self._v @ q
+        top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        return top[np.argsort(-scores[top])].tolist()
+
+    def nbytes(self) -> int:
+        return self._v.nbytes
+
+
+class IVFFlatIndex:
+    """倒排 + 精确重排；与 Milvus IVF_FLAT 的 nlist/nprobe 含义一致。"""
+
+    def __init__(self, vectors: np.ndarray, nlist: int, *, iters: int = 10, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        nlist = max(1, min(nlist, len(vectors)))
+        centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+        self._v = vectors
+        self._nprobe = 1
+
+    def set_search_params(self, *, nprobe: int = 1, **_: Any) -> None:
+        self._nprobe = max(1, nprobe)
+
+    def search(self, q: np.ndarray, k: int) -> list[int]:
+        probe = np.argsort(-(self._centroids @ q))[: self._nprobe]
+        cand = np.concatenate([self._lists[c] for c in probe])
+        if not len(cand):
+            return []
+        scores = self._v[cand] @ q
+        kk = min(k, len(cand))
+        top = np.argpartition(-scores, kk - 1)[:kk]
+        return cand[top[np.argsort(-scores[top])]].tolist()
+
+    def nbytes(self) -> int:
+        return self._v.nbytes + self._centroids.nbytes + sum(l.nbytes for l in self._lists)
+
+
+class HNSWIndex:
+    def __init__(self, vectors: np.ndarray, M: int, efConstruction: int) -> None:
+        import hnswlib
+
+        self._index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        self._index.init_index(max_elements=len(vectors), M=M, ef_construction=efConstruction)
+        self._index.add_items(vectors, np.arange(len(vectors)))
+        self._M = M
+        self._n, self._dim = vectors.shape
+
+    def set_search_params(self, *, ef: int = 64, **_: Any) -> None:
+        self._index.set_ef(ef)
+
+    def search(self, q: np.ndarray, k: int) -> list[int]:
+        labels, _ = self._index.knn_query(q, k=k)
+        return labels[0].tolist()
+
+    def nbytes(self) -> int:
+        # 向量 + 第 0 层邻接表（2M 个 int32）；上层占比约 1/M，忽略
+        return self._n * (self._dim * 4 + self._M * 2 * 4)
+
+
+class MilvusLiteIndex:
+    def __init__(self, vectors: np.ndarray, index_type: str, params: dict[str, Any], db_path: str) -> None:
+        from pymilvus import MilvusClient
+
+        self._client = MilvusClient(db_path)
+        self._name = f"sweep_{index_type.lower()}_{abs(hash(json.dumps(params, sort_keys=True)))}"
+        if self._client.has_collection(self._name):
+            self._client.drop_collection(self._name)
+        self._client.create_collection(
+            collection_name=self._name, dimension=vectors.shape[1], metric_type="IP", auto_id=False
+        )
+        rows = [{"id": i, "vector": v.tolist()} for i, v in enumerate(vectors)]
+        for i in range(0, len(rows), 1000):
+            self._client.insert(collection_name=self._name, data=rows[i : i + 1000])
+        self._client.release_collection(collection_name=self._name)
+        for name in self._client.list_indexes(collection_name=self._name):
+            self._client.drop_index(collection_name=self._name, index_name=name)
+        index_params = self._client.prepare_index_params()
+        index_params.add_index(field_name="vector", index_type=index_type, metric_type="IP", params=params)
+        self._client.create_index(collection_name=self._name, index_params=index_params)
+        self._client.load_collection(collection_name=self._name)
+        self._search_params: dict[str, Any] = {"metric_type": "IP", "params": {}}
+        self._nbytes = vectors.nbytes
+
+    def set_search_params(self, **params: Any) -> None:
+        self._search_params = {"metric_type": "IP", "params": params}
+
+    def search(self, q: np.ndarray, k: int) -> list[int]:
+        res = self._client.search(
+            collection_name=self._name, data=[q.tolist()], limit=k, search_params=self._search_params
+        )
+        return [int(h["id"]) for h in res[0]]
+
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def close(self) -> None:
+        self._client.drop_collection(self._name)
+        self._client.close()
+
+
+# ---------------- 扫描 ----------------
+
+@dataclass
+class SweepResult:
+    backend: str
+    index: str
+    build_params: dict[str, Any]
+    search_params: dict[str, Any]
+    recall: float
+    mrr: float
+    p50_ms: float
+    p99_ms: float
+    qps: float
+    build_s: float
+    index_mb: float
+    rss_delta_mb: float
+    extra: dict[str, Any] = field(default_factory=dict)
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def evaluate(index: Any, data: Dataset, k: int) -> tuple[float, float, list[float]]:
+    hits = 0
+    rr = 0.0
+    lat: list[float] = []
+    for q, wanted in zip(data.queries, data.relevant):
+        t0 = time.perf_counter()
+        rows = index.search(q, k)
+        lat.append((time.perf_counter() - t0) * 1000)
+        for rank, row in enumerate(rows, start=1):
+            if data.ids[row] in wanted:
+                hits += 1
+                rr += 1.0 / rank
+                break
+    n = len(data.queries) or 1
+    return hits / n, rr / n, lat
+
+
+def _plans(args: argparse.Namespace) -> Iterator[tuple[str, dict[str, Any], list[dict[str, Any]]]]:
+    """(索引类型, 建索引参数, 检索参数列表)。"""
+    wanted = {s.strip().upper() for s in args.index.split(",") if s.strip()}
+    if "FLAT" in wanted:
+        yield "FLAT", {}, [{}]
+    if "IVF_FLAT" in wanted:
+        for nlist in args.nlist:
+            yield "IVF_FLAT", {"nlist": nlist}, [{"nprobe": p} for p in args.nprobe if p <= nlist]
+    if "HNSW" in wanted:
+        for m in args.hnsw_m:
+            yield "HNSW", {"M": m, "efConstruction": args.ef_construction}, [
+                {"ef": ef} for ef in args.ef if ef >= args.k
+            ]
+    if "AUTOINDEX" in wanted:
+        yield "AUTOINDEX", {}, [{}]
+
+
+def _build(backend: str, index_type: str, params: dict[str, Any], data: Dataset, db_path: str) -> Any:
+    if backend == "milvus-lite":
+        return MilvusLiteIndex(data.vectors, index_type, params, db_path)
+    if index_type == "FLAT":
+        return FlatIndex(data.vectors)
+    if index_type == "IVF_FLAT":
+        return IVFFlatIndex(data.vectors, params["nlist"])
+    if index_type == "HNSW":
+        return HNSWIndex(data.vectors, params["M"], params["efConstruction"])
+    raise ValueError(f"{index_type} is not supported by the {backend} backend")
+
+
+def sweep(args: argparse.Namespace, data: Dataset) -> list[SweepResult]:
+    results: list[SweepResult] = []
+    db_path = args.milvus_db or os.path.join(tempfile.mkdtemp(prefix="sweep_"), "sweep.db")
+    for index_type, build_params, search_grid in _plans(args):
+        rss0 = _rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            index = _build(args.backend, index_type, build_params, data, db_path)
+        except ImportError as e:
+            print(f"skip {index_type}: {e}", file=sys.stderr)
+            continue
+        except ValueError as e:
+            print(f"skip {index_type}: {e}", file=sys.stderr)
+            continue
+        build_s = time.perf_counter() - t0
+        rss_delta = max(0, _rss_bytes() - rss0)
+        try:
+            for sp in search_grid:
+                index.set_search_params(**sp)
+                recall, mrr, lat = evaluate(index, data, args.k)
+                total_s = sum(lat) / 1000 or 1e-9
+                results.append(
+                    SweepResult(
+                        backend=args.backend,
+                        index=index_type,
+                        build_params=build_params,
+                        search_params=sp,
+                        recall=recall,
+                        mrr=mrr,
+                        p50_ms=percentile(lat, 50),
+                        p99_ms=percentile(lat, 99),
+                        qps=len(lat) / total_s,
+                        build_s=build_s,
+                        index_mb=index.nbytes() / 2**20,
+                        rss_delta_mb=rss_delta / 2**20,
+                    )
+                )
+                print(_format_row(results[-1]), file=sys.stderr)
+        finally:
+            if hasattr(index, "close"):
+                index.close()
+    return results
+
+
+# ---------------- 输出 ----------------
+
+_HEADER = (
+    f"{'index':<10} {'build':<28} {'search':<14} {'recall':>7} {'mrr':>6} "
+    f"{'p50ms':>7} {'p99ms':>7} {'qps':>8} {'build_s':>8} {'idx_mb':>8} {'rss_mb':>8}"
+)
+
+
+def _format_row(r: SweepResult) -> str:
+    def kv(d: dict[str, Any]) -> str:
+        return ",".join(f"{k}={v}" for k, v in d.items()) or "-"
+
+    return (
+        f"{r.index:<10} {kv(r.build_params):<28} {kv(r.search_params):<14} {r.recall:>7.3f} {r.mrr:>6.3f} "
+        f"{r.p50_ms:>7.3f} {r.p99_ms:>7.3f} {r.qps:>8.0f} {r.build_s:>8.2f} {r.index_mb:>8.1f} {r.rss_delta_mb:>8.1f}"
+    )
+
+
+def cheapest(results: list[SweepResult], min_recall: float) -> SweepResult | None:
+    """满足 recall 门槛的配置里，按 p99 延迟、再按索引内存取最省的一个。"""
+    ok = [r for r in results if r.recall >= min_recall]
+    return min(ok, key=lambda r: (r.p99_ms, r.index_mb)) if ok else None
+
+
+def main(argv: list[str] | None = None) -> int:
+    def ints(s: str) -> list[int]:
+        return [int(x) for x in s.split(",") if x.strip()]
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_argument_group("data")
+    src.add_argument("--corpus", help="知识库 JSONL：每行 {id, question}")
+    src.add_argument("--labels", help="标注 JSONL：每行 {question, id|ids}")
+    src.add_argument("--model", default=None, help="embedding 模型（默认与线上一致）")
+    src.add_argument("--synthetic", type=int, default=0, help="不用真实数据，生成 N 条随机向量")
+    src.add_argument("--dim", type=int, default=1024)
+    src.add_argument("--queries", type=int, default=500)
+    src.add_argument("--noise", type=float, default=0.8, help="合成查询相对目标向量的噪声")
+
+    ap.add_argument("--backend", choices=["numpy", "milvus-lite"], default="numpy")
+    ap.add_argument("--milvus-db", default="", help="Milvus Lite 数据文件（默认临时目录）")
+    ap.add_argument("--index", default="FLAT,IVF_FLAT,HNSW", help="逗号分隔：FLAT,IVF_FLAT,HNSW,AUTOINDEX")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--nlist", type=ints, default=[64, 256])
+    ap.add_argument("--nprobe", type=ints, default=[1, 4, 16, 64])
+    ap.add_argument("--hnsw-m", type=ints, default=[8, 16, 32])
+    ap.add_argument("--ef-construction", type=int, default=200)
+    ap.add_argument("--ef", type=ints, default=[16, 32, 64, 128])
+    ap.add_argument("--min-recall", type=float, default=0.95, help="推荐配置需要达到的 recall@k")
+    ap.add_argument("--json", default="", help="把全部结果写入该 JSON 文件")
+    args = ap.parse_args(argv)
+
+    if args.synthetic:
+        data = synthetic_dataset(args.synthetic, args.dim, args.queries, args.noise)
+    elif args.corpus and args.labels:
+        from app.integrations.embedding import DEFAULT_EMBED_MODEL, load_embedder, make_embed_texts
+
+        data = labelled_dataset(
+            args.corpus, args.labels, make_embed_texts(load_embedder(args.model or DEFAULT_EMBED_MODEL))
+        )
+    else:
+        ap.error("either --synthetic N or both --corpus and --labels are required")
+
+    print(f"corpus={len(data.ids)} queries={len(data.queries)} dim={data.vectors.shape[1]} k={args.k}", file=sys.stderr)
+    print(_HEADER, file=sys.stderr)
+    results = sweep(args, data)
+
+    print(_HEADER)
+    for r in results:
+        print(_format_row(r))
+    best = cheapest(results, args.min_recall)
+    if best is None:
+        print(f"\nno configuration reaches recall@{args.k} >= {args.min_recall}")
+    else:
+        print(
+            f"\ncheapest with recall@{args.k} >= {args.min_recall}: "
+            f"MILVUS_INDEX_TYPE={best.index} "
+            f"MILVUS_INDEX_PARAMS='{json.dumps(best.build_params)}' "
+            f"MILVUS_SEARCH_PARAMS='{json.dumps(best.search_params)}'"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
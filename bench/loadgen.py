@@ -0,0 +1,227 @@
+"""多会话压测：对 /chat 与 /end 施压，按 worker 数输出 p50/p95/p99 与 RPS。
+
+离线（本地替身，自动按 worker 数拉起 uvicorn）：
+
+    BENCH_REDIS_URL=redis://localhost:6379/15 python -m bench.loadgen --workers 1,2,4 --conversations 200
+
+压已启动的服务：
+
+    python -m bench.loadgen --url http://127.0.0.1:8000 --conversations 50
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from bench.stats import summarize
+
+
+SAMPLE_QUESTIONS = [
+    "这个月你主推的套餐",
+    "这些都太贵了，有便宜的吗",
+    "融合套餐包含宽带吗",
+    "定向流量怎么用",
+    "你说的那个是什么意思",
+    "怎么开电子发票",
+    "国际漫游怎么开通",
+    "哪个性价比最高",
+]
+
+
+class _Client:
+    """每个线程一条 keep-alive 连接。"""
+
+    def __init__(self, base_url: str, timeout: float) -> None:
+        u = urllib.parse.urlparse(base_url)
+        self._host = u.hostname or "127.0.0.1"
+        self._port = u.port or 80
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            self._local.conn = c
+        return c
+
+    def post(self, path: str, body: dict[str, Any]) -> tuple[int, bytes]:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        for attempt in range(2):
+            c = self._conn()
+            try:
+                c.request("POST", path, body=data, headers={"content-type": "application/json"})
+                resp = c.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, OSError):
+                c.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError("unreachable")
+
+
+def run_load(
+    base_url: str,
+    *,
+    conversations: int,
+    turns: int,
+    concurrency: int,
+    timeout: float,
+) -> dict[str, Any]:
+    client = _Client(base_url, timeout)
+    lat: dict[str, list[float]] = {"chat": [], "end": []}
+    errors: dict[str, int] = {"chat": 0, "end": 0}
+    lock = threading.Lock()
+
+    def record(kind: str, dt: float, ok: bool) -> None:
+        with lock:
+            if ok:
+                lat[kind].append(dt)
+            else:
+                errors[kind] += 1
+
+    def one_conversation(i: int) -> None:
+        rng = random.Random(i)
+        conversation_id = str(uuid.uuid4())
+        for t in range(turns):
+            body = {
+                "conversation_id": conversation_id,
+                "request_id": f"r{t + 1}",
+                "user_id": f"bench-user-{i % 97}",
+                "message": rng.choice(SAMPLE_QUESTIONS),
+            }
+            t0 = time.perf_counter()
+            try:
+                status, _ = client.post("/chat", body)
+                ok = status == 200
+            except Exception:
+                ok = False
+            record("chat", time.perf_counter() - t0, ok)
+
+        t0 = time.perf_counter()
+        try:
+            status, _ = client.post("/end", {"conversation_id": conversation_id})
+            ok = status == 200
+        except Exception:
+            ok = False
+        record("end", time.perf_counter() - t0, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one_conversation, range(conversations)))
+    elapsed = time.perf_counter() - started
+
+    total = len(lat["chat"]) + len(lat["end"])
+    return {
+        "elapsed_s": elapsed,
+        "rps": total / elapsed if elapsed > 0 else 0.0,
+        "chat": summarize(lat["chat"]),
+        "end": summarize(lat["end"]),
+        "errors": errors,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(base_url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    u = urllib.parse.urlparse(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+        try:
+            c = http.client.HTTPConnection(u.hostname, u.port, timeout=1)
+            c.request("GET", "/health")
+            if c.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError("fake app did not become healthy in time")
+
+
+def _spawn_fake_app(workers: int) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    cmd = [
+        sys.executable, "-m", "uvicorn", "bench.fake_app:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    proc = subprocess.Popen(cmd, env={**os.environ, "BENCH_WORKERS": str(workers)})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_healthy(base_url, proc)
+    except Exception:
+        proc.terminate()
+        raise
+    return proc, base_url
+
+
+def _print_row(label: str, r: dict[str, Any]) -> None:
+    c, e = r["chat"], r["end"]
+    print(
+        f"{label:>8} {r['rps']:>8.1f} "
+        f"{c['p50'] * 1000:>9.1f} {c['p95'] * 1000:>9.1f} {c['p99'] * 1000:>9.1f} "
+        f"{e['p50'] * 1000:>9.1f} {e['p99'] * 1000:>9.1f} "
+        f"{r['errors']['chat'] + r['errors']['end']:>7}"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="", help="压测已有服务；为空则用本地替身拉起 uvicorn")
+    ap.add_argument("--workers", default="1", help="逗号分隔的 uvicorn worker 数，如 1,2,4")
+    ap.add_argument("--conversations", type=int, default=100)
+    ap.add_argument("--turns", type=int, default=3, help="每个会话 /chat 轮数（之后调用一次 /end）")
+    ap.add_argument("--concurrency", type=int, default=32, help="同时进行的会话数")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--json", default="", help="可选：把结果写入该 JSON 文件")
+    args = ap.parse_args(argv)
+
+    results: dict[str, Any] = {}
+    print(f"{'workers':>8} {'rps':>8} {'chat_p50':>9} {'chat_p95':>9} {'chat_p99':>9} {'end_p50':>9} {'end_p99':>9} {'errors':>7}")
+    if args.url:
+        r = run_load(args.url, conversations=args.conversations, turns=args.turns,
+                     concurrency=args.concurrency, timeout=args.timeout)
+        results["external"] = r
+        _print_row("ext", r)
+    else:
+        worker_counts = [int(x) for x in args.workers.split(",") if x.strip()]
+        if max(worker_counts, default=1) > 1 and not os.getenv("BENCH_REDIS_URL"):
+            raise SystemExit("--workers > 1 needs BENCH_REDIS_URL: in-process fakeredis is not shared between workers")
+        for w in worker_counts:
+            proc, base_url = _spawn_fake_app(w)
+            try:
+                r = run_load(base_url, conversations=args.conversations, turns=args.turns,
+                             concurrency=args.concurrency, timeout=args.timeout)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+            results[str(w)] = r
+            _print_row(str(w), r)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import math
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近秩法分位数；values 为空时返回 0。"""
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = max(0, min(len(s) - 1, math.ceil(p / 100.0 * len(s)) - 1))
+    return s[k]
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    return {
+        "n": float(len(values)),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }